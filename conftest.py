@@ -0,0 +1,2 @@
+# test_ivrit_whisper.py is the batch transcription CLI (needs faster-whisper), not a test module
+collect_ignore = ["test_ivrit_whisper.py"]
@@ -0,0 +1,125 @@
+"""
+Mic -> voice enhancer -> ElevenLabs realtime STT, in one process.
+
+One capture stream only: the enhancer runs in the PortAudio input callback
+(exactly like live_voice_enhancer.py does for the speakers), and every
+enhanced block is handed to the asyncio sender through an in-process
+queue. Nothing goes back out through an audio device, so the STT service
+gets denoised audio without a second device round trip of latency.
+
+Usage:
+  python enhanced_stt_stream.py
+  python enhanced_stt_stream.py --hop 128 --params tune.json
+"""
+
+import argparse
+import asyncio
+import os
+
+import numpy as np
+import sounddevice as sd
+from elevenlabs import ElevenLabs
+
+import live_voice_enhancer as lve
+from realtime_stt_stream import (CHUNK_MS, SAMPLE_RATE, CaptureQueue, Pcm16Encoder, attach_handlers,
+                                 realtime_config, send_chunk)
+from vad import SpeechGate
+
+# =======================
+# CONFIG
+# =======================
+QUEUE_BLOCKS = 64   # enhanced blocks buffered for the sender (~2 s at 512 / 16 kHz)
+
+
+async def run(enhancer, local_vad=True):
+    if enhancer.channels != 1 or enhancer.sample_rate != SAMPLE_RATE:
+        raise ValueError(f"STT needs a mono enhancer at {SAMPLE_RATE} Hz")
+
+    elevenlabs = ElevenLabs()  # reads ELEVENLABS_API_KEY from env (SDK behavior)
+    connection = await elevenlabs.speech_to_text.realtime.connect(realtime_config())
+    attach_handlers(connection)
+
+    capture = CaptureQueue(asyncio.get_running_loop(), maxsize=QUEUE_BLOCKS)
+    out = np.zeros((enhancer.block_size, 1), dtype=np.float32)
+
+    def callback(indata, frames, time_info, status):
+        if status:
+            capture.status += 1
+        enhancer.process(indata, out)
+        capture.put_threadsafe(out[:, 0].copy())
+
+    gate = SpeechGate(SAMPLE_RATE) if local_vad else None
+    encoder = Pcm16Encoder(int(SAMPLE_RATE * CHUNK_MS / 1000.0))
+
+    latency_ms = 1000.0 * (enhancer.block_size + enhancer.latency_samples) / SAMPLE_RATE
+    print(f"Enhancer: block {enhancer.block_size}, ~{latency_ms:.1f} ms processing latency.")
+    print("Recording… speak for a few seconds. Press Ctrl+C to stop.\n")
+
+    try:
+        with sd.InputStream(samplerate=SAMPLE_RATE,
+                            channels=1,
+                            dtype="float32",
+                            blocksize=enhancer.block_size,
+                            callback=callback):
+            while True:
+                block = await capture.get()
+                if gate is not None:
+                    block = gate.process(block)
+                while len(block):
+                    block = block[encoder.write(block):]
+                    if encoder.full:
+                        await send_chunk(connection, encoder)
+                if gate is not None and gate.ended:
+                    # utterance over: send what is left of it and commit now
+                    await send_chunk(connection, encoder)
+                    await connection.commit()
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("\nStopping… committing final segment.")
+        try:
+            await send_chunk(connection, encoder)
+            await connection.commit()
+        except Exception:
+            pass
+
+    print(f"Enhancer {capture.report()}.")
+    if gate is not None and gate.samples_in:
+        print(f"Sent {gate.samples_out / SAMPLE_RATE:.1f} s of {gate.samples_in / SAMPLE_RATE:.1f} s enhanced "
+              f"({100.0 * gate.samples_out / gate.samples_in:.0f}%).")
+
+    # Give server a moment to flush final events
+    await asyncio.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enhanced mic audio straight into realtime STT.")
+    parser.add_argument("--hop", type=int,
+                        help="use the overlap-add STFT enhancer with this hop (= capture block size)")
+    parser.add_argument("--fft-size", type=int, default=lve.BLOCK_SIZE)
+    parser.add_argument("--params", help="JSON file of enhancer parameters; re-read whenever it changes")
+    parser.add_argument("--no-vad", action="store_true", help="send silence too (no local VAD)")
+    args = parser.parse_args()
+
+    if not os.environ.get("ELEVENLABS_API_KEY"):
+        raise RuntimeError("Set ELEVENLABS_API_KEY env var.")
+
+    if args.hop:
+        enhancer = lve.StftVoiceEnhancer(fft_size=args.fft_size, hop=args.hop)
+    else:
+        enhancer = lve.VoiceEnhancer()
+
+    control = None
+    if args.params:
+        control = lve.ParamControl([enhancer], path=args.params)
+        control.reload()
+        control.start()
+    try:
+        asyncio.run(run(enhancer, local_vad=not args.no_vad))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if control is not None:
+            control.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Benchmark for the live_voice_enhancer chain. No audio device needed.
+
+Feeds synthetic speech-like audio and/or a recorded WAV through
+VoiceEnhancer / StftVoiceEnhancer block by block, exactly as the
+sounddevice callback would, and reports per stage:
+
+- p50 / p99 / max time per block (microseconds)
+- share of the real-time budget (block duration) used at p99
+- peak temporary allocation per block (KiB, via tracemalloc)
+- memory blocks a stage leaves allocated per block (tracemalloc snapshot
+  count_diff: returned arrays, grown caches, leaks)
+
+plus the real-time factor (processing time / audio time) of the whole
+chain and of the batched offline path.
+
+Usage:
+  python enhancer_bench.py
+  python enhancer_bench.py --wav test.wav --block-sizes 256 512 1024 --bands 16 32 64
+  python enhancer_bench.py --hop 128 --fft-size 512 --json bench.json
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+import live_voice_enhancer as lve
+
+# =======================
+# CONFIG
+# =======================
+SYNTH_SECONDS = 10.0        # length of the synthetic test signal
+WARMUP_BLOCKS = 20          # not timed (FFT plan caches, first-touch pages)
+ALLOC_BLOCKS  = 50          # blocks traced for allocation stats
+
+# stage label -> enhancer method, in chain order; engines without a
+# method (e.g. no _overlap_add on the block engine) just skip it
+STAGES = [
+    ("gate/comp", "_dynamics"),
+    ("noise red.", "_denoise"),
+    ("eq", "_equalize"),
+    ("vocoder", "_vocode"),
+    ("vocoder", "_vocode_spectrum"),
+    ("ola", "_overlap_add"),
+    ("limiter", "_limit"),
+]
+
+
+# =======================
+# TEST SIGNALS
+# =======================
+def synthetic_speech(seconds=SYNTH_SECONDS, sample_rate=lve.SAMPLE_RATE, seed=0):
+    """
+    Voiced bursts (harmonic stack with a wobbling pitch) separated by pauses,
+    over a low noise floor. Exercises the gate, the noise tracker and every
+    vocoder band.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+
+    f0 = 140.0 + 25.0 * np.sin(2.0 * np.pi * 3.0 * t)
+    phase = 2.0 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 25))
+
+    # ~1.2 s talk / ~0.6 s pause syllable envelope
+    talk = (np.sin(2.0 * np.pi * t / 1.8) > -0.5).astype(np.float64)
+    talk = np.convolve(talk, np.hanning(801) / np.hanning(801).sum(), mode="same")
+
+    x = 0.1 * voiced * talk + 0.003 * rng.standard_normal(n)
+    return x.astype(np.float32)
+
+
+def load_wav(path):
+    """Whole WAV as mono float32 at lve.SAMPLE_RATE."""
+    parts = []
+    resampler = None
+    for chunk, rate in lve.read_wav_chunks(path, 1 << 16):
+        if rate != lve.SAMPLE_RATE and resampler is None:
+            resampler = lve.Resampler(rate, lve.SAMPLE_RATE)
+        parts.append(resampler.process(chunk) if resampler else chunk)
+    if resampler:
+        parts.append(resampler.flush())
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+# =======================
+# INSTRUMENTATION
+# =======================
+class StageTimer:
+    """
+    Wraps an enhancer's stage methods with per-call timers by shadowing them
+    with instance attributes; the class itself is untouched, so production
+    instances pay nothing.
+    """
+
+    def __init__(self, enhancer, num_blocks):
+        self.samples = {}
+        self.count = 0
+        self._labels = []
+        for label, name in STAGES:
+            if not hasattr(enhancer, name):
+                continue
+            if label not in self.samples:
+                self.samples[label] = np.zeros(num_blocks)
+                self._labels.append(label)
+            setattr(enhancer, name, self._wrap(getattr(enhancer, name), label))
+
+    def _wrap(self, fn, label):
+        clock = time.perf_counter_ns
+
+        def timed(*args):
+            t0 = clock()
+            result = fn(*args)
+            self.samples[label][self.count] += clock() - t0
+            return result
+
+        return timed
+
+    @property
+    def labels(self):
+        return list(self._labels)
+
+
+def time_blocks(enhancer, x):
+    """Run `x` block by block; return per-stage and total ns per block."""
+    block = enhancer.block_size
+    num_blocks = len(x) // block
+    frames = x[:num_blocks * block].reshape((num_blocks, block) + x.shape[1:])
+    out = np.zeros(frames.shape[1:], dtype=np.float32)
+
+    for k in range(min(WARMUP_BLOCKS, num_blocks)):
+        enhancer.process(frames[k], out)
+    enhancer.reset()
+
+    timer = StageTimer(enhancer, num_blocks)
+    total = np.zeros(num_blocks)
+    clock = time.perf_counter_ns
+    for k in range(num_blocks):
+        timer.count = k
+        t0 = clock()
+        enhancer.process(frames[k], out)
+        total[k] = clock() - t0
+
+    result = {label: timer.samples[label] for label in timer.labels}
+    result["total"] = total
+    return result
+
+
+def alloc_blocks(make_enhancer, x):
+    """
+    Peak temporary allocation (bytes) and memory blocks left allocated per
+    stage and per whole block, each the worst over ALLOC_BLOCKS blocks.
+    Returns ({label: bytes}, {label: blocks}). Whole blocks are traced on
+    an unwrapped enhancer, since the per-stage wrappers reset tracemalloc's
+    peak; block counts come from a third enhancer, as taking snapshots
+    allocates.
+    """
+    def peak_of(fn, *args):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn(*args)
+        return result, tracemalloc.get_traced_memory()[1] - base
+
+    def snapshot():
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    def blocks_of(fn, *args):
+        before = snapshot()
+        result = fn(*args)
+        diff = snapshot().compare_to(before, "lineno")
+        return result, sum(stat.count_diff for stat in diff if stat.count_diff > 0)
+
+    def traced(fn, label, measure, into):
+        def wrapper(*args):
+            result, amount = measure(fn, *args)
+            into[label] = max(into.get(label, 0), amount)
+            return result
+        return wrapper
+
+    enhancer = make_enhancer()
+    block = enhancer.block_size
+    num_blocks = min(len(x) // block, ALLOC_BLOCKS)
+    frames = x[:num_blocks * block].reshape((num_blocks, block) + x.shape[1:])
+    out = np.zeros(frames.shape[1:], dtype=np.float32)
+    peaks = {}
+    counts = {}
+
+    tracemalloc.start()
+    try:
+        total = 0
+        for k in range(num_blocks):
+            total = max(total, peak_of(enhancer.process, frames[k], out)[1])
+
+        enhancer = make_enhancer()
+        for label, name in STAGES:
+            if hasattr(enhancer, name):
+                setattr(enhancer, name, traced(getattr(enhancer, name), label, peak_of, peaks))
+        for k in range(num_blocks):
+            enhancer.process(frames[k], out)
+
+        # block counts skip the first block, which fills caches (FFT plans,
+        # the snapshot filter's compiled pattern)
+        enhancer = make_enhancer()
+        blocks_of(enhancer.process, frames[0], out)
+        total_blocks = 0
+        for k in range(1, num_blocks):
+            total_blocks = max(total_blocks, blocks_of(enhancer.process, frames[k], out)[1])
+        for label, name in STAGES:
+            if hasattr(enhancer, name):
+                setattr(enhancer, name, traced(getattr(enhancer, name), label, blocks_of, counts))
+        for k in range(1, num_blocks):
+            enhancer.process(frames[k], out)
+    finally:
+        tracemalloc.stop()
+    peaks["total"] = total
+    counts["total"] = total_blocks
+    return peaks, counts
+
+
+def time_offline(make_enhancer, x):
+    """Real-time factor of the batched offline path (enhance_array)."""
+    t0 = time.perf_counter()
+    lve.enhance_array(x, make_enhancer())
+    return (time.perf_counter() - t0) / (len(x) / lve.SAMPLE_RATE)
+
+
+# =======================
+# REPORT
+# =======================
+def summarize(times_ns, allocs, alloc_counts, block):
+    budget_us = 1e6 * block / lve.SAMPLE_RATE
+    rows = []
+    for label, ns in times_ns.items():
+        us = ns / 1000.0
+        p99 = float(np.percentile(us, 99))
+        rows.append({
+            "stage": label,
+            "p50_us": float(np.percentile(us, 50)),
+            "p99_us": p99,
+            "max_us": float(us.max()),
+            "budget_pct_p99": 100.0 * p99 / budget_us,
+            "alloc_kib": allocs.get(label, 0) / 1024.0,
+            "alloc_blocks": alloc_counts.get(label, 0),
+        })
+    return rows
+
+
+def print_table(title, rows, rtf, offline_rtf):
+    print(f"\n=== {title} ===")
+    print(f"{'stage':<12}{'p50 us':>10}{'p99 us':>10}{'max us':>10}{'p99 %budget':>13}{'alloc KiB':>11}"
+          f"{'blocks':>8}")
+    for r in rows:
+        print(f"{r['stage']:<12}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['max_us']:>10.1f}"
+              f"{r['budget_pct_p99']:>12.1f}%{r['alloc_kib']:>11.1f}{r['alloc_blocks']:>8d}")
+    print(f"real-time factor: {rtf:.4f} (callback path), {offline_rtf:.4f} (batched offline)")
+
+
+def run(x, source, block_sizes, band_counts, hop=None, fft_size=lve.BLOCK_SIZE, channels=1):
+    results = []
+    if channels > 1:
+        # same material on every mic, each channel shifted so blocks differ
+        x = np.stack([np.roll(x, 997 * c) for c in range(channels)], axis=1)
+    configs = [(hop, b) for b in band_counts] if hop else \
+              [(bs, b) for bs in block_sizes for b in band_counts]
+
+    for block, bands in configs:
+        if hop:
+            def make():
+                return lve.StftVoiceEnhancer(fft_size=fft_size, hop=hop, num_bands=bands,
+                                             channels=channels, seed=0)
+            title = f"{source}: STFT fft={fft_size} hop={hop} bands={bands} channels={channels}"
+        else:
+            def make():
+                return lve.VoiceEnhancer(block_size=block, num_bands=bands, channels=channels, seed=0)
+            title = f"{source}: block={block} bands={bands} channels={channels}"
+
+        times_ns = time_blocks(make(), x)
+        allocs, alloc_counts = alloc_blocks(make, x)
+        rows = summarize(times_ns, allocs, alloc_counts, block)
+        rtf = times_ns["total"].sum() / 1e9 / (len(times_ns["total"]) * block / lve.SAMPLE_RATE)
+        offline_rtf = time_offline(make, x)
+
+        print_table(title, rows, rtf, offline_rtf)
+        results.append({
+            "source": source,
+            "engine": "stft" if hop else "block",
+            "block_size": block,
+            "fft_size": fft_size if hop else block,
+            "num_bands": bands,
+            "channels": channels,
+            "stages": rows,
+            "rtf": rtf,
+            "offline_rtf": offline_rtf,
+        })
+    return results
+
+
+# =======================
+# MAIN
+# =======================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the voice enhancer chain offline.")
+    parser.add_argument("--wav", help="also benchmark on this recording (e.g. test.wav)")
+    parser.add_argument("--no-synth", action="store_true", help="skip the synthetic signal")
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--bands", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--hop", type=int, help="benchmark the STFT engine with this hop")
+    parser.add_argument("--fft-size", type=int, default=lve.BLOCK_SIZE)
+    parser.add_argument("--channels", type=int, default=1, help="mics processed side by side")
+    parser.add_argument("--json", help="write all results to this JSON file")
+    args = parser.parse_args()
+
+    sources = []
+    if not args.no_synth:
+        sources.append(("synthetic", synthetic_speech()))
+    if args.wav:
+        sources.append((args.wav, load_wav(args.wav)))
+    if not sources:
+        raise SystemExit("Nothing to benchmark (use --wav or drop --no-synth).")
+
+    results = []
+    for name, x in sources:
+        results += run(x, name, args.block_sizes, args.bands, args.hop, args.fft_size, args.channels)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import io
 import os
+import queue
+import shutil
 import threading
 import time
 import subprocess
+import wave
 from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, messagebox
@@ -11,6 +15,11 @@ import sounddevice as sd
 from elevenlabs.client import ElevenLabs
 from dotenv import load_dotenv
 
+from latency_trace import LatencyTrace
+from tts_cache import TtsCache, load_phrases
+from tts_playback import PCM_RATE, PcmPlayer
+from vad import trim_silence
+
 load_dotenv()
 # -------------------------
 # CONFIG
@@ -18,12 +27,24 @@ load_dotenv()
 SAMPLE_RATE = 16000
 CHANNELS = 1
 RECORD_SECONDS = 5
+TRIM_SILENCE = True  # upload (and save) only the speech found by vad.py
+TRACE_PATH = None    # e.g. "gui_latency.json" or ".csv": per-stage latency, rewritten after each request
+METRICS_PORT = None  # e.g. 9465: Prometheus text at http://127.0.0.1:PORT/metrics
+PIPELINED = True     # persistent stage workers (record → STT → TTS → playback overlap), TTS plays while downloading
+AUTO_SPEAK = False   # pipelined: speak each transcript as soon as it arrives, no second click
+PCM_PLAYBACK = True  # pipelined: request raw PCM and play it in this process (tts_playback.py) instead of ffplay
+TTS_CACHE = True     # repeated phrases come from tts_cache.py (memory + disk), no API call
+TTS_PREWARM = None   # e.g. "boost" (HebrewCorrector BOOST_WORDS) or a phrase file: cached in the background at startup
+PIPELINE_QUEUE = 2   # requests waiting per stage before a click is refused
+IN_MEMORY_UPLOAD = True    # build the WAV in a reused in-memory buffer and upload it, no disk round-trip
+ARCHIVE_RECORDINGS = True  # keep recordings/rec_*.wav (written in the background with IN_MEMORY_UPLOAD)
 
 STT_MODEL_ID = "scribe_v2"
 STT_LANGUAGE_CODE = "heb"  # or "he"
 
 # MP3 output (ElevenLabs supports these formats; mp3_44100_128 is default) :contentReference[oaicite:1]{index=1}
 TTS_OUTPUT_FORMAT = "mp3_44100_128"
+TTS_MODEL_ID = "eleven_v3"
 
 API_KEY = os.getenv("ELEVENLABS_API_KEY")
 if not API_KEY:
@@ -38,6 +59,13 @@ RECORDINGS_DIR.mkdir(exist_ok=True)
 TTS_DIR.mkdir(exist_ok=True)
 
 client = ElevenLabs(api_key=API_KEY)
+trace = LatencyTrace("gui")
+tts_cache = TtsCache() if TTS_CACHE else None
+
+
+def save_trace():
+    if TRACE_PATH:
+        trace.write(TRACE_PATH)
 
 
 # -------------------------
@@ -53,7 +81,6 @@ def record_audio(seconds: float) -> np.ndarray:
 
 
 def write_wav_pcm16(path: Path, audio_f32: np.ndarray):
-    import wave
     audio_i16 = np.clip(audio_f32, -1.0, 1.0)
     audio_i16 = (audio_i16 * 32767.0).astype(np.int16)
 
@@ -64,6 +91,64 @@ def write_wav_pcm16(path: Path, audio_f32: np.ndarray):
         wf.writeframes(audio_i16.tobytes())
 
 
+class WavBuffer:
+    """
+    PCM16 WAV container built in memory, reusing the same BytesIO and
+    sample buffers for every utterance. encode() returns the BytesIO,
+    which stays valid until the next call. Use one instance per uploading
+    thread.
+    """
+
+    def __init__(self):
+        self.buf = io.BytesIO()
+        self._scratch = np.zeros(0, dtype=np.float32)
+        self._pcm = np.zeros(0, dtype=np.int16)
+
+    def encode(self, audio_f32: np.ndarray) -> io.BytesIO:
+        n = len(audio_f32)
+        if len(self._pcm) < n:
+            self._scratch = np.empty(n, dtype=np.float32)
+            self._pcm = np.empty(n, dtype=np.int16)
+        scratch, pcm = self._scratch[:n], self._pcm[:n]
+        # same samples as write_wav_pcm16
+        np.clip(audio_f32, -1.0, 1.0, out=scratch)
+        np.multiply(scratch, 32767.0, out=pcm, casting="unsafe")
+
+        self.buf.seek(0)
+        self.buf.truncate()
+        with wave.open(self.buf, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(memoryview(pcm).cast("B"))
+        self.buf.seek(0)
+        return self.buf
+
+
+class Archiver:
+    """Writes recordings to disk on a background thread, off the request path."""
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def write(self, path: Path, audio_f32: np.ndarray):
+        self.jobs.put((path, audio_f32))
+
+    def _run(self):
+        while True:
+            path, audio = self.jobs.get()
+            try:
+                with trace.span("wav_archive"):
+                    write_wav_pcm16(path, audio)
+            except OSError as ex:
+                print(f"Could not save {path}: {ex}")
+
+
+archiver = Archiver()
+upload_wav = WavBuffer()    # click-per-thread mode (one request at a time)
+
+
 def autoplay_audio(path: Path):
     """
     Auto-play MP3 using ffplay if available, otherwise fall back to xdg-open.
@@ -83,18 +168,62 @@ def autoplay_audio(path: Path):
     subprocess.Popen(["xdg-open", str(path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
+class StreamPlayer:
+    """
+    Plays MP3 streams through ffplay reading stdin, one utterance after
+    another. The next ffplay is spawned while the current one plays, so
+    the first chunk of a new utterance goes to an already running process.
+    """
+
+    CMD = ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-i", "-"]
+
+    def __init__(self):
+        self.available = shutil.which("ffplay") is not None
+        self._standby = None
+
+    def _spawn(self):
+        return subprocess.Popen(self.CMD, stdin=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def prepare(self):
+        if self.available and self._standby is None:
+            self._standby = self._spawn()
+
+    def play(self, chunks, on_first_chunk=None):
+        """Feed `chunks` to ffplay as they arrive; returns when playback has finished."""
+        proc = self._standby or self._spawn()
+        self._standby = None
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+                proc.stdin.flush()
+                if on_first_chunk is not None:
+                    on_first_chunk()
+                    on_first_chunk = None
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.prepare()
+        proc.wait()
+
+
 # -------------------------
 # ElevenLabs calls
 # -------------------------
 def stt_transcribe_wav(wav_path: Path) -> str:
     with open(wav_path, "rb") as f:
-        transcription = client.speech_to_text.convert(
-            file=f,
-            model_id=STT_MODEL_ID,
-            language_code=STT_LANGUAGE_CODE,
-            diarize=False,
-            tag_audio_events=False,
-        )
+        return stt_transcribe_file(f)
+
+
+def stt_transcribe_file(file) -> str:
+    """`file`: an open binary file, or a (filename, file-like, content_type) tuple."""
+    transcription = client.speech_to_text.convert(
+        file=file,
+        model_id=STT_MODEL_ID,
+        language_code=STT_LANGUAGE_CODE,
+        diarize=False,
+        tag_audio_events=False,
+    )
     return transcription.text or ""
 
 
@@ -102,17 +231,248 @@ def tts_generate_mp3(text: str, voice_id: str) -> bytes:
     if not voice_id:
         raise ValueError("Missing Voice ID. Set ELEVENLABS_VOICE_ID or enter one in the UI.")
 
-    audio = client.text_to_speech.convert(
-        voice_id=voice_id,
-        text=text[::-1],
-        output_format="mp3_44100_128",
-        model_id="eleven_v3",
-    )
+    def generate():
+        audio = client.text_to_speech.convert(
+            voice_id=voice_id,
+            text=text[::-1],
+            output_format=TTS_OUTPUT_FORMAT,
+            model_id=TTS_MODEL_ID,
+        )
+
+        # SDK may return bytes OR an iterator of chunks
+        if isinstance(audio, (bytes, bytearray)):
+            return bytes(audio)
+        return b"".join(audio)
+
+    if tts_cache is None:
+        return generate()
+    return tts_cache.fetch(text[::-1], voice_id, TTS_MODEL_ID, TTS_OUTPUT_FORMAT, generate)
 
-    # SDK may return bytes OR an iterator of chunks
-    if isinstance(audio, (bytes, bytearray)):
-        return bytes(audio)
-    return b"".join(audio)
+
+def tts_stream_audio(text: str, voice_id: str, output_format: str = TTS_OUTPUT_FORMAT):
+    """Like tts_generate_mp3, but yields audio chunks as the response arrives (streaming endpoint)."""
+    if not voice_id:
+        raise ValueError("Missing Voice ID. Set ELEVENLABS_VOICE_ID or enter one in the UI.")
+
+    def generate():
+        audio = client.text_to_speech.stream(
+            voice_id=voice_id,
+            text=text[::-1],
+            output_format=output_format,
+            model_id=TTS_MODEL_ID,
+        )
+        if isinstance(audio, (bytes, bytearray)):
+            yield bytes(audio)
+            return
+        for chunk in audio:
+            if chunk:
+                yield chunk
+
+    if tts_cache is None:
+        yield from generate()
+    else:
+        yield from tts_cache.stream(text[::-1], voice_id, TTS_MODEL_ID, output_format, generate)
+
+
+def prewarm_tts_cache():
+    """Cache TTS_PREWARM phrases for the default voice in the format the speak button will request."""
+    if tts_cache is None or not TTS_PREWARM or not DEFAULT_VOICE_ID:
+        return
+    output_format = f"pcm_{PCM_RATE}" if PIPELINED and PCM_PLAYBACK else TTS_OUTPUT_FORMAT
+
+    def generate(text):
+        return client.text_to_speech.convert(voice_id=DEFAULT_VOICE_ID, text=text,
+                                             output_format=output_format, model_id=TTS_MODEL_ID)
+
+    try:
+        n = tts_cache.prewarm(load_phrases(TTS_PREWARM), DEFAULT_VOICE_ID, TTS_MODEL_ID, output_format, generate)
+        print(f"TTS cache: prewarmed {n} phrase(s).")
+    except Exception as ex:
+        print(f"TTS cache prewarm failed: {ex}")
+
+
+# -------------------------
+# Request stages (shared by the click-per-thread and pipelined modes)
+# -------------------------
+def capture_recording():
+    """
+    Record and trim one utterance, and save it (in the background with
+    IN_MEMORY_UPLOAD). Returns (audio, wav_path or None, recorded_at), or
+    None without speech.
+    """
+    with trace.span("record"):
+        audio = record_audio(RECORD_SECONDS)
+    recorded_at = trace.now()
+    if TRIM_SILENCE:
+        with trace.span("trim"):
+            audio = trim_silence(audio, SAMPLE_RATE)
+        if not len(audio):
+            return None
+    wav_path = None
+    if ARCHIVE_RECORDINGS or not IN_MEMORY_UPLOAD:
+        ts = time.strftime("%Y%m%d-%H%M%S")
+        wav_path = RECORDINGS_DIR / f"rec_{ts}.wav"
+    if IN_MEMORY_UPLOAD:
+        if wav_path is not None:
+            archiver.write(wav_path, audio)
+    else:
+        with trace.span("wav_write"):
+            write_wav_pcm16(wav_path, audio)
+    return audio, wav_path, recorded_at
+
+
+def transcribe_recording(recording, wav: WavBuffer) -> str:
+    """STT of a capture_recording() result; `wav` is the caller's upload buffer."""
+    audio, wav_path, recorded_at = recording
+    if IN_MEMORY_UPLOAD:
+        with trace.span("wav_encode"):
+            f = wav.encode(audio)
+        with trace.span("stt"):
+            text = stt_transcribe_file(("rec.wav", f, "audio/wav"))
+    else:
+        with trace.span("stt"):
+            text = stt_transcribe_wav(wav_path)
+    trace.since("record_to_text", recorded_at)
+    save_trace()
+    return text
+
+
+def saved_note(path) -> str:
+    return f" Saved: {path.name}" if path is not None else ""
+
+
+# -------------------------
+# Pipelined mode
+# -------------------------
+class Pipeline:
+    """
+    One persistent thread per stage, joined by bounded queues:
+
+      record -> stt -> tts (streaming download) -> playback
+
+    A stage starts on the next request as soon as it hands the current one
+    on, so a new recording can start while the last one is still being
+    transcribed or spoken. Playback gets the TTS chunks as they arrive.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.player = PcmPlayer(PCM_RATE) if PCM_PLAYBACK else StreamPlayer()
+        self.wav = WavBuffer()
+        self.records = queue.Queue(maxsize=PIPELINE_QUEUE)
+        self.recordings = queue.Queue(maxsize=PIPELINE_QUEUE)
+        self.speech = queue.Queue(maxsize=PIPELINE_QUEUE)
+        self.audio = queue.Queue(maxsize=64)       # TTS chunks (PCM or MP3); None ends an utterance
+        for stage in (self._recorder, self._transcriber, self._synthesizer, self._playback):
+            threading.Thread(target=self._run, args=(stage,), daemon=True).start()
+        self.player.prepare()
+
+    def _status(self, text):
+        self.app.after(0, lambda: self.app.status_var.set(text))
+
+    def _run(self, stage):
+        while True:
+            try:
+                stage()
+            except Exception as ex:
+                self.app.after(0, lambda m=str(ex): self.app.show_error(m))
+
+    def submit_record(self, voice_id):
+        """Tk thread only: `voice_id` is read from the entry here, for AUTO_SPEAK."""
+        try:
+            self.records.put_nowait((voice_id, trace.now()))
+        except queue.Full:
+            return False
+        return True
+
+    def submit_speak(self, text, voice_id):
+        try:
+            self.speech.put_nowait((text, voice_id, trace.now()))
+        except queue.Full:
+            return False
+        return True
+
+    # ----- stages -----
+    def _recorder(self):
+        voice_id, _ = self.records.get()
+        self._status("Recording...")
+        result = capture_recording()
+        if result is None:
+            self._status("No speech detected.")
+            return
+        self.recordings.put((result, voice_id))
+        self._status("Transcribing (ElevenLabs STT)...")
+
+    def _transcriber(self):
+        recording, voice_id = self.recordings.get()
+        text = transcribe_recording(recording, self.wav)
+        wav_path = recording[1]
+
+        def update_ui():
+            if not text.strip():
+                self.app.status_var.set(f"No text recognized.{saved_note(wav_path)}")
+                return
+            self.app.set_text(text)
+            self.app.set_busy(False, f"Done.{saved_note(wav_path)}")
+
+        self.app.after(0, update_ui)
+        if AUTO_SPEAK and text.strip():
+            # TTS takes the text as shown in the (reversed) text box
+            self.speech.put((text[::-1], voice_id, trace.now()))
+
+    def _synthesizer(self):
+        text, voice_id, clicked_at = self.speech.get()
+        self._status("Generating voice (ElevenLabs TTS)...")
+        chunks = []
+        t0 = trace.now()
+        try:
+            output_format = f"pcm_{PCM_RATE}" if PCM_PLAYBACK else TTS_OUTPUT_FORMAT
+            for chunk in tts_stream_audio(text, voice_id, output_format):
+                if not chunks:
+                    trace.since("tts_first_chunk", t0)
+                chunks.append(chunk)
+                if self.player.available:
+                    self.audio.put((clicked_at, chunk))
+        finally:
+            if self.player.available:
+                self.audio.put((clicked_at, None))
+        trace.since("tts", t0)
+        ts = time.strftime("%Y%m%d-%H%M%S")
+        if PCM_PLAYBACK:
+            audio_path = TTS_DIR / f"tts_{ts}.wav"
+            with trace.span("tts_wav_write"), wave.open(str(audio_path), "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(PCM_RATE)
+                wf.writeframes(b"".join(chunks))
+        else:
+            audio_path = TTS_DIR / f"tts_{ts}.mp3"
+            with trace.span("mp3_write"):
+                audio_path.write_bytes(b"".join(chunks))
+        if not self.player.available:
+            with trace.span("player_spawn"):
+                autoplay_audio(audio_path)
+            trace.since("click_to_playback", clicked_at)
+        save_trace()
+        self._status(f"Done. Saved: {audio_path.name}")
+
+    def _playback(self):
+        clicked_at, chunk = self.audio.get()
+
+        def chunks():
+            nonlocal chunk
+            while chunk is not None:
+                yield chunk
+                chunk = self.audio.get()[1]
+
+        def started():
+            trace.since("click_to_playback", clicked_at)
+            self._status("Playing audio...")
+
+        self.player.play(chunks(), on_first_chunk=started)
+        for _ in chunks():
+            pass    # player died early: drop the rest of this utterance
+        save_trace()
 
 
 # -------------------------
@@ -156,8 +516,15 @@ class App(tk.Tk):
         status.pack(fill="x")
         ttk.Label(status, textvariable=self.status_var).pack(side="left")
 
+        self.pipeline = Pipeline(self) if PIPELINED else None
+
     def set_busy(self, busy: bool, status: str):
         self.status_var.set(status)
+        if self.pipeline is not None:
+            # stages queue up requests; buttons stay usable
+            txt = self.text_box.get("1.0", "end").strip()
+            self.btn_speak.config(state="normal" if txt else "disabled")
+            return
         self.btn_record.config(state="disabled" if busy else "normal")
 
         if busy:
@@ -176,26 +543,36 @@ class App(tk.Tk):
         messagebox.showerror("Error", msg)
 
     def on_record_transcribe(self):
+        if self.pipeline is not None:
+            if not self.pipeline.submit_record(self.voice_entry.get().strip()):
+                self.status_var.set("Busy: recordings are queued, try again in a moment.")
+            return
+
         def worker():
             try:
                 self.after(0, lambda: self.set_busy(True, "Recording..."))
 
-                audio = record_audio(RECORD_SECONDS)
-                ts = time.strftime("%Y%m%d-%H%M%S")
-                wav_path = RECORDINGS_DIR / f"rec_{ts}.wav"
-                write_wav_pcm16(wav_path, audio)
+                recording = capture_recording()
+                if recording is None:
+                    def no_speech():
+                        self.set_text("")
+                        self.set_busy(False, "No speech detected.")
+                        messagebox.showinfo("No speech detected", "Nothing was said. Try again closer to the mic.")
+                    self.after(0, no_speech)
+                    return
+                wav_path = recording[1]
 
                 self.after(0, lambda: self.set_busy(True, "Transcribing (ElevenLabs STT)..."))
-                text = stt_transcribe_wav(wav_path)
+                text = transcribe_recording(recording, upload_wav)
 
                 def update_ui():
                     if not text.strip():
                         self.set_text("")
-                        self.set_busy(False, f"No text recognized. Saved: {wav_path.name}")
+                        self.set_busy(False, f"No text recognized.{saved_note(wav_path)}")
                         messagebox.showinfo("No speech detected", "No text was recognized. Try again closer to the mic.")
                         return
                     self.set_text(text)
-                    self.set_busy(False, f"Done. Saved: {wav_path.name}")
+                    self.set_busy(False, f"Done.{saved_note(wav_path)}")
 
                 self.after(0, update_ui)
 
@@ -215,17 +592,28 @@ class App(tk.Tk):
             messagebox.showerror("Missing Voice ID", "Set ELEVENLABS_VOICE_ID or paste a Voice ID into the field.")
             return
 
+        if self.pipeline is not None:
+            if not self.pipeline.submit_speak(text, voice_id):
+                self.status_var.set("Busy: speech is queued, try again in a moment.")
+            return
+
         def worker():
             try:
                 self.after(0, lambda: self.set_busy(True, "Generating voice (ElevenLabs TTS)..."))
 
-                mp3_bytes = tts_generate_mp3(text, voice_id)
+                clicked_at = trace.now()
+                with trace.span("tts"):
+                    mp3_bytes = tts_generate_mp3(text, voice_id)
                 ts = time.strftime("%Y%m%d-%H%M%S")
                 mp3_path = TTS_DIR / f"tts_{ts}.mp3"
-                mp3_path.write_bytes(mp3_bytes)
+                with trace.span("mp3_write"):
+                    mp3_path.write_bytes(mp3_bytes)
 
                 self.after(0, lambda: self.set_busy(True, "Playing audio..."))
-                autoplay_audio(mp3_path)
+                with trace.span("player_spawn"):
+                    autoplay_audio(mp3_path)
+                trace.since("click_to_playback", clicked_at)
+                save_trace()
 
                 self.after(0, lambda: self.set_busy(False, f"Done. Saved: {mp3_path.name}"))
 
@@ -236,5 +624,10 @@ class App(tk.Tk):
 
 
 if __name__ == "__main__":
+    if METRICS_PORT:
+        trace.serve_prometheus(METRICS_PORT)
+    threading.Thread(target=prewarm_tts_cache, daemon=True).start()
     App().mainloop()
+    if tts_cache is not None:
+        print(tts_cache.report())
 
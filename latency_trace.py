@@ -0,0 +1,248 @@
+"""
+Latency tracing for the STT pipelines: monotonic timestamps -> per-stage
+histograms, exported as JSON, CSV or a Prometheus text endpoint.
+
+- LatencyTrace   generic: observe(stage, seconds), span(stage), an event
+                 timeline, export / serve
+- SttTimeline    realtime STT stages on top of it: chunk capture -> send
+                 -> partial -> committed, per segment
+
+Stages recorded by realtime_stt_stream.py (all in ms):
+
+  queue          audio callback -> sender picked the block up
+  chunk_age      first sample of a chunk captured -> chunk handed to send()
+                 (mostly CHUNK_MS batching)
+  encode         base64 of one chunk
+  send           connection.send() of one chunk
+  first_partial  first audio of a segment captured -> first partial transcript
+  partial_lag    newest audio sent -> partial transcript arrived
+  finalize       last partial -> committed transcript (server VAD wait + correction)
+  commit         end of speech (local VAD or last audio) -> committed transcript
+  segment        first audio of a segment captured -> committed transcript
+
+With LOCAL_VAD, pre-roll that the SpeechGate releases with a later block
+keeps its own capture time, so chunk_age, first_partial and segment start
+at the onset's pre-roll, not at the block that released it.
+
+gui_stt_tts.py records its request stages: record, trim, wav_encode (or
+wav_write without IN_MEMORY_UPLOAD), wav_archive (background), stt,
+record_to_text, tts, tts_first_chunk (pipelined mode), mp3_write (or
+tts_wav_write with PCM_PLAYBACK), player_spawn, click_to_playback (first
+audio handed to the player).
+
+Usage:
+  trace = LatencyTrace("stt")
+  with trace.span("upload"):
+      ...
+  trace.write("latency.json")          # or .csv
+  trace.serve_prometheus(9464)         # GET http://127.0.0.1:9464/metrics
+"""
+
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# =======================
+# CONFIG
+# =======================
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 1500, 2500, 5000, 10000)   # histogram upper bounds
+MAX_SAMPLES = 4096      # raw samples kept per stage for exact percentiles
+MAX_EVENTS = 10000      # timeline entries kept (oldest dropped)
+
+
+class Histogram:
+    """Cumulative buckets over all observations plus the most recent raw samples."""
+
+    def __init__(self, buckets_ms=BUCKETS_MS):
+        self.bounds = np.asarray(buckets_ms, dtype=np.float64)
+        self.counts = np.zeros(len(self.bounds) + 1, dtype=np.int64)   # last = +Inf
+        self.samples = deque(maxlen=MAX_SAMPLES)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[np.searchsorted(self.bounds, ms)] += 1
+        self.samples.append(ms)
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def summary(self):
+        p50, p95, p99 = np.percentile(self.samples, [50, 95, 99]) if self.samples else (0.0, 0.0, 0.0)
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": self.max_ms,
+            "buckets": {("+Inf" if i == len(self.bounds) else f"{self.bounds[i]:g}"): int(c)
+                        for i, c in enumerate(np.cumsum(self.counts))},
+        }
+
+
+class LatencyTrace:
+    """Thread-safe stage histograms and event timeline; times are time.monotonic() seconds."""
+
+    def __init__(self, name="stt"):
+        self.name = name
+        self.stages = {}
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    now = staticmethod(time.monotonic)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            hist = self.stages.get(stage)
+            if hist is None:
+                hist = self.stages[stage] = Histogram()
+            hist.observe(1000.0 * seconds)
+
+    def since(self, stage, start):
+        """Observe now - `start`; returns now."""
+        t = self.now()
+        self.observe(stage, t - start)
+        return t
+
+    @contextmanager
+    def span(self, stage):
+        t0 = self.now()
+        try:
+            yield
+        finally:
+            self.since(stage, t0)
+
+    def event(self, kind, t=None, **info):
+        """Add a timestamped entry to the timeline (chunk sent, partial, committed, ...)."""
+        with self._lock:
+            self.events.append(dict(t=round((t if t is not None else self.now()) - self.started, 6),
+                                    kind=kind, **info))
+
+    # ----- export -----
+    def summary(self):
+        with self._lock:
+            return {stage: hist.summary() for stage, hist in self.stages.items()}
+
+    def write(self, path):
+        """JSON (summary + timeline) or, for a .csv path, one row per stage."""
+        summary = self.summary()
+        if str(path).endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["stage", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+                                + [f"le_{b:g}" for b in BUCKETS_MS] + ["le_inf"])
+                for stage, s in summary.items():
+                    writer.writerow([stage, s["count"]] + [f"{s[k]:.2f}" for k in
+                                    ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")]
+                                    + list(s["buckets"].values()))
+        else:
+            with self._lock:
+                events = list(self.events)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"name": self.name, "stages": summary, "events": events}, f,
+                          indent=2, ensure_ascii=False)
+
+    def prometheus_text(self):
+        metric = f"{self.name}_latency_seconds"
+        lines = [f"# HELP {metric} Pipeline stage latency.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            for stage, hist in self.stages.items():
+                cumulative = np.cumsum(hist.counts)
+                for bound, c in zip(list(hist.bounds / 1000.0) + ["+Inf"], cumulative):
+                    le = bound if isinstance(bound, str) else f"{bound:g}"
+                    lines.append(f'{metric}_bucket{{stage="{stage}",le="{le}"}} {c}')
+                lines.append(f'{metric}_sum{{stage="{stage}"}} {hist.total_ms / 1000.0:.6f}')
+                lines.append(f'{metric}_count{{stage="{stage}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port, host="127.0.0.1"):
+        """Serve /metrics from a daemon thread; returns the server (call shutdown() to stop)."""
+        trace = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = trace.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print(f"\n{'stage':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for stage, s in summary.items():
+            print(f"{stage:<14}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['max_ms']:>10.1f}")
+
+
+class SttTimeline:
+    """
+    Realtime STT stages for one connection. The caller reports when each
+    chunk is sent (with the capture time of its first and last sample),
+    when speech ends, and each partial / committed event.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.segment_start = None       # capture time of the segment's first sample
+        self.last_sent = None           # when the newest audio went out
+        self.last_partial = None
+        self.speech_end = None
+        self.partials = 0
+
+    def chunk_sent(self, first_captured, last_captured, nbytes=0, t=None):
+        t = t if t is not None else self.trace.now()
+        self.trace.observe("chunk_age", t - first_captured)
+        if self.segment_start is None:
+            self.segment_start = first_captured
+        self.last_sent = t
+        self.speech_end = None
+        self.trace.event("chunk", t, bytes=nbytes, age_ms=round(1000.0 * (t - last_captured), 2))
+
+    def end_of_speech(self, t=None):
+        self.speech_end = t if t is not None else self.trace.now()
+        self.trace.event("end_of_speech", self.speech_end)
+
+    def partial(self, text=""):
+        t = self.trace.now()
+        if self.segment_start is not None and self.partials == 0:
+            self.trace.observe("first_partial", t - self.segment_start)
+        if self.last_sent is not None:
+            self.trace.observe("partial_lag", t - self.last_sent)
+        self.partials += 1
+        self.last_partial = t
+        self.trace.event("partial", t, chars=len(text))
+
+    def committed(self, text=""):
+        t = self.trace.now()
+        if self.last_partial is not None:
+            self.trace.observe("finalize", t - self.last_partial)
+        end = self.speech_end if self.speech_end is not None else self.last_sent
+        if end is not None:
+            self.trace.observe("commit", t - end)
+        if self.segment_start is not None:
+            self.trace.observe("segment", t - self.segment_start)
+        self.trace.event("committed", t, chars=len(text), partials=self.partials)
+        self.segment_start = self.last_partial = self.speech_end = None
+        self.partials = 0
@@ -1,28 +1,62 @@
+import argparse
+import functools
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+import wave
+import zipfile
+from pathlib import Path
+from typing import NamedTuple
+
 import numpy as np
-import sounddevice as sd
+
+from ring_buffer import RingBuffer
+from vad import SpeechGate
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    sd = None  # offline file processing works without PortAudio
 
 # =======================
 # CONFIG
 # =======================
 SAMPLE_RATE = 16000       # Hz
 BLOCK_SIZE  = 512         # frames per block
-CHANNELS    = 1           # mono processing
+CHANNELS    = 1           # default channel count (one independent chain per channel)
+
+# ----- Level detector (gate + compressor) -----
+LEVEL_WINDOW_MS = 20.0    # per-sample RMS averaging time
 
 # ----- Compressor -----
 TARGET_RMS_DB   = -20.0   # desired loudness
 MAX_GAIN_DB     = 20.0    # max upward gain
-COMP_SMOOTHING  = 0.1     # gain smoothing (0..1)
+COMP_ATTACK_MS  = 10.0    # gain falls this fast when the voice gets louder
+COMP_RELEASE_MS = 300.0   # gain rises this fast when it gets quieter
 
 # ----- Smoothed Gate -----
 GATE_THRESHOLD_DB = -45.0  # level where gate starts acting
 GATE_RANGE_DB     = 10.0   # dB range over which gate fades in
 GATE_ATTENUATION  = 0.3    # minimum level when fully gated
-GATE_SMOOTHING    = 0.5    # smoothing of gate gain
+GATE_OPEN_MS      = 5.0    # gate opening time
+GATE_CLOSE_MS     = 80.0   # gate closing time
 
 # ----- Noise Reduction -----
-NOISE_UPDATE_THRESH_DB = -35.0  # frames below this treated as noise-only
-NOISE_UPDATE_ALPHA     = 0.1    # how quickly noise profile adapts (0..1)
+# per-bin MCRA tracker: noise follows the spectrum wherever the bin's
+# power is not well above its recent minimum, so it adapts during speech too
+NOISE_POWER_MS         = 50.0   # smoothing of |X|^2 before minimum tracking
+NOISE_MIN_WINDOW_S     = 1.5    # minimum-statistics search window
+NOISE_MIN_SUBWINDOWS   = 6      # history slots covering that window
+NOISE_SPEECH_RATIO     = 5.0    # power / minimum above this = speech in the bin
+NOISE_PRESENCE_MS      = 20.0   # smoothing of the per-bin speech probability
+NOISE_ADAPT_MS         = 200.0  # noise tracking speed where there is no speech
+NOISE_MIN_BIAS         = 3.0    # noise estimate never exceeds this x the minimum
 NOISE_OVEREST          = 1.0    # >1 = stronger suppression
+NR_DD_MS               = 500.0  # decision-directed a priori SNR memory (0.98 at 10 ms frames)
 NR_GAIN_FLOOR          = 0.15   # avoid complete nulling (musical noise)
 
 # ----- Spectral EQ -----
@@ -39,9 +73,26 @@ BAND_MIN_FREQ      = 200.0  # lower edge of first band
 BAND_MAX_FREQ      = 6000.0 # upper edge of last band
 ENV_ATTACK         = 0.3    # envelope attack smoothing
 ENV_RELEASE        = 0.05   # envelope release smoothing
+CARRIER_PHASE_ROWS = 64     # precomputed random-phase carrier spectra
 
 # ----- Limiter -----
-LIMITER_THRESHOLD  = 0.98
+LIMITER_THRESHOLD    = 0.98
+LIMITER_LOOKAHEAD_MS = 2.0     # gain starts falling this long before a peak (adds latency)
+LIMITER_RELEASE_DB_S = 100.0   # gain recovery rate after a peak, dB per second
+
+# ----- Table cache -----
+TABLE_CACHE_SIZE = 32                                  # in-memory LRU entries
+TABLE_CACHE_DIR  = os.getenv("ENHANCER_TABLE_CACHE")   # optional .npz directory
+
+# ----- Threaded mode (ring-buffered I/O) -----
+JITTER_BLOCKS = 2         # output look-ahead, in blocks (explicit added latency)
+RING_BLOCKS   = 32        # ring buffer capacity, in blocks
+
+# ----- Offline processing -----
+OFFLINE_CHUNK_BLOCKS = 1024   # blocks per batched FFT (~33 s @ 16 kHz)
+
+# ----- Gate / compressor scans -----
+SCAN_SEGMENT_MIN = 256    # shorter closed-form segments (sub-sample time constants) use the doubling scan
 
 # =======================
 # UTILS
@@ -49,192 +100,1511 @@ LIMITER_THRESHOLD  = 0.98
 def db_to_lin(db):
     return 10.0 ** (db / 20.0)
 
+
+def ms_to_coef(ms, sample_rate=SAMPLE_RATE):
+    """Per-sample one-pole coefficient for a time constant of `ms` (0 = instant)."""
+    return float(np.exp(-1000.0 / (ms * sample_rate))) if ms > 0 else 0.0
+
+
+def sample_coef(ms, sample_rate=SAMPLE_RATE):
+    """
+    ms_to_coef for the per-sample gate / compressor scans, floored at one
+    sample (a = 1/e): anything faster is inaudible and would only push
+    iir1 off its closed form onto the slower doubling scan.
+    """
+    return ms_to_coef(max(ms, 1000.0 / sample_rate), sample_rate)
+
+
+def scratch(work, name, shape, dtype=np.float64):
+    """
+    Work array `name` of `shape`: a view into a buffer kept in the dict
+    `work` (grown on demand, so a fixed block size allocates only once),
+    or a fresh array when `work` is None.
+    """
+    if work is None:
+        return np.empty(shape, dtype)
+    size = math.prod(shape)
+    buf = work.get(name)
+    if buf is None or buf.size < size or buf.dtype != dtype:
+        buf = work[name] = np.empty(size, dtype)
+    return buf[:size].reshape(shape)
+
+
+def iir1(x, a, y0, out=None, work=None):
+    """
+    First-order recursive smoother y[n] = a[n] * y[n-1] + (1 - a[n]) * x[n]
+    along axis 0, evaluated without a Python loop per step.
+
+    `a` (in [0, 1]) is a scalar or an array matching the leading axes of
+    `x` (e.g. per step, or per step and channel), `y0` the state before
+    x[0]. Uses the closed form y[n] = P[n] * (y0 + sum_k (1 - a[k]) x[k] / P[k])
+    with P the running product of `a`, restarted in segments so 1 / P
+    never overflows. Near-zero coefficients (an instant attack) would cut
+    those segments to a few steps; then every step is the affine map
+    y -> A * y + B, and log2(len(x)) doubling passes compose each step with
+    the 2**k before it, leaving y[n] = A[n] * y0 + B[n] with no division.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    a = np.asarray(a, dtype=np.float64)
+    n = len(x)
+    a = a.reshape(a.shape + (1,) * (x.ndim - a.ndim)) if a.ndim else a
+    shape_a = (n,) + (a.shape[1:] if a.ndim else (1,) * (x.ndim - 1))
+    if out is None:
+        out = np.empty_like(x)
+
+    A = scratch(work, "scan_a", shape_a)
+    B = scratch(work, "scan_b", x.shape)
+    np.copyto(A, a)
+    np.subtract(1.0, A, out=B)
+    np.multiply(B, x, out=B)
+    low = float(A.min()) if n else 1.0
+    seg = n if low >= 1.0 else int(300.0 / -math.log(low)) if low > 0.0 else 0
+
+    if seg >= min(n, SCAN_SEGMENT_MIN):
+        state = y0
+        np.log(A, out=A)
+        for start in range(0, n, max(seg, 1)):
+            p, acc = A[start:start + seg], B[start:start + seg]
+            np.cumsum(p, axis=0, out=p)
+            np.exp(p, out=p)
+            np.divide(acc, p, out=acc)
+            np.cumsum(acc, axis=0, out=acc)
+            acc += state
+            y = out[start:start + seg]
+            np.multiply(p, acc, out=y)
+            state = y[-1]
+        return out
+
+    A2 = scratch(work, "scan_a2", shape_a)
+    B2 = scratch(work, "scan_b2", x.shape)
+    d = 1
+    while d < n:
+        # steps before d are final; [d/2, d) were finished by the last pass
+        np.multiply(A[d:], B[:-d], out=B2[d:])
+        np.add(B2[d:], B[d:], out=B2[d:])
+        B2[d >> 1:d] = B[d >> 1:d]
+        np.multiply(A[d:], A[:-d], out=A2[d:])
+        A2[d >> 1:d] = A[d >> 1:d]
+        A, A2, B, B2 = A2, A, B2, B
+        d *= 2
+    np.multiply(A, y0, out=out)
+    out += B
+    return out
+
+
+def follow(target, a_fall, a_rise, y0, chunk=1024, max_passes=8, out=None, work=None):
+    """
+    Attack/release smoother y[n] = a[n] * y[n-1] + (1 - a[n]) * target[n]
+    along axis 0, with a[n] = a_fall where target[n] < y[n-1] and a_rise
+    elsewhere.
+
+    The choice of a[n] depends on y itself, so each `chunk` is solved as a
+    fixed point of linear iir1 passes: guess every choice from the chunk's
+    start state, run, re-decide from the result and rerun from the first
+    sample whose choice changed. Each pass settles at least one more
+    choice (gain curves from a smoothed level settle in 1-3 passes);
+    `max_passes` bounds the worst case, leaving the tail slightly off.
+    """
+    target = np.asarray(target, dtype=np.float64)
+    y = np.empty_like(target) if out is None else out
+    prev = np.asarray(y0, dtype=np.float64)
+    for c0 in range(0, len(target), chunk):
+        t = target[c0:c0 + chunk]
+        o = y[c0:c0 + chunk]
+        falling = scratch(work, "follow_falling", t.shape, bool)
+        a = scratch(work, "follow_a", t.shape)
+        flips = scratch(work, "follow_flips", t.shape, bool)
+        rows = scratch(work, "follow_rows", t.shape[:1], bool)
+        np.less(t, prev, out=falling)
+        start, state = 0, prev
+        for _ in range(max_passes):
+            np.copyto(a[start:], a_rise)
+            np.copyto(a[start:], a_fall, where=falling[start:])
+            iir1(t[start:], a[start:], state, out=o[start:], work=work)
+            # choices that disagree with the result (only rows >= start + 1 can)
+            f = flips[start + 1:]
+            np.less(t[start + 1:], o[start:-1], out=f)
+            np.not_equal(f, falling[start + 1:], out=f)
+            changed = np.any(f, axis=tuple(range(1, t.ndim)), out=rows[start + 1:]) if t.ndim > 1 else f
+            if not changed.any():
+                break
+            m = start + 1 + int(changed.argmax())
+            np.logical_xor(falling[m:], f[m - start - 1:], out=falling[m:])
+            start, state = m, o[m - 1]    # o[m - 1] is not rewritten by the next pass
+        prev = o[-1]
+    return y
+
+# =======================
+# TUNABLE PARAMETERS
+# =======================
+class EnhancerParams(NamedTuple):
+    """
+    One immutable snapshot of every tuning knob (the CONFIG constants,
+    lowercased). Enhancers read a whole snapshot per block, so a retune
+    published from another thread is never seen half-applied.
+    """
+    level_window_ms: float
+    target_rms_db: float
+    max_gain_db: float
+    comp_attack_ms: float
+    comp_release_ms: float
+    gate_threshold_db: float
+    gate_range_db: float
+    gate_attenuation: float
+    gate_open_ms: float
+    gate_close_ms: float
+    noise_power_ms: float
+    noise_speech_ratio: float
+    noise_presence_ms: float
+    noise_adapt_ms: float
+    noise_min_bias: float
+    noise_overest: float
+    nr_dd_ms: float
+    nr_gain_floor: float
+    hpf_cutoff_hz: float
+    presence_band: tuple
+    presence_gain_db: float
+    hf_shelf_hz: float
+    hf_shelf_gain_db: float
+    vocoder_mix: float
+    band_min_freq: float
+    band_max_freq: float
+    env_attack: float
+    env_release: float
+    limiter_threshold: float
+    limiter_release_db_s: float
+
+    @classmethod
+    def from_config(cls):
+        """Snapshot of the module-level CONFIG constants as they are now."""
+        g = globals()
+        return cls(**{name: g[name.upper()] for name in cls._fields})
+
+    def table_settings(self):
+        """The fields the EQ / band tables depend on (see TABLE_FIELDS)."""
+        return tuple(tuple(float(f) for f in v) if isinstance(v, tuple) else float(v)
+                     for v in (getattr(self, name) for name in TABLE_FIELDS))
+
+    def updated(self, changes, sample_rate=SAMPLE_RATE):
+        """
+        Copy with `changes` applied. Keys are field or CONFIG names
+        (case-insensitive); values may be strings, e.g. from a control file
+        or "presence_band=1800,3500" on stdin. Raises ValueError on unknown
+        names or bad values, including any the audio path cannot run with
+        (see check()).
+        """
+        fields = {}
+        for key, value in changes.items():
+            name = str(key).strip().lower()
+            if name not in self._fields:
+                raise ValueError(f"unknown parameter: {key}")
+            if name == "presence_band":
+                if isinstance(value, str):
+                    value = value.split(",")
+                value = tuple(float(f) for f in value)
+                if len(value) != 2 or not value[0] < value[1]:
+                    raise ValueError(f"presence_band needs two increasing frequencies, got {value}")
+            else:
+                value = float(value)
+            fields[name] = value
+        new = self._replace(**fields)
+        new.check(sample_rate)
+        return new
+
+    def check(self, sample_rate=SAMPLE_RATE):
+        """
+        Raise ValueError unless every value is finite and in range: a zero
+        gate range divides by zero in the callback, and a NaN mix turns
+        every later block into NaN.
+        """
+        for name in self._fields:
+            value = getattr(self, name)
+            if not all(math.isfinite(v) for v in (value if isinstance(value, tuple) else (value,))):
+                raise ValueError(f"{name} must be finite, got {value}")
+            if name.endswith("_ms") and value < 0.0:
+                raise ValueError(f"{name} must be >= 0, got {value}")
+        for name in ("vocoder_mix", "gate_attenuation", "nr_gain_floor", "env_attack", "env_release"):
+            if not 0.0 <= getattr(self, name) <= 1.0:
+                raise ValueError(f"{name} must be between 0 and 1, got {getattr(self, name)}")
+        for name in ("gate_range_db", "limiter_threshold"):
+            if getattr(self, name) <= 0.0:
+                raise ValueError(f"{name} must be > 0, got {getattr(self, name)}")
+        nyquist = sample_rate / 2.0
+        for name, value in (("band_min_freq", self.band_min_freq), ("band_max_freq", self.band_max_freq),
+                            ("presence_band", self.presence_band[0]), ("presence_band", self.presence_band[1])):
+            if not 0.0 < value < nyquist:
+                raise ValueError(f"{name} must be between 0 and {nyquist:g} Hz, got {value}")
+        if not self.band_min_freq < self.band_max_freq:
+            raise ValueError(f"band_min_freq must be below band_max_freq, got "
+                             f"{self.band_min_freq} >= {self.band_max_freq}")
+
+
+# fields baked into the cached EQ / band tables; changing any other field
+# needs no table work at all
+TABLE_FIELDS = ("hpf_cutoff_hz", "presence_band", "presence_gain_db",
+                "hf_shelf_hz", "hf_shelf_gain_db", "band_min_freq", "band_max_freq")
+
 # =======================
 # FREQUENCY GRID & EQ CURVE
 # =======================
+def make_eq_curve(freqs, sample_rate=SAMPLE_RATE, params=None):
+    """Linear EQ gain per rfft bin (HPF, presence boost, HF shelf)."""
+    params = params or EnhancerParams.from_config()
+    # 1) High-pass
+    eq_curve_db = np.where(freqs < params.hpf_cutoff_hz, -20.0, 0.0)
+
+    # 2) Presence boost (triangle over params.presence_band)
+    f1, f2 = params.presence_band
+    center = 0.5 * (f1 + f2)
+    width = (f2 - f1) * 0.5
+    dist = np.abs(freqs - center)
+    in_band = (freqs >= f1) & (freqs <= f2) & (dist < width)
+    eq_curve_db += np.where(in_band, params.presence_gain_db * (1.0 - dist / width), 0.0)
+
+    # 3) HF shelf (linear ramp up to Nyquist)
+    nyquist = sample_rate / 2.0
+    t = np.clip((freqs - params.hf_shelf_hz) / (nyquist - params.hf_shelf_hz + 1e-12), 0.0, 1.0)
+    eq_curve_db += np.where(freqs > params.hf_shelf_hz, params.hf_shelf_gain_db * t, 0.0)
+
+    return db_to_lin(eq_curve_db)
+
+
+# =======================
+# CHANNEL VOCODER BANDS
+# =======================
+def make_band_layout(freqs, num_bands=NUM_BANDS, params=None):
+    """
+    Log-spaced vocoder bands as two tables:
+      band_of_bin  band number of every rfft bin (num_bands = in no band)
+      band_avg     (num_bands, bins) matrix; band_avg @ mag = mean |X| per band
+    """
+    params = params or EnhancerParams.from_config()
+    band_edges = np.geomspace(params.band_min_freq, params.band_max_freq, num_bands + 1)
+    band_of_bin = np.searchsorted(band_edges, freqs, side="right") - 1
+    band_of_bin[(band_of_bin < 0) | (band_of_bin >= num_bands)] = num_bands
+
+    members = band_of_bin[None, :] == np.arange(num_bands)[:, None]
+    counts = members.sum(axis=1, keepdims=True)
+    band_avg = members / np.maximum(counts, 1)
+    return band_of_bin, band_avg
+
+
+# =======================
+# TABLE CACHE
+# =======================
+class EnhancerTables(NamedTuple):
+    """Read-only per-bin tables shared by every enhancer with the same key."""
+    freqs: np.ndarray         # rfft bin centre frequencies
+    eq_curve: np.ndarray      # linear EQ gain per bin
+    eq_ri: np.ndarray         # eq_curve repeated for (re, im) views
+    band_of_bin: np.ndarray   # vocoder band per bin (num_bands = none)
+    band_avg_t: np.ndarray    # (bins, bands) band-averaging matrix
+
+
+def table_key(fft_size, sample_rate=SAMPLE_RATE, num_bands=NUM_BANDS, params=None):
+    """Everything the tables depend on, including the EQ/band settings."""
+    params = params or EnhancerParams.from_config()
+    return (int(sample_rate), int(fft_size), int(num_bands)) + params.table_settings()
+
+
+def get_tables(fft_size, sample_rate=SAMPLE_RATE, num_bands=NUM_BANDS, params=None):
+    """
+    Tables for `params` (default: the module settings): an LRU lookup after
+    the first call, then the optional on-disk cache (TABLE_CACHE_DIR), then
+    a build.
+    """
+    return _cached_tables(table_key(fft_size, sample_rate, num_bands, params))
+
+
+@functools.lru_cache(maxsize=TABLE_CACHE_SIZE)
+def _cached_tables(key):
+    sample_rate, fft_size, num_bands = key[:3]
+    path = None
+    if TABLE_CACHE_DIR:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        path = Path(TABLE_CACHE_DIR) / f"enhancer_tables_{digest}.npz"
+
+    tables = None
+    if path is not None and path.exists():
+        try:
+            with np.load(path) as data:
+                tables = EnhancerTables(**{name: data[name] for name in EnhancerTables._fields})
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            tables = None   # unreadable / stale / truncated file: drop it, rebuild below
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    if tables is None:
+        params = EnhancerParams.from_config()._replace(**dict(zip(TABLE_FIELDS, key[3:])))
+        freqs = np.fft.rfftfreq(fft_size, d=1.0 / sample_rate)
+        eq_curve = make_eq_curve(freqs, sample_rate, params)
+        band_of_bin, band_avg = make_band_layout(freqs, num_bands, params)
+        tables = EnhancerTables(
+            freqs=freqs,
+            eq_curve=eq_curve,
+            eq_ri=np.repeat(eq_curve[:, None], 2, axis=1),
+            band_of_bin=band_of_bin,
+            band_avg_t=np.ascontiguousarray(band_avg.T),
+        )
+        if path is not None:
+            # written aside and renamed, so a crash or a second process never sees half a file
+            tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp, "wb") as f:
+                    np.savez(f, **tables._asdict())
+                os.replace(tmp, path)
+            except OSError:
+                try:
+                    tmp.unlink()
+                except OSError:
+                    pass   # cache is best effort
+
+    for table in tables:
+        table.flags.writeable = False
+    return tables
+
+
 freqs = np.fft.rfftfreq(BLOCK_SIZE, d=1.0 / SAMPLE_RATE)
+EQ_CURVE_LIN = get_tables(BLOCK_SIZE).eq_curve
+BAND_OF_BIN = get_tables(BLOCK_SIZE).band_of_bin
+
+# =======================
+# FFT HELPERS
+# =======================
+# NumPy >= 2.0 can write FFT results into a preallocated array; older
+# versions fall back to a copy.
+try:
+    np.fft.rfft(np.zeros(4), out=np.empty(3, dtype=np.complex128))
+    _FFT_HAS_OUT = True
+except TypeError:
+    _FFT_HAS_OUT = False
 
-# Build EQ curve in dB
-eq_curve_db = np.zeros_like(freqs)
 
-# 1) High-pass
-eq_curve_db[freqs < HPF_CUTOFF_HZ] -= 20.0
+def rfft_into(x, out):
+    if _FFT_HAS_OUT:
+        return np.fft.rfft(x, out=out)
+    out[...] = np.fft.rfft(x)
+    return out
 
-# 2) Presence boost
-f1, f2 = PRESENCE_BAND
-for i, f in enumerate(freqs):
-    if f1 <= f <= f2:
-        center = 0.5 * (f1 + f2)
-        width  = (f2 - f1) * 0.5
-        dist   = abs(f - center)
-        if dist < width:
-            eq_curve_db[i] += PRESENCE_GAIN_DB * (1.0 - dist / width)
 
-# 3) HF shelf
-nyquist = SAMPLE_RATE / 2.0
-for i, f in enumerate(freqs):
-    if f > HF_SHELF_HZ:
-        t = (f - HF_SHELF_HZ) / (nyquist - HF_SHELF_HZ + 1e-12)
-        t = np.clip(t, 0.0, 1.0)
-        eq_curve_db[i] += HF_SHELF_GAIN_DB * t
+def irfft_into(X, n, out):
+    if _FFT_HAS_OUT:
+        return np.fft.irfft(X, n=n, out=out)
+    out[...] = np.fft.irfft(X, n=n)
+    return out
 
-EQ_CURVE_LIN = db_to_lin(eq_curve_db)
 
 # =======================
-# CHANNEL VOCODER BANDS
+# LOOK-AHEAD LIMITER
 # =======================
-# Log-spaced band edges
-band_edges = np.geomspace(BAND_MIN_FREQ, BAND_MAX_FREQ, NUM_BANDS + 1)
-band_indices = []
-for b in range(NUM_BANDS):
-    low = band_edges[b]
-    high = band_edges[b + 1]
-    mask = (freqs >= low) & (freqs < high)
-    band_indices.append(np.where(mask)[0])
+class LookaheadLimiter:
+    """
+    Sample-accurate peak limiter with `lookahead` samples of delay.
+
+    Per sample, the gain needed to keep |y| <= threshold is turned into a
+    gain curve that never exceeds it where it matters:
+      1) sliding minimum over lookahead + 1 samples (van Herk / Gil-Werman,
+         ~3 ops per sample whatever the window), so the gain is already down
+         when the delayed peak comes out;
+      2) release at a fixed dB-per-second rate: in log gain that is a
+         running minimum of (g[k] - k * rate), one np.minimum.accumulate;
+      3) box average over lookahead + 1 samples, so the gain ramps down
+         smoothly instead of stepping.
+    Every step is vectorized over (channels, samples) and state carries
+    over between calls, so blocks of any length (one stream block or a
+    whole offline batch) give the same output.
+    """
+
+    def __init__(self, channels, lookahead, sample_rate=SAMPLE_RATE, block_size=None):
+        self.channels = channels
+        self.lookahead = int(lookahead)
+        self.sample_rate = sample_rate
+        self._n = None
+        if block_size:
+            self._buffers(block_size)   # preallocate for the stream block size
+        self.reset()
+
+    def reset(self):
+        c, L = self.channels, self.lookahead
+        self._g_hist = np.zeros((c, L))      # log target gain of the last L samples
+        self._rel = np.zeros(c)              # log released gain at the last sample
+        self._r_hist = np.ones((c, L))       # released gain of the last L samples
+        self._y_hist = np.zeros((c, L))      # delay line
+
+    def _buffers(self, n):
+        """(Re)size the work buffers for `n`-sample calls."""
+        if n == self._n:
+            return
+        c, L = self.channels, self.lookahead
+        w = L + 1
+        padded = -(-(L + n) // w) * w
+        self._n = n
+        self._ext = np.empty((c, L + n))
+        self._pre = np.full((c, padded), np.inf)
+        self._suf = np.full((c, padded), np.inf)
+        self._h = np.empty((c, n))
+        self._cs = np.empty((c, L + n))
+        self._ramp = np.arange(1, n + 1, dtype=np.float64)
+        self._ramp_c = np.empty(n)
+
+    def _sliding_min(self, x, out):
+        """out[:, i] = min(x[:, i:i + L + 1]) for x of shape (c, L + n)."""
+        w = self.lookahead + 1
+        m = x.shape[1]
+        pre, suf = self._pre, self._suf
+        pre[:, :m] = x
+        pre[:, m:] = np.inf
+        seg = pre.reshape(len(pre), -1, w)
+        np.minimum.accumulate(seg, axis=2, out=seg)                  # prefix min per segment
+        suf[:, :m] = x
+        suf[:, m:] = np.inf
+        seg = suf.reshape(len(suf), -1, w)[:, :, ::-1]
+        np.minimum.accumulate(seg, axis=2, out=seg)                  # suffix min per segment
+        return np.minimum(suf[:, :out.shape[1]], pre[:, w - 1:w - 1 + out.shape[1]], out=out)
+
+    def process(self, y, threshold, release_db_s):
+        """Limit (channels, n) `y` in place; the result is delayed by `lookahead`."""
+        L = self.lookahead
+        n = y.shape[1]
+        self._buffers(n)
+        ext, h = self._ext, self._h
+
+        # 1) log target gain min(0, log(threshold / |y|)), look-ahead minimum
+        ext[:, :L] = self._g_hist
+        g = np.abs(y, out=ext[:, L:])
+        g += 1e-12
+        np.log(g, out=g)
+        np.subtract(np.log(threshold), g, out=g)
+        np.minimum(g, 0.0, out=g)
+        self._g_hist[:] = ext[:, n:]
+        self._sliding_min(ext, h)
+
+        # 2) release: r[k] = min(h[k], r[k-1] + rate) as a running minimum
+        rate = release_db_s * np.log(10.0) / 20.0 / self.sample_rate
+        ramp = np.multiply(self._ramp, rate, out=self._ramp_c)
+        h -= ramp
+        np.minimum(h[:, 0], self._rel, out=h[:, 0])
+        np.minimum.accumulate(h, axis=1, out=h)
+        h += ramp
+        self._rel[:] = h[:, -1]
+
+        # 3) box average over L + 1 samples of the released gain
+        ext[:, :L] = self._r_hist
+        np.exp(h, out=ext[:, L:])
+        self._r_hist[:] = ext[:, n:]
+        cs = np.cumsum(ext, axis=1, out=self._cs)
+        np.copyto(h, cs[:, L:])
+        h[:, 1:] -= cs[:, :n - 1]
+        h /= L + 1
+
+        # delay the signal by L and apply the gain
+        ext[:, :L] = self._y_hist
+        ext[:, L:] = y
+        self._y_hist[:] = ext[:, n:]
+        np.multiply(ext[:, :n], h, out=y)
+        return y
+
 
 # =======================
-# STATE
+# NOISE TRACKER (MCRA)
 # =======================
-previous_gain_lin = 1.0             # compressor
-previous_gate_gain = 1.0            # smoothed gate
-noise_est_mag = np.ones_like(freqs) * 1e-4  # initial noise profile
-band_env = np.ones(NUM_BANDS) * 1e-3        # vocoder envelopes
+class NoiseTracker:
+    """
+    Per-bin noise power tracker (MCRA: minima-controlled recursive
+    averaging) and decision-directed Wiener gain, one spectral frame at a
+    time for a (channels, bins) power array.
+
+    Each bin's smoothed power is compared with its minimum over the last
+    NOISE_MIN_WINDOW_S (minimum statistics, kept as a ring of sub-window
+    minima). Where power stays near that minimum the bin is taken as noise
+    and the estimate follows it; where it is NOISE_SPEECH_RATIO above, the
+    estimate holds. So the noise profile keeps adapting between words,
+    and in bins without speech, during long talk segments. All buffers
+    are preallocated; time constants are in ms of audio at `frame_rate`.
+    """
+
+    def __init__(self, shape, frame_rate, window_s=NOISE_MIN_WINDOW_S, subwindows=NOISE_MIN_SUBWINDOWS):
+        self.frame_rate = frame_rate
+        self.sub_frames = max(1, round(window_s * frame_rate / subwindows))
+        self._hist = np.empty((subwindows,) + tuple(shape))   # completed sub-window minima
+        self._cur_min = np.empty(shape)    # running minimum of the current sub-window
+        self._min = np.empty(shape)
+        self._power = np.empty(shape)      # smoothed |X|^2
+        self._presence = np.empty(shape)   # speech presence probability
+        self.noise = np.empty(shape)       # noise power estimate
+        self._clean = np.empty(shape)      # previous frame's clean power (for DD)
+        self._tmp = np.empty(shape)
+        self._tmp2 = np.empty(shape)
+        self._speech = np.empty(shape, dtype=bool)
+        self.reset()
+
+    def reset(self):
+        self._hist.fill(np.inf)
+        self._cur_min.fill(np.inf)
+        self._power.fill(1e-8)
+        self._presence.fill(0.0)
+        self.noise.fill(1e-8)
+        self._clean.fill(0.0)
+        self._count = 0
+        self._slot = 0
+
+    def update(self, power, p):
+        """Feed one frame of |X|^2; returns the updated noise power."""
+        rate = self.frame_rate
+
+        # smoothed power and its minimum over the search window
+        a = ms_to_coef(p.noise_power_ms, rate)
+        S = self._power
+        S *= a
+        S += np.multiply(power, 1.0 - a, out=self._tmp)
+        np.minimum(self._cur_min, S, out=self._cur_min)
+        self._count += 1
+        if self._count >= self.sub_frames:
+            self._hist[self._slot] = self._cur_min
+            self._slot = (self._slot + 1) % len(self._hist)
+            self._cur_min.fill(np.inf)
+            self._count = 0
+        smin = np.min(self._hist, axis=0, out=self._min)
+        np.minimum(smin, self._cur_min, out=smin)
+        np.minimum(smin, S, out=smin)
+
+        # speech presence: smoothed indicator of power well above the minimum
+        speech = np.greater(S, np.multiply(smin, p.noise_speech_ratio, out=self._tmp2), out=self._speech)
+        a = ms_to_coef(p.noise_presence_ms, rate)
+        prob = self._presence
+        prob *= a
+        prob += np.multiply(speech, 1.0 - a, out=self._tmp)
+
+        # noise follows |X|^2 at NOISE_ADAPT_MS, slowed down where speech is likely
+        a = ms_to_coef(p.noise_adapt_ms, rate)
+        step = np.multiply(prob, a - 1.0, out=self._tmp2)
+        step += 1.0 - a                                  # (1 - a) * (1 - prob)
+        diff = np.subtract(power, self.noise, out=self._tmp)
+        diff *= step
+        self.noise += diff
+
+        # speech onsets leak in before the presence estimate catches up;
+        # the window minimum bounds how far that can drift
+        smin *= p.noise_min_bias
+        np.minimum(self.noise, smin, out=self.noise)
+        return self.noise
+
+    def gain(self, power, p, out):
+        """Decision-directed Wiener gain for this frame into `out`."""
+        noise = np.multiply(self.noise, p.noise_overest, out=self._tmp2)
+        noise += 1e-12
+
+        # a priori SNR: previous clean estimate blended with this frame's
+        # a posteriori SNR - 1
+        gamma = np.divide(power, noise, out=self._tmp)
+        gamma -= 1.0
+        np.maximum(gamma, 0.0, out=gamma)
+        alpha = ms_to_coef(p.nr_dd_ms, self.frame_rate)
+        gamma *= 1.0 - alpha
+        xi = np.divide(self._clean, noise, out=out)
+        xi *= alpha
+        xi += gamma
+
+        # G = xi / (1 + xi)
+        denom = np.add(xi, 1.0, out=self._tmp)
+        g = np.divide(xi, denom, out=out)
+        np.clip(g, p.nr_gain_floor, 1.0, out=g)
+        np.multiply(g, g, out=self._clean)
+        self._clean *= power
+        return g
+
 
 # =======================
-# CALLBACK
+# ENHANCER
 # =======================
-def audio_callback(indata, outdata, frames, time, status):
-    global previous_gain_lin, previous_gate_gain, noise_est_mag, band_env
+class VoiceEnhancer:
+    """
+    Compressor/gate -> spectral NR -> EQ -> channel vocoder -> limiter.
 
-    if status:
-        print(status)
+    Each instance owns its smoothing state and preallocated work buffers,
+    so several enhancers can run in one process and the per-block path
+    does (almost) no allocation. An instance is a valid sounddevice
+    callback: sd.Stream(..., callback=VoiceEnhancer()).
 
-    # Safety: ensure expected block size
-    if frames != BLOCK_SIZE:
-        x = indata[:BLOCK_SIZE, 0]
-    else:
-        x = indata[:, 0]
+    `channels` independent inputs (e.g. one per mic) are processed as one
+    (channels, block) array through the whole chain; every piece of state
+    has a leading channel axis, so channels never influence each other.
+
+    Spectral stages run on one rectangular block of `block_size` samples;
+    see StftVoiceEnhancer for the windowed overlap-add variant.
+
+    Tuning comes from an EnhancerParams snapshot (default: the CONFIG
+    constants at construction) and can be changed while streaming with
+    set_params().
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, num_bands=NUM_BANDS, channels=CHANNELS,
+                 sample_rate=SAMPLE_RATE, seed=None, params=None, lookahead_ms=LIMITER_LOOKAHEAD_MS):
+        self._setup(block_size, block_size, num_bands, channels, sample_rate, seed, params, lookahead_ms)
+        self.reset()
+
+    def _setup(self, block_size, fft_size, num_bands, channels, sample_rate, seed, params, lookahead_ms):
+        self.block_size = block_size
+        self.fft_size = fft_size
+        self.channels = channels
+        bins = fft_size // 2 + 1
+        self.rng = np.random.default_rng(seed)
+
+        # --- parameters + tables for this FFT size (shared, read-only) ---
+        self.sample_rate = sample_rate
+        self.num_bands = num_bands
+        self.tables = None
+        params = params or EnhancerParams.from_config()
+        self._live = (params, get_tables(fft_size, sample_rate, num_bands, params))
+        self._begin_block()
+
+        # unit-magnitude random-phase carrier spectra, picked at random per block
+        self.phase_table = np.exp(2j * np.pi * self.rng.random((CARRIER_PHASE_ROWS, bins)))
+
+        self.noise = NoiseTracker((channels, bins), sample_rate / block_size)
+        self.limiter = LookaheadLimiter(channels, round(lookahead_ms * sample_rate / 1000.0),
+                                        sample_rate, block_size)
+
+        # band envelopes + a trailing 0 for bins outside every band
+        self._env_ext = np.zeros((channels, num_bands + 1))
+        self.band_env = self._env_ext[:, :num_bands]
+
+        # --- work buffers: (channels, samples) / (channels, bins) ---
+        c = channels
+        self._sq = np.empty((c, block_size))
+        self._x_comp = np.empty((c, block_size))
+        self._y = np.empty((c, block_size))
+        self._x_in = np.empty((c, block_size))
+        self._X = np.empty((c, bins), dtype=np.complex128)
+        # (re, im) float view of _X: real gains multiply it without a
+        # complex cast buffer
+        self._X_ri = self._X.view(np.float64).reshape(c, bins, 2)
+        self._N = np.empty((c, bins), dtype=np.complex128)
+        self._mag = np.empty((c, bins))
+        self._sig = np.empty((c, bins))
+        self._gain = np.empty((c, bins))
+        self._tmp = np.empty((c, bins))
+        self._x_eq = np.empty((c, fft_size))
+        self._v_time = np.empty((c, fft_size))
+        self._band_mag = np.empty((c, num_bands))
+        self._env_coef = np.empty((c, num_bands))
+        self._is_attack = np.empty((c, num_bands), dtype=bool)
+        self._rows = np.empty(c, dtype=np.int64)
+        self._ch = np.empty(c)            # per-channel scratch
+        self._ch2 = np.empty(c)
+        # gate / compressor scan buffers (see scratch()), sized here so the
+        # first callback does not allocate them
+        self._work = {}
+        for name in ("level", "gain_target", "gate", "comp", "follow_a", "scan_a", "scan_b", "scan_a2", "scan_b2"):
+            scratch(self._work, name, (block_size, c))
+        for name in ("follow_falling", "follow_flips", "follow_rows"):
+            scratch(self._work, name, (block_size, c), bool)
+
+    # ----- live parameters -----
+    @property
+    def params(self):
+        """The EnhancerParams snapshot the next block will use."""
+        return self._live[0]
+
+    def set_params(self, params=None, **changes):
+        """
+        Publish new tuning while the stream runs; safe to call from any one
+        control thread. Takes a full EnhancerParams and/or field changes,
+        e.g. set_params(vocoder_mix=0.6). EQ / band tables are looked up (or
+        built) here, and only when a TABLE_FIELDS value changed, so the audio
+        thread never builds anything. The (params, tables) pair is swapped
+        in with one attribute store and picked up at the next block
+        boundary. Returns the new params.
+        """
+        old, tables = self._live
+        new = (params or old).updated(changes, self.sample_rate)
+        if new.table_settings() != old.table_settings():
+            tables = get_tables(self.fft_size, self.sample_rate, self.num_bands, new)
+        self._live = (new, tables)
+        return new
+
+    def refresh_tables(self):
+        """
+        Re-fetch the EQ / band tables for the current params (e.g. after
+        clearing the cache). The band count is fixed per instance since it
+        sizes the envelope state.
+        """
+        params = self._live[0]
+        self._live = (params, get_tables(self.fft_size, self.sample_rate, self.num_bands, params))
+
+    def _begin_block(self):
+        """Take this block's (params, tables) snapshot from the control side."""
+        self.p, tables = self._live
+        if tables is not self.tables:
+            self.tables = tables
+            self.eq_curve = tables.eq_curve
+            self._eq_ri = tables.eq_ri
+            self.band_of_bin = tables.band_of_bin
+            self.band_avg_t = tables.band_avg_t
+
+    def reset(self):
+        """Forget all adaptation (gains, noise profile, band envelopes)."""
+        c = self.channels
+        self.level = np.full(c, 1e-6)                    # mean-square level detector
+        self.gain_lin = np.ones(c)                       # compressor
+        self.gate_gain = np.ones(c)                      # smoothed gate
+        self.noise.reset()                               # noise profile
+        self.band_env[:] = 1e-3                          # vocoder envelopes
+        self.limiter.reset()
 
-    x = x.astype(np.float32)
+    @property
+    def latency_samples(self):
+        """Algorithmic delay on top of the stream's own block buffering."""
+        return self.limiter.lookahead
+
+    # ----- sounddevice entry point -----
+    def __call__(self, indata, outdata, frames, time, status):
+        if status:
+            print(status)
+        self.process(indata[:self.block_size], outdata)
+
+    def process(self, x, out):
+        """
+        Enhance one block. `x` and `out` are (block_size, channels) like
+        sounddevice buffers, or (block_size,) when mono.
+        """
+        self._begin_block()
+        x = x.reshape(len(x), -1).T           # (channels, block) view
+        self._dynamics(x)
+        self._denoise(self._x_comp)
+        self._equalize()
+        y = self._vocode()
+        self._limit(y)
+        np.copyto(out.reshape(len(out), -1).T, y, casting="same_kind")
 
     # ===== 1) COMPRESSOR + SMOOTHED GATE (time domain) =====
-    rms = np.sqrt(np.mean(x * x) + 1e-12)
-    rms_db = 20.0 * np.log10(rms + 1e-12)
-
-    # --- smoothed gate: fade between 1.0 and GATE_ATTENUATION over GATE_RANGE_DB ---
-    if rms_db >= GATE_THRESHOLD_DB:
-        gate_target = 1.0
-    elif rms_db <= GATE_THRESHOLD_DB - GATE_RANGE_DB:
-        gate_target = GATE_ATTENUATION
-    else:
-        # linear interpolation
-        t = (GATE_THRESHOLD_DB - rms_db) / GATE_RANGE_DB  # 0..1
-        gate_target = 1.0 - t * (1.0 - GATE_ATTENUATION)
+    def _dynamics(self, x):
+        """Per-sample gate and upward compressor into self._x_comp."""
+        np.copyto(self._x_in, x)   # float32 device layout -> float64 (channels, block)
+        x = self._x_in
+        np.multiply(x, x, out=self._sq)
+        gain = self._dynamic_gain(self._sq.T, self._work)
+        np.multiply(x, gain.T, out=self._x_comp)
+
+    def _dynamic_gain(self, sq, work=None):
+        """
+        Gate x compressor gain per sample for squared input `sq` (samples,
+        channels). Level detection and both smoothers run per sample with
+        time constants in ms (iir1 / follow scans, no per-sample Python
+        loop), so the result does not depend on how the input is blocked.
+        With a `work` dict every intermediate lives in reused buffers (the
+        callback path); without, they are allocated per call.
+        """
+        p = self.p
+        sr = self.sample_rate
+        shape = sq.shape
+        level = iir1(sq, sample_coef(p.level_window_ms, sr), self.level,
+                     out=scratch(work, "level", shape), work=work)
+        np.copyto(self.level, level[-1])
+        level_db = level
+        level_db += 1e-12
+        np.log10(level_db, out=level_db)
+        level_db *= 10.0
+
+        # --- smoothed gate: fade between 1.0 and GATE_ATTENUATION over GATE_RANGE_DB ---
+        target = scratch(work, "gain_target", shape)
+        np.subtract(p.gate_threshold_db, level_db, out=target)
+        target *= 1.0 / p.gate_range_db
+        np.clip(target, 0.0, 1.0, out=target)
+        target *= -(1.0 - p.gate_attenuation)
+        target += 1.0
+        gate = follow(target, sample_coef(p.gate_close_ms, sr), sample_coef(p.gate_open_ms, sr),
+                      self.gate_gain, out=scratch(work, "gate", shape), work=work)
+
+        # --- upward compression ---
+        np.subtract(p.target_rms_db, level_db, out=target)
+        np.clip(target, 0.0, p.max_gain_db, out=target)
+        target *= 1.0 / 20.0
+        np.power(10.0, target, out=target)    # db_to_lin
+        comp = follow(target, sample_coef(p.comp_attack_ms, sr), sample_coef(p.comp_release_ms, sr),
+                      self.gain_lin, out=scratch(work, "comp", shape), work=work)
+
+        np.copyto(self.gate_gain, gate[-1])
+        np.copyto(self.gain_lin, comp[-1])
+        gate *= comp
+        return gate
+
+    # ===== 2) NOISE REDUCTION (spectral) =====
+    def _denoise(self, frame):
+        """rfft of `frame` into self._X with the noise-reduction gain applied."""
+        X = rfft_into(frame, self._X)
+        power = np.abs(X, out=self._sig)
+        power *= power
+        self.noise.update(power, self.p)
+        gain = self.noise.gain(power, self.p, self._gain)
+        self._X_ri *= gain[:, :, None]
+
+    # ===== 3) SPECTRAL EQ =====
+    def _equalize(self):
+        self._X_ri *= self._eq_ri
+        irfft_into(self._X, self.fft_size, self._x_eq)
+
+    # ===== 4) CLASSIC MULTI-BAND CHANNEL VOCODER (NOISE CARRIER) =====
+    def _update_band_env(self):
+        """Attack/release band envelopes from the EQ'd spectrum in self._X."""
+        p = self.p
+        mag_eq = np.abs(self._X, out=self._mag)
+        band_mag = np.matmul(mag_eq, self.band_avg_t, out=self._band_mag)
+        band_mag += 1e-12
+
+        env = self.band_env
+        coef = self._env_coef
+        np.greater(band_mag, env, out=self._is_attack)
+        coef.fill(p.env_release)
+        np.copyto(coef, p.env_attack, where=self._is_attack)
+
+        # env += coef * (band_mag - env)
+        band_mag -= env
+        band_mag *= coef
+        env += band_mag
+
+    def _carrier_spectrum(self):
+        """Random-phase spectra shaped by the band envelopes, in self._N."""
+        rows = self._rows
+        rows[:] = self.rng.integers(CARRIER_PHASE_ROWS, size=self.channels)
+        phase = np.take(self.phase_table, rows, axis=0, out=self._N)
+        env_bins = np.take(self._env_ext, self.band_of_bin, axis=1, out=self._tmp)
+        phase *= env_bins
+        return phase
+
+    def _vocode(self):
+        p = self.p
+        if p.vocoder_mix <= 0.0:
+            return self._x_eq
+
+        self._update_band_env()
+        v_time = irfft_into(self._carrier_spectrum(), self.fft_size, self._v_time)
+
+        # normalize vocoder level to roughly match x_eq (per channel)
+        v_ms = np.einsum("ij,ij->i", v_time, v_time, out=self._ch)
+        x_ms = np.einsum("ij,ij->i", self._x_eq, self._x_eq, out=self._ch2)
+        x_ms += 1e-12 * self.fft_size
+        v_ms += 1e-12 * self.fft_size
+        x_ms /= v_ms
+        scale = np.sqrt(x_ms, out=x_ms)
+
+        mix = min(max(p.vocoder_mix, 0.0), 1.0)
+        scale *= mix
+        y = np.multiply(self._x_eq, 1.0 - mix, out=self._y)
+        v_time *= scale[:, None]
+        y += v_time
+        return y
+
+    # ===== 5) LIMITER =====
+    def _limit(self, y):
+        self.limiter.process(y, self.p.limiter_threshold, self.p.limiter_release_db_s)
+
+    # ----- offline -----
+    def process_batch(self, frames):
+        """
+        Run the chain over many blocks at once. `frames` is
+        (num_blocks, block_size[, channels]); the result has the same shape.
+
+        Same processing as calling process() block after block, but every FFT,
+        gain and mix is one batched NumPy call over all blocks and channels.
+        Gate and compressor already run per sample and simply see one long
+        signal; only the noise tracker and the vocoder's attack/release
+        envelope are stepped per block (vectorized over channels x bins).
+        State carries over, so consecutive calls are seamless.
+        """
+        self._begin_block()
+        p = self.p
+        frames = np.asarray(frames, dtype=np.float64)
+        shape = frames.shape
+        frames = frames.reshape(shape[0], shape[1], -1).transpose(0, 2, 1)   # (F, C, n)
+        num_blocks, _, n = frames.shape
+
+        # ===== 1) COMPRESSOR + SMOOTHED GATE =====
+        sq = frames * frames
+        gain = self._dynamic_gain(sq.transpose(0, 2, 1).reshape(num_blocks * n, -1))
+        gain = gain.reshape(num_blocks, n, -1).transpose(0, 2, 1)             # (F, C, n)
+
+        # ===== 2) NOISE REDUCTION + EQ =====
+        X = np.fft.rfft(frames * gain, axis=2)
+        power = np.abs(X) ** 2
+
+        # MCRA tracking and the decision-directed gain recurse per frame
+        gain_nr = np.empty_like(power)
+        for k in range(num_blocks):
+            self.noise.update(power[k], p)
+            self.noise.gain(power[k], p, gain_nr[k])
+
+        X_eq = X * gain_nr * self.eq_curve
+        x_eq = np.fft.irfft(X_eq, n=n, axis=2)
+
+        # ===== 3) CHANNEL VOCODER =====
+        if p.vocoder_mix > 0.0:
+            band_mag = np.abs(X_eq) @ self.band_avg_t + 1e-12               # (F, C, bands)
 
-    gate_gain = (1.0 - GATE_SMOOTHING) * previous_gate_gain + GATE_SMOOTHING * gate_target
-    previous_gate_gain = gate_gain
+            # attack/release is nonlinear, so step it per block (vectorized over channels x bands)
+            env = np.zeros(band_mag.shape[:2] + (self.num_bands + 1,))
+            prev = self.band_env.copy()
+            for k in range(num_blocks):
+                coef = np.where(band_mag[k] > prev, p.env_attack, p.env_release)
+                prev += coef * (band_mag[k] - prev)
+                env[k, :, :-1] = prev
+            self.band_env[:] = prev
 
-    # --- upward compression ---
-    gain_db = TARGET_RMS_DB - rms_db
-    if gain_db > MAX_GAIN_DB:
-        gain_db = MAX_GAIN_DB
-    if gain_db < 0.0:
-        gain_db = 0.0  # upward only
+            rows = self.rng.integers(CARRIER_PHASE_ROWS, size=(num_blocks, self.channels))
+            V = self.phase_table[rows] * env[:, :, self.band_of_bin]
 
-    gain_lin = db_to_lin(gain_db) * gate_gain
-    gain_lin = (1.0 - COMP_SMOOTHING) * previous_gain_lin + COMP_SMOOTHING * gain_lin
-    previous_gain_lin = gain_lin
+            v_time = np.fft.irfft(V, n=n, axis=2)
+            v_rms = np.sqrt(np.mean(v_time * v_time, axis=2, keepdims=True) + 1e-12)
+            x_rms = np.sqrt(np.mean(x_eq * x_eq, axis=2, keepdims=True) + 1e-12)
 
-    x_comp = x * gain_lin
+            mix = min(max(p.vocoder_mix, 0.0), 1.0)
+            y = (1.0 - mix) * x_eq + mix * v_time * (x_rms / v_rms)
+        else:
+            y = x_eq
 
-    # ===== 2) NOISE REDUCTION + EQ (spectral) =====
-    X = np.fft.rfft(x_comp)
-    mag = np.abs(X)
-    phase = np.angle(X)
+        # ===== 4) LIMITER (one continuous signal per channel) =====
+        y = np.ascontiguousarray(y.transpose(1, 0, 2)).reshape(self.channels, num_blocks * n)
+        self.limiter.process(y, p.limiter_threshold, p.limiter_release_db_s)
 
-    # --- update noise profile when frame is mostly noise ---
-    if rms_db < NOISE_UPDATE_THRESH_DB:
-        noise_est_mag = (1.0 - NOISE_UPDATE_ALPHA) * noise_est_mag + NOISE_UPDATE_ALPHA * mag
+        y = y.reshape(self.channels, num_blocks, n).transpose(1, 2, 0)
+        return y.reshape(shape).astype(np.float32)
 
-    noise_power = noise_est_mag ** 2
-    signal_power = mag ** 2
 
-    # simple spectral subtraction / Wiener-style gain
-    snr_est = np.maximum(signal_power - NOISE_OVEREST * noise_power, 0.0)
-    gain_nr = np.sqrt(snr_est / (signal_power + 1e-12))
-    gain_nr = np.clip(gain_nr, NR_GAIN_FLOOR, 1.0)
+class StftVoiceEnhancer(VoiceEnhancer):
+    """
+    Same chain, but the spectral stages (NR, EQ, vocoder) run on a windowed
+    STFT with overlap-add instead of one rectangular block.
 
-    X_denoised = X * gain_nr
+    The stream block size is the hop; each hop a `fft_size` frame (sqrt-Hann
+    analysis and synthesis windows) is processed and overlap-added, so block
+    edges no longer click. Adds `fft_size - hop` samples of latency (plus
+    the limiter look-ahead), e.g. fft_size=512, hop=128 -> 24 ms @ 16 kHz
+    at 75% overlap.
+    """
 
-    # apply EQ
-    X_eq = X_denoised * EQ_CURVE_LIN
-    x_eq = np.fft.irfft(X_eq, n=BLOCK_SIZE).astype(np.float32)
+    def __init__(self, fft_size=BLOCK_SIZE, hop=BLOCK_SIZE // 4, num_bands=NUM_BANDS,
+                 channels=CHANNELS, sample_rate=SAMPLE_RATE, seed=None, params=None,
+                 lookahead_ms=LIMITER_LOOKAHEAD_MS):
+        if fft_size % hop or fft_size // hop < 2:
+            raise ValueError("hop must divide fft_size with at least 50% overlap")
+        self._setup(hop, fft_size, num_bands, channels, sample_rate, seed, params, lookahead_ms)
+        self.hop = hop
 
-    # ===== 3) CLASSIC MULTI-BAND CHANNEL VOCODER (NOISE CARRIER) =====
-    if VOCODER_MIX > 0.0:
-        mag_eq = np.abs(X_eq)
+        # periodic sqrt-Hann on both sides; the OLA gain is a constant
+        # fft_size / (2 * hop), folded into the synthesis window
+        n = np.arange(fft_size)
+        self.window = np.sqrt(0.5 - 0.5 * np.cos(2.0 * np.pi * n / fft_size))
+        self.synth_window = self.window * (2.0 * hop / fft_size)
 
-        # --- update band envelopes from speech magnitude ---
-        for b in range(NUM_BANDS):
-            idx = band_indices[b]
-            if idx.size == 0:
+        self._frame = np.empty((channels, fft_size))
+        self._in_buf = np.zeros((channels, fft_size))
+        self._ola = np.zeros((channels, fft_size))
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self._in_buf[:] = 0.0
+        self._ola[:] = 0.0
+
+    @property
+    def latency_samples(self):
+        return self.fft_size - self.hop + self.limiter.lookahead
+
+    def process(self, x, out):
+        """Enhance one `hop` block (see VoiceEnhancer.process for shapes)."""
+        self._begin_block()
+        hop = self.hop
+        x = x.reshape(len(x), -1).T
+        self._dynamics(x)
+
+        # slide the analysis buffer by one hop
+        self._in_buf[:, :-hop] = self._in_buf[:, hop:]
+        self._in_buf[:, -hop:] = self._x_comp
+        np.multiply(self._in_buf, self.window, out=self._frame)
+
+        self._denoise(self._frame)
+        self._equalize()
+        self._vocode_spectrum()
+        y = self._overlap_add()
+        self._limit(y)
+        np.copyto(out.reshape(len(out), -1).T, y, casting="same_kind")
+
+    def _overlap_add(self):
+        """Inverse FFT of self._X, window, accumulate; return the finished hop."""
+        hop = self.hop
+        frame = irfft_into(self._X, self.fft_size, self._frame)
+        frame *= self.synth_window
+        self._ola += frame
+
+        # first hop of the accumulator is complete
+        y = self._y
+        y[:] = self._ola[:, :hop]
+        self._ola[:, :-hop] = self._ola[:, hop:]
+        self._ola[:, -hop:] = 0.0
+        return y
+
+    def _equalize(self):
+        self._X_ri *= self._eq_ri   # stays in the frequency domain until OLA
+
+    def _vocode_spectrum(self):
+        """Mix the vocoder carrier into self._X (levels matched per frame)."""
+        p = self.p
+        if p.vocoder_mix <= 0.0:
+            return
+        self._update_band_env()
+        V = self._carrier_spectrum()
+
+        x_energy = np.einsum("ij,ij->i", self._X.real, self._X.real, out=self._ch)
+        x_energy += np.einsum("ij,ij->i", self._X.imag, self._X.imag)
+        v_energy = np.einsum("ij,ij->i", V.real, V.real, out=self._ch2)
+        v_energy += np.einsum("ij,ij->i", V.imag, V.imag)
+        x_energy += 1e-12
+        v_energy += 1e-12
+        x_energy /= v_energy
+        scale = np.sqrt(x_energy, out=x_energy)
+
+        mix = min(max(p.vocoder_mix, 0.0), 1.0)
+        scale *= mix
+        self._X *= 1.0 - mix
+        V *= scale[:, None]
+        self._X += V
+
+    def process_batch(self, frames):
+        """Hop-by-hop fallback (overlap-add state makes batching pointless here)."""
+        frames = np.asarray(frames, dtype=np.float32)
+        out = np.empty_like(frames)
+        for k in range(len(frames)):
+            self.process(frames[k], out[k])
+        return out
+
+
+# =======================
+# THREADED MODE
+# =======================
+class ThreadedEnhancer:
+    """
+    Runs an enhancer on a worker thread, decoupled from PortAudio.
+
+    The stream callback only copies input frames into one SPSC ring buffer
+    and output frames out of another; it never touches the DSP. The output
+    ring is prefilled with `jitter_blocks` of silence, so a slow block or a
+    GC pause eats into that cushion instead of dropping audio. The cushion
+    is the latency this mode adds (see added_latency_samples).
+    """
+
+    def __init__(self, enhancer, jitter_blocks=JITTER_BLOCKS, ring_blocks=RING_BLOCKS):
+        self.enhancer = enhancer
+        self.block_size = enhancer.block_size
+        self.jitter_blocks = jitter_blocks
+        capacity = max(ring_blocks, jitter_blocks + 2) * self.block_size
+        self.in_ring = RingBuffer(capacity, enhancer.channels)
+        self.out_ring = RingBuffer(capacity, enhancer.channels)
+        self.out_ring.write_silence(jitter_blocks * self.block_size)
+
+        self._x = np.zeros((self.block_size, enhancer.channels), dtype=np.float32)
+        self._y = np.zeros((self.block_size, enhancer.channels), dtype=np.float32)
+        self._running = False
+        self._thread = None
+
+        # counters (each written by one thread only)
+        self.underruns = 0       # callback found too little output
+        self.overruns = 0        # callback found the input ring full
+        self.status_flags = 0    # PortAudio statuses seen
+        self.slow_blocks = 0     # worker blocks slower than real time
+        self.max_block_s = 0.0
+
+    @property
+    def added_latency_samples(self):
+        return self.jitter_blocks * self.block_size
+
+    @property
+    def queued_samples(self):
+        """Output currently buffered ahead of the device (measured latency)."""
+        return self.out_ring.readable
+
+    # ----- sounddevice entry point: copy only -----
+    def __call__(self, indata, outdata, frames, time_info, status):
+        if status:
+            self.status_flags += 1
+        if self.in_ring.write(indata) < frames:
+            self.overruns += 1
+        n = self.out_ring.read_into(outdata)
+        if n < frames:
+            outdata[n:] = 0.0
+            self.underruns += 1
+
+    # ----- worker -----
+    def _worker(self):
+        block = self.block_size
+        budget = block / self.enhancer.sample_rate
+        idle = budget / 4.0
+        while self._running:
+            if self.in_ring.readable < block or self.out_ring.writable < block:
+                time.sleep(idle)
                 continue
-            band_mag = np.mean(mag_eq[idx]) + 1e-12
-            if band_mag > band_env[b]:
-                # attack
-                band_env[b] = (1.0 - ENV_ATTACK) * band_env[b] + ENV_ATTACK * band_mag
-            else:
-                # release
-                band_env[b] = (1.0 - ENV_RELEASE) * band_env[b] + ENV_RELEASE * band_mag
-
-        # noise carrier
-        noise = np.random.randn(BLOCK_SIZE).astype(np.float32)
-        N = np.fft.rfft(noise)
-
-        # build vocoder spectrum: band envelopes + noise phase
-        V = np.zeros_like(N, dtype=np.complex64)
-        for b in range(NUM_BANDS):
-            idx = band_indices[b]
-            if idx.size == 0:
+            self.in_ring.read_into(self._x)
+            t0 = time.perf_counter()
+            self.enhancer.process(self._x, self._y)
+            dt = time.perf_counter() - t0
+            self.out_ring.write(self._y)
+            if dt > budget:
+                self.slow_blocks += 1
+            if dt > self.max_block_s:
+                self.max_block_s = dt
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name="enhancer-dsp", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# =======================
+# LIVE CONTROL
+# =======================
+class ParamControl:
+    """
+    Local control channel that retunes running enhancers.
+
+    - `path`: a JSON file of {name: value}, polled by mtime every `poll_s`
+      seconds; each save is applied on top of the startup params, so
+      deleting a key restores its default.
+    - `stdin`: lines like "vocoder_mix=0.6 gate_threshold_db=-40", applied
+      on top of the current params; "show" prints them.
+
+    Names are EnhancerParams fields or CONFIG constants. Bad input is
+    reported and ignored; the stream keeps the previous settings.
+    """
+
+    def __init__(self, enhancers, path=None, stdin=False, poll_s=0.25):
+        self.enhancers = list(enhancers)
+        self.path = Path(path) if path else None
+        self.stdin = stdin
+        self.poll_s = poll_s
+        self.base = self.enhancers[0].params
+        self._mtime = None
+        self._running = False
+        self._threads = []
+
+    def apply(self, changes, base=None):
+        """Apply a {name: value} mapping to every enhancer; returns the new params."""
+        new = (base or self.enhancers[0].params).updated(changes, self.enhancers[0].sample_rate)
+        for enhancer in self.enhancers:
+            enhancer.set_params(new)
+        return new
+
+    def reload(self):
+        """Re-read the params file if it changed since the last look."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                changes = json.load(f)
+            if not isinstance(changes, dict):
+                raise ValueError("expected a JSON object of name: value")
+            self.apply(changes, base=self.base)
+            print(f"[params] loaded {self.path}")
+        except (OSError, ValueError, TypeError) as e:
+            print(f"[params] {self.path}: {e} (keeping previous settings)")
+
+    def _poll_file(self):
+        while self._running:
+            self.reload()
+            time.sleep(self.poll_s)
+
+    def _read_stdin(self):
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            if line == "show":
+                print(self.enhancers[0].params)
                 continue
-            band_phase = np.angle(N[idx])
-            V[idx] = band_env[b] * np.exp(1j * band_phase)
+            try:
+                changes = dict(item.split("=", 1) for item in line.split())
+                new = self.apply(changes)
+                print("[params] " + " ".join(f"{k.lower()}={getattr(new, k.strip().lower())}" for k in changes))
+            except ValueError as e:
+                print(f"[params] {e}")
 
-        v_time = np.fft.irfft(V, n=BLOCK_SIZE).astype(np.float32)
+    def start(self):
+        self._running = True
+        if self.path is not None:
+            self._threads.append(threading.Thread(target=self._poll_file, name="enhancer-params", daemon=True))
+        if self.stdin:
+            # blocks on readline, so it is only ever abandoned (daemon), not joined
+            self._threads.append(threading.Thread(target=self._read_stdin, name="enhancer-stdin", daemon=True))
+        for thread in self._threads:
+            thread.start()
 
-        # normalize vocoder level to roughly match x_eq
-        v_rms = np.sqrt(np.mean(v_time * v_time) + 1e-12)
-        x_rms = np.sqrt(np.mean(x_eq * x_eq) + 1e-12)
-        if v_rms > 0.0:
-            v_time *= (x_rms / v_rms)
+    def stop(self):
+        self._running = False
 
-        mix = np.clip(VOCODER_MIX, 0.0, 1.0)
-        y = (1.0 - mix) * x_eq + mix * v_time
-    else:
-        y = x_eq
 
-    # ===== 4) LIMITER =====
-    peak = np.max(np.abs(y))
-    if peak > LIMITER_THRESHOLD:
-        y = y * (LIMITER_THRESHOLD / peak)
+# =======================
+# OFFLINE (BATCHED) PROCESSING
+# =======================
+def _run_blocks(enhancer, x):
+    """Process (samples[, channels]) whose length is a multiple of block_size."""
+    frames = x.reshape((-1, enhancer.block_size) + x.shape[1:])
+    out = np.empty(frames.shape, dtype=np.float32)
+    for start in range(0, len(frames), OFFLINE_CHUNK_BLOCKS):
+        stop = start + OFFLINE_CHUNK_BLOCKS
+        out[start:stop] = enhancer.process_batch(frames[start:stop])
+    return out.reshape(x.shape)
+
+
+def enhance_array(x, enhancer=None):
+    """
+    Enhance a whole float signal at the enhancer's sample rate, shaped (samples,) or
+    (samples, channels) to match the enhancer. The output has the input's
+    shape and is aligned with it (the enhancer's latency is flushed with
+    zeros and trimmed off).
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if enhancer is None:
+        enhancer = VoiceEnhancer(channels=1 if x.ndim == 1 else x.shape[1])
+    delay = enhancer.latency_samples
+    block = enhancer.block_size
+    padded = np.zeros((-(-(len(x) + delay) // block) * block,) + x.shape[1:], dtype=np.float32)
+    padded[:len(x)] = x
+    return _run_blocks(enhancer, padded)[delay:delay + len(x)]
+
+
+class Resampler:
+    """
+    Streaming resampler: windowed-sinc low-pass, then linear interpolation
+    onto the target grid. Good enough for speech headed to STT. Takes
+    (samples,) or (samples, channels) chunks.
+    """
+
+    def __init__(self, src_rate, dst_rate, taps=63):
+        self.step = src_rate / float(dst_rate)
+        cutoff = 0.45 * min(src_rate, dst_rate) / src_rate   # cycles/sample
+        n = np.arange(taps) - (taps - 1) / 2.0
+        h = 2.0 * cutoff * np.sinc(2.0 * cutoff * n) * np.hamming(taps)
+        self.h = h / h.sum()
+        self.history = None
+        self.tail = None
+        self.pos = (taps - 1) / 2.0   # skip the filter's group delay
+
+    def process(self, x):
+        x = np.asarray(x)
+        x2 = x.reshape(len(x), -1)
+        if self.history is None:
+            self.history = np.zeros((len(self.h) - 1, x2.shape[1]))
+            self.tail = np.zeros((0, x2.shape[1]))
+            self.frame_shape = x.shape[1:]
+
+        buf = np.concatenate([self.history, x2])
+        self.history = buf[len(buf) - len(self.history):]
+        filtered = np.stack([np.convolve(buf[:, c], self.h, mode="valid")
+                             for c in range(buf.shape[1])], axis=1)
+        data = np.concatenate([self.tail, filtered])
+
+        last = len(data) - 1
+        n_out = int(np.floor((last - self.pos) / self.step)) + 1 if last >= self.pos else 0
+        t = self.pos + self.step * np.arange(n_out)
+        grid = np.arange(len(data))
+        y = np.stack([np.interp(t, grid, data[:, c]) for c in range(data.shape[1])], axis=1)
+
+        next_pos = self.pos + self.step * n_out
+        drop = min(int(np.floor(next_pos)), len(data))
+        self.tail = data[drop:]
+        self.pos = next_pos - drop
+        return y.reshape((n_out,) + x.shape[1:]).astype(np.float32)
+
+    def flush(self):
+        if self.history is None:
+            return np.zeros(0, dtype=np.float32)
+        return self.process(np.zeros((len(self.history),) + self.frame_shape))
+
+
+def read_wav_chunks(path, chunk_frames, mono=True):
+    """
+    Yield (float32 chunk, sample_rate) from a PCM16 WAV file. Chunks are
+    downmixed to (samples,) when `mono`, else shaped (samples, channels).
+    """
+    with wave.open(str(path), "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV is supported")
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+        while True:
+            raw = wf.readframes(chunk_frames)
+            if not raw:
+                break
+            pcm = np.frombuffer(raw, dtype="<i2").reshape(-1, channels)
+            if mono:
+                yield pcm.mean(axis=1, dtype=np.float32) / 32768.0, rate
+            else:
+                yield pcm.astype(np.float32) / 32768.0, rate
+
+
+def enhance_file(in_path, out_path, enhancer=None, trim_silence=False):
+    """
+    Enhance a PCM16 WAV (any rate) and write a PCM16 WAV at the enhancer's
+    sample rate.
+    A mono enhancer downmixes the file; a multi-channel enhancer needs a
+    file with the same channel count and keeps the channels separate.
+    Streams the file in chunks of OFFLINE_CHUNK_BLOCKS blocks, so memory
+    stays flat for hours-long recordings.
+    With `trim_silence` (mono only) the enhanced audio goes through a VAD
+    SpeechGate and only speech is written, e.g. to shrink STT uploads.
+    Returns (seconds in, seconds written).
+    """
+    if enhancer is None:
+        enhancer = VoiceEnhancer()
+    channels = enhancer.channels
+    if trim_silence and channels > 1:
+        raise ValueError("trim_silence needs a mono enhancer")
+    gate = SpeechGate(enhancer.sample_rate) if trim_silence else None
+    written = 0
+    if channels > 1:
+        with wave.open(str(in_path), "rb") as wf:
+            if wf.getnchannels() != channels:
+                raise ValueError(f"{in_path}: has {wf.getnchannels()} channels, enhancer expects {channels}")
+
+    block = enhancer.block_size
+    chunk_samples = OFFLINE_CHUNK_BLOCKS * block
+    pending = np.zeros((0, channels), dtype=np.float32)
+    skip = enhancer.latency_samples
+    remaining = 0   # input samples not yet written out
+    resampler = None
+
+    with wave.open(str(out_path), "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(enhancer.sample_rate)
+
+        def emit(samples, final=False):
+            nonlocal pending, skip, remaining, written
+            samples = samples.reshape(len(samples), -1)
+            remaining += len(samples)
+            pending = np.concatenate([pending, samples])
+            if final:
+                # flush the enhancer's latency and the partial last block
+                size = -(-(len(pending) + enhancer.latency_samples) // block) * block
+                pending = np.concatenate([pending, np.zeros((size - len(pending), channels), dtype=np.float32)])
+            usable = (len(pending) // block) * block
+            if usable == 0:
+                return
+            y = _run_blocks(enhancer, pending[:usable])
+            pending = pending[usable:]
+
+            drop = min(skip, len(y))
+            skip -= drop
+            y = y[drop:drop + remaining]
+            remaining -= len(y)
+            if gate is not None:
+                y = gate.process(y[:, 0])[:, None]
+            written += len(y)
+            wf.writeframes((np.clip(y, -1.0, 1.0) * 32767.0).astype("<i2").tobytes())
+
+        for chunk, rate in read_wav_chunks(in_path, chunk_samples, mono=channels == 1):
+            if rate != enhancer.sample_rate and resampler is None:
+                resampler = Resampler(rate, enhancer.sample_rate)
+            emit(resampler.process(chunk) if resampler else chunk)
+
+        emit(resampler.flush() if resampler else np.zeros((0, channels), dtype=np.float32), final=True)
+
+    total = gate.samples_in if gate is not None else written
+    return total / enhancer.sample_rate, written / enhancer.sample_rate
 
-    outdata[:, 0] = y
 
 # =======================
 # MAIN
 # =======================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time voice enhancer + vocoder.")
+    parser.add_argument("--input", help="process this WAV file offline instead of the live stream")
+    parser.add_argument("--output", help="output WAV path for --input (default: <input>_enhanced.wav)")
+    parser.add_argument("--trim-silence", action="store_true",
+                        help="with --input, write only the speech (VAD), e.g. before STT")
+    parser.add_argument("--hop", type=int,
+                        help="use the overlap-add STFT engine with this hop (= stream block size)")
+    parser.add_argument("--fft-size", type=int, default=BLOCK_SIZE,
+                        help="STFT frame size for --hop (default: %(default)s)")
+    parser.add_argument("--channels", type=int, default=CHANNELS,
+                        help="process this many mics/channels side by side (default: %(default)s)")
+    parser.add_argument("--threaded", action="store_true",
+                        help="run DSP on a worker thread behind ring buffers")
+    parser.add_argument("--jitter-blocks", type=int, default=JITTER_BLOCKS,
+                        help="output cushion for --threaded, in blocks (default: %(default)s)")
+    parser.add_argument("--lookahead-ms", type=float, default=LIMITER_LOOKAHEAD_MS,
+                        help="limiter look-ahead; adds this much latency (default: %(default)s)")
+    parser.add_argument("--params",
+                        help="JSON file of parameter overrides; re-read whenever it changes")
+    parser.add_argument("--control-stdin", action="store_true",
+                        help="accept name=value parameter changes on stdin while streaming")
+    args = parser.parse_args()
+
+    if args.hop:
+        enhancer = StftVoiceEnhancer(fft_size=args.fft_size, hop=args.hop, channels=args.channels,
+                                     lookahead_ms=args.lookahead_ms)
+    else:
+        enhancer = VoiceEnhancer(channels=args.channels, lookahead_ms=args.lookahead_ms)
+
+    control = ParamControl([enhancer], path=args.params, stdin=args.control_stdin)
+    if args.params:
+        control.reload()
+
+    if args.input:
+        out_path = args.output or args.input.rsplit(".", 1)[0] + "_enhanced.wav"
+        seconds_in, seconds_out = enhance_file(args.input, out_path, enhancer, trim_silence=args.trim_silence)
+        print(f"Wrote {out_path} ({seconds_out:.1f} s of {seconds_in:.1f} s)")
+        raise SystemExit(0)
+
+    if sd is None:
+        raise SystemExit("sounddevice / PortAudio not available; use --input for offline processing.")
+
     print("Starting real-time enhanced + vocoded voice.")
+    latency_ms = 1000.0 * (enhancer.block_size + enhancer.latency_samples) / SAMPLE_RATE
+    print(f"Block {enhancer.block_size}, FFT {enhancer.fft_size}, "
+          f"processing latency ~{latency_ms:.1f} ms + device buffers.")
+
+    callback = enhancer
+    if args.threaded:
+        callback = ThreadedEnhancer(enhancer, jitter_blocks=args.jitter_blocks)
+        print(f"Threaded mode: +{1000.0 * callback.added_latency_samples / SAMPLE_RATE:.1f} ms jitter buffer.")
+        callback.start()
+    if args.params or args.control_stdin:
+        control.start()
+        print("Live parameter control: " + ", ".join(
+            filter(None, [args.params and f"watching {args.params}",
+                          args.control_stdin and "name=value on stdin"])))
     print("Press Ctrl+C to stop.")
 
-    with sd.Stream(channels=CHANNELS,
+    with sd.Stream(channels=enhancer.channels,
                    samplerate=SAMPLE_RATE,
-                   blocksize=BLOCK_SIZE,
+                   blocksize=enhancer.block_size,
                    dtype="float32",
-                   callback=audio_callback):
+                   callback=callback):
         try:
             while True:
                 sd.sleep(1000)
+                if args.threaded:
+                    print(f"\rqueued {1000.0 * callback.queued_samples / SAMPLE_RATE:5.1f} ms | "
+                          f"underruns {callback.underruns} | overruns {callback.overruns} | "
+                          f"slow blocks {callback.slow_blocks} | "
+                          f"max block {1000.0 * callback.max_block_s:.2f} ms | "
+                          f"status {callback.status_flags}   ", end="", flush=True)
         except KeyboardInterrupt:
             print("\nStopping.")
-
+        finally:
+            control.stop()
+            if args.threaded:
+                callback.stop()
@@ -0,0 +1,242 @@
+"""
+Local stand-in for the ElevenLabs realtime STT websocket, for offline
+load tests of stt_gateway.py (no API key, no quota).
+
+Speaks the same event protocol the realtime service uses:
+
+  client -> {"message_type": "input_audio_chunk", "audio_base_64": ...,
+             "commit": false, "sample_rate": 16000}
+  server -> {"message_type": "session_started", "session_id": ...}
+            {"message_type": "partial_transcript", "text": ...}
+            {"message_type": "committed_transcript", "text": ...}
+            {"message_type": "error", "error": ...}
+
+A partial goes out every PARTIAL_MS of new audio. A commit happens on an
+explicit `"commit": true` or, like the service's VAD commit strategy,
+after SILENCE_COMMIT_MS of quiet audio following speech. The "transcript"
+is filler words, one per MS_PER_WORD of audio. Every event is delayed by
+--delay-ms to model server latency, and --drop-after-s closes each
+connection after that much audio to exercise reconnects.
+
+MockConnection is the matching client. It has the same on / send /
+commit / close surface as the SDK's realtime connection.
+
+Usage:
+  python mock_realtime_server.py
+  python mock_realtime_server.py --port 8765 --delay-ms 80 --drop-after-s 20
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+
+import numpy as np
+
+try:
+    import websockets
+except ImportError:
+    websockets = None  # only needed to actually run the mock
+
+# =======================
+# CONFIG
+# =======================
+HOST = "127.0.0.1"
+PORT = 8765
+SAMPLE_RATE = 16000
+PARTIAL_MS = 400            # audio between partial transcripts
+SILENCE_COMMIT_MS = 1500    # quiet audio after speech that triggers a commit (vad_silence_threshold_secs)
+SILENCE_DBFS = -45.0        # chunks quieter than this count as silence
+MS_PER_WORD = 400           # filler words per audio duration
+DELAY_MS = 50               # simulated server latency per event
+WORDS = ["שלום", "תודה", "בבקשה", "כן", "לא", "עצור", "עזרה", "מים", "אוכל", "טוב"]
+
+
+def filler_text(ms):
+    n = int(ms // MS_PER_WORD)
+    return " ".join(WORDS[i % len(WORDS)] for i in range(n))
+
+
+# =======================
+# SERVER
+# =======================
+class MockRealtimeServer:
+    def __init__(self, delay_ms=DELAY_MS, drop_after_s=0.0, sample_rate=SAMPLE_RATE):
+        self.delay = delay_ms / 1000.0
+        self.drop_after_ms = 1000.0 * drop_after_s
+        self.sample_rate = sample_rate
+        self.sessions = 0
+        self.active = 0
+        self.audio_ms = 0.0
+        self.commits = 0
+        self.dropped = 0
+
+    async def _writer(self, ws, outbox):
+        # in-order delivery, each event no earlier than its due time
+        while True:
+            due, msg = await outbox.get()
+            wait = due - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await ws.send(json.dumps(msg, ensure_ascii=False))
+
+    async def handle(self, ws):
+        self.sessions += 1
+        self.active += 1
+        outbox = asyncio.Queue()
+        writer = asyncio.create_task(self._writer(ws, outbox))
+
+        def emit(message_type, **fields):
+            outbox.put_nowait((time.monotonic() + self.delay, dict(message_type=message_type, **fields)))
+
+        emit("session_started", session_id=f"mock-{self.sessions}")
+        received_ms = 0.0       # whole connection
+        pending_ms = 0.0        # audio since the last commit
+        since_partial_ms = 0.0
+        quiet_ms = 0.0
+        heard_speech = False
+        closing = None
+
+        def commit():
+            nonlocal pending_ms, since_partial_ms, heard_speech
+            emit("committed_transcript", text=filler_text(pending_ms))
+            self.commits += 1
+            pending_ms = since_partial_ms = 0.0
+            heard_speech = False
+
+        try:
+            async for raw in ws:
+                if closing is not None:
+                    continue    # keep reading so the close handshake is not stuck behind unread frames
+                try:
+                    msg = json.loads(raw)
+                    pcm = np.frombuffer(base64.b64decode(msg.get("audio_base_64") or ""), dtype="<i2")
+                except (ValueError, TypeError):
+                    emit("error", error="malformed message")
+                    continue
+                if msg.get("message_type") != "input_audio_chunk":
+                    emit("error", error=f"unknown message_type {msg.get('message_type')!r}")
+                    continue
+
+                ms = 1000.0 * len(pcm) / int(msg.get("sample_rate") or self.sample_rate)
+                received_ms += ms
+                pending_ms += ms
+                since_partial_ms += ms
+                self.audio_ms += ms
+                if len(pcm):
+                    rms = np.sqrt(np.mean(np.square(pcm, dtype=np.float64))) / 32768.0
+                    if 20.0 * np.log10(rms + 1e-12) < SILENCE_DBFS:
+                        quiet_ms += ms
+                    else:
+                        quiet_ms = 0.0
+                        heard_speech = True
+
+                if msg.get("commit") or (heard_speech and quiet_ms >= SILENCE_COMMIT_MS):
+                    commit()
+                elif since_partial_ms >= PARTIAL_MS:
+                    emit("partial_transcript", text=filler_text(pending_ms))
+                    since_partial_ms = 0.0
+
+                if self.drop_after_ms and received_ms >= self.drop_after_ms:
+                    self.dropped += 1
+                    closing = asyncio.create_task(ws.close(code=1011, reason="mock drop"))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            writer.cancel()
+            if closing is not None:
+                await asyncio.gather(closing, return_exceptions=True)
+            self.active -= 1
+
+    def report(self):
+        return (f"sessions {self.sessions} (active {self.active}), audio {self.audio_ms / 1000.0:.1f} s, "
+                f"commits {self.commits}, dropped {self.dropped}")
+
+
+async def serve(server, host=HOST, port=PORT, report_s=5.0):
+    async with websockets.serve(server.handle, host, port):
+        print(f"Mock realtime STT on ws://{host}:{port}")
+        while True:
+            await asyncio.sleep(report_s)
+            print(server.report())
+
+
+# =======================
+# CLIENT
+# =======================
+class MockConnection:
+    """
+    Client side of the mock, shaped like the SDK's realtime connection:
+    on(event, fn), send({"audio_base_64", "sample_rate"}), commit(), close().
+    Events are the message_type strings plus "close".
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.handlers = {}
+        self._reader = asyncio.create_task(self._read())
+
+    @classmethod
+    async def connect(cls, url):
+        if websockets is None:
+            raise RuntimeError("The mock needs the websockets package (pip install websockets).")
+        return cls(await websockets.connect(url))
+
+    def on(self, event, fn):
+        self.handlers[event] = fn
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                msg = json.loads(raw)
+                fn = self.handlers.get(msg.get("message_type"))
+                if fn is not None:
+                    fn(msg)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            fn = self.handlers.get("close")
+            if fn is not None:
+                fn()
+
+    async def send(self, message):
+        await self.ws.send(json.dumps({
+            "message_type": "input_audio_chunk",
+            "audio_base_64": message["audio_base_64"],
+            "commit": False,
+            "sample_rate": message.get("sample_rate", SAMPLE_RATE),
+        }))
+
+    async def commit(self):
+        await self.ws.send(json.dumps({
+            "message_type": "input_audio_chunk",
+            "audio_base_64": "",
+            "commit": True,
+            "sample_rate": SAMPLE_RATE,
+        }))
+
+    async def close(self):
+        await self.ws.close()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the realtime STT websocket.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--delay-ms", type=float, default=DELAY_MS, help="simulated latency per event")
+    parser.add_argument("--drop-after-s", type=float, default=0.0,
+                        help="close each connection after this much audio (0 = never)")
+    args = parser.parse_args()
+
+    if websockets is None:
+        raise SystemExit("The mock needs the websockets package (pip install websockets).")
+    try:
+        asyncio.run(serve(MockRealtimeServer(args.delay_ms, args.drop_after_s), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
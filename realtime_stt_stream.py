@@ -1,11 +1,15 @@
 import os
 import asyncio
-import base64
+import binascii
+import time
 import numpy as np
 import sounddevice as sd
 
 from dotenv import load_dotenv
 
+from latency_trace import LatencyTrace, SttTimeline
+from vad import SpeechGate
+
 load_dotenv()
 
 from elevenlabs import (
@@ -17,29 +21,131 @@ from elevenlabs import (
 )
 
 SAMPLE_RATE = 16000
-CHUNK_MS = 200              # docs suggest streaming chunks; 100–1000ms is typical :contentReference[oaicite:2]{index=2}
+CHUNK_MS = 200              # audio per send; docs suggest streaming chunks; 100–1000ms is typical :contentReference[oaicite:2]{index=2}
+BLOCK_MS = 50               # mic callback block; CHUNK_MS / BLOCK_MS blocks are batched into one send
+QUEUE_MS = 2000             # captured audio buffered for the sender before the oldest is dropped
 CHANNELS = 1
 
 MODEL_ID = "scribe_v2_realtime"
 LANGUAGE_CODE = "he"        # or "heb"
 AUDIO_FORMAT = AudioFormat.PCM_16000
 COMMIT_STRATEGY = CommitStrategy.VAD  # automatic commit using VAD :contentReference[oaicite:3]{index=3}
+LOCAL_VAD = True            # send only speech (vad.py) and commit as soon as an utterance ends
+TRACE_PATH = None           # e.g. "stt_latency.json" or ".csv": per-stage latency written on exit
+METRICS_PORT = None         # e.g. 9464: Prometheus text at http://127.0.0.1:PORT/metrics while running
 
 
-def pcm16_b64_from_float32(audio_f32: np.ndarray) -> str:
-    """Convert float32 [-1,1] mono to PCM16LE base64."""
-    audio_f32 = np.clip(audio_f32, -1.0, 1.0)
-    pcm16 = (audio_f32 * 32767.0).astype(np.int16)
-    return base64.b64encode(pcm16.tobytes()).decode("ascii")
+class Pcm16Encoder:
+    """
+    Collects mono audio into one preallocated int16 chunk and base64-encodes
+    it for the websocket. int16 blocks (dtype="int16" capture) are copied in
+    as is; float blocks are scaled and clipped through a preallocated
+    scratch buffer. The base64 text comes from binascii reading the int16
+    buffer through a memoryview, so each send costs one bytes object and
+    one str, with no float, tobytes or intermediate copies.
+    """
 
+    def __init__(self, chunk_frames):
+        self.pcm = np.empty(chunk_frames, dtype=np.int16)
+        self._scratch = np.empty(chunk_frames, dtype=np.float32)
+        self.fill = 0
+        self.first_at = None    # capture time of the chunk's first / last sample, if given
+        self.last_at = None
 
-async def main():
-    if not os.environ.get("ELEVENLABS_API_KEY"):
-        raise RuntimeError("Set ELEVENLABS_API_KEY env var.")
+    @property
+    def full(self):
+        return self.fill == len(self.pcm)
+
+    def write(self, block, captured_at=None):
+        """
+        Copy as much of mono `block` as fits; returns the number of frames
+        taken. `captured_at` is the capture time of block[0] (for tracing).
+        """
+        n = min(len(block), len(self.pcm) - self.fill)
+        if captured_at is not None:
+            if self.fill == 0:
+                self.first_at = captured_at
+            self.last_at = captured_at + n / SAMPLE_RATE
+        dst = self.pcm[self.fill:self.fill + n]
+        if block.dtype == np.int16:
+            dst[:] = block[:n]
+        else:
+            f = np.multiply(block[:n], 32767.0, out=self._scratch[:n])
+            np.clip(f, -32767.0, 32767.0, out=f)
+            np.copyto(dst, f, casting="unsafe")
+        self.fill += n
+        return n
+
+    def take_b64(self):
+        """base64 of the collected frames; empties the chunk."""
+        text = binascii.b2a_base64(memoryview(self.pcm[:self.fill]).cast("B"), newline=False).decode("ascii")
+        self.fill = 0
+        return text
+
+
+class CaptureQueue:
+    """
+    Hands mono audio blocks from the PortAudio callback thread to the event
+    loop. The callback only copies the block and schedules the put with
+    loop.call_soon_threadsafe, so capture never blocks the loop and sends,
+    transcript events and commits run while the mic keeps recording. If the
+    sender falls behind by `maxsize` blocks the oldest block is dropped
+    (newest audio wins) and counted.
+    """
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.blocks = 0
+        self.dropped = 0
+        self.status = 0
+        self.captured_at = None     # time.monotonic() when the block from get() was queued
+
+    def _push(self, item):
+        # event-loop side
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+    def put_threadsafe(self, block):
+        """Queue `block` from any thread; the caller must not reuse it."""
+        self.blocks += 1
+        self.loop.call_soon_threadsafe(self._push, (time.monotonic(), block))
+
+    def callback(self, indata, frames, time_info, status):
+        """sounddevice InputStream callback: queue channel 0."""
+        if status:
+            self.status += 1
+        self.put_threadsafe(indata[:, 0].copy())
+
+    async def get(self):
+        self.captured_at, block = await self.queue.get()
+        return block
+
+    def report(self):
+        return f"blocks captured: {self.blocks}, dropped: {self.dropped}, device status flags: {self.status}"
 
-    elevenlabs = ElevenLabs()  # reads ELEVENLABS_API_KEY from env (SDK behavior)
 
-    config = RealtimeAudioOptions(
+async def send_chunk(connection, encoder, timeline=None):
+    if not encoder.fill:
+        return
+    first_at, last_at = encoder.first_at, encoder.last_at
+    t0 = time.monotonic()
+    b64 = encoder.take_b64()
+    t1 = time.monotonic()
+    await connection.send({
+        "audio_base_64": b64,
+        "sample_rate": SAMPLE_RATE,
+    })
+    if timeline is not None and first_at is not None:
+        timeline.trace.observe("encode", t1 - t0)
+        timeline.trace.since("send", t1)
+        timeline.chunk_sent(first_at, last_at, len(b64), t=t1)
+
+
+def realtime_config():
+    return RealtimeAudioOptions(
         model_id="scribe_v2_realtime",
         language_code="he",
         audio_format=AudioFormat.PCM_16000,
@@ -52,9 +158,9 @@ async def main():
         include_timestamps=False,
     )
 
-    connection = await elevenlabs.speech_to_text.realtime.connect(config)
 
-    # --- Event handlers (print everything useful) ---
+def attach_handlers(connection, timeline=None):
+    """Event handlers (print everything useful; stamp events on `timeline` if given)."""
     def on_error(err):
         print(f"\n[ERROR] {err}")
 
@@ -64,10 +170,14 @@ async def main():
     def on_partial(data):
         # some SDK versions pass dict-like payloads
         text = getattr(data, "text", None) or (data.get("text") if isinstance(data, dict) else "")
+        if timeline is not None:
+            timeline.partial(text)
         print(f"\r[partial] {text[:200]}   ", end="", flush=True)
 
     def on_committed(data):
         text = getattr(data, "text", None) or (data.get("text") if isinstance(data, dict) else "")
+        if timeline is not None:
+            timeline.committed(text)
         print(f"\n[committed] {text}")
 
     connection.on(RealtimeEvents.ERROR, on_error)
@@ -80,42 +190,92 @@ async def main():
     if hasattr(RealtimeEvents, "COMMITTED_TRANSCRIPT"):
         connection.on(RealtimeEvents.COMMITTED_TRANSCRIPT, on_committed)
 
+
+async def main():
+    if not os.environ.get("ELEVENLABS_API_KEY"):
+        raise RuntimeError("Set ELEVENLABS_API_KEY env var.")
+
+    elevenlabs = ElevenLabs()  # reads ELEVENLABS_API_KEY from env (SDK behavior)
+
+    trace = LatencyTrace("stt")
+    timeline = SttTimeline(trace)
+    if METRICS_PORT:
+        trace.serve_prometheus(METRICS_PORT)
+
+    connection = await elevenlabs.speech_to_text.realtime.connect(realtime_config())
+    attach_handlers(connection, timeline)
+
     # --- Mic streaming loop ---
-    frames_per_chunk = int(SAMPLE_RATE * (CHUNK_MS / 1000.0))
+    frames_per_block = int(SAMPLE_RATE * (BLOCK_MS / 1000.0))
+    encoder = Pcm16Encoder(int(SAMPLE_RATE * (CHUNK_MS / 1000.0)))
+    capture = CaptureQueue(asyncio.get_running_loop(), maxsize=max(1, QUEUE_MS // BLOCK_MS))
 
     print("Recording… speak for a few seconds. Press Ctrl+C to stop.\n")
+    gate = SpeechGate(SAMPLE_RATE) if LOCAL_VAD else None
 
     try:
         with sd.InputStream(
             samplerate=SAMPLE_RATE,
             channels=CHANNELS,
-            dtype="float32",
-            blocksize=frames_per_chunk,
-        ) as stream:
+            dtype="int16",              # PCM16 straight from PortAudio, no float round trip
+            blocksize=frames_per_block,
+            callback=capture.callback,  # capture runs on PortAudio's thread, not the event loop
+        ):
             while True:
-                audio_chunk, _ = stream.read(frames_per_chunk)
-                mono = audio_chunk[:, 0] if audio_chunk.ndim > 1 else audio_chunk
-                b64 = pcm16_b64_from_float32(mono)
+                mono = await capture.get()
+                trace.since("queue", capture.captured_at)
+                captured_at = capture.captured_at - len(mono) / SAMPLE_RATE
+                runs = [(captured_at, len(mono))]
+                if gate is not None:
+                    # silence never leaves the machine; the server's VAD
+                    # would not see it anyway, so commit on our own end of speech
+                    first = gate.samples_in
+                    mono = gate.process(mono)
+                    # pre-roll comes out with a later block: keep its own capture time
+                    runs = [(captured_at + (start - first) / SAMPLE_RATE, n) for start, n in gate.runs]
 
-                await connection.send({
-                    "audio_base_64": b64,
-                    "sample_rate": SAMPLE_RATE,
-                })
+                offset = 0
+                for captured_at, n in runs:
+                    piece = mono[offset:offset + n]
+                    offset += n
+                    while len(piece):
+                        taken = encoder.write(piece, captured_at)
+                        piece = piece[taken:]
+                        captured_at += taken / SAMPLE_RATE
+                        if encoder.full:
+                            await send_chunk(connection, encoder, timeline)
+
+                if gate is not None and gate.ended:
+                    await send_chunk(connection, encoder, timeline)
+                    timeline.end_of_speech()
+                    await connection.commit()
 
                 # With VAD commit, you usually do NOT need manual commit. :contentReference[oaicite:4]{index=4}
                 # If you want to force a commit occasionally, uncomment:
                 # await connection.commit()
 
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("\nStopping… committing final segment.")
         try:
+            await send_chunk(connection, encoder, timeline)
+            timeline.end_of_speech()
             await connection.commit()
         except Exception:
             pass
 
+    print(capture.report().capitalize() + ".")
+    if gate is not None and gate.samples_in:
+        print(f"Sent {gate.samples_out / SAMPLE_RATE:.1f} s of {gate.samples_in / SAMPLE_RATE:.1f} s captured "
+              f"({100.0 * gate.samples_out / gate.samples_in:.0f}%).")
+
     # Give server a moment to flush final events
     await asyncio.sleep(0.5)
 
+    trace.print_summary()
+    if TRACE_PATH:
+        trace.write(TRACE_PATH)
+        print(f"Latency trace written to {TRACE_PATH}")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Single-producer / single-consumer audio ring buffer.
+
+Storage is one preallocated (capacity, channels) float32 array. The
+producer only ever advances `_write` and the consumer only `_read`; both
+are plain ints that grow forever, so no lock is needed as long as exactly
+one thread writes and one thread reads (CPython publishes the int store
+after the array copy that precedes it). Neither side allocates.
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, capacity, channels=1, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self._buf = np.zeros((self.capacity, channels), dtype=dtype)
+        self._write = 0   # total frames ever written (producer-owned)
+        self._read = 0    # total frames ever read (consumer-owned)
+
+    @property
+    def readable(self):
+        """Frames available to the consumer."""
+        return self._write - self._read
+
+    @property
+    def writable(self):
+        """Free space available to the producer."""
+        return self.capacity - (self._write - self._read)
+
+    def write(self, data):
+        """
+        Producer side: copy up to len(data) frames in. Returns the number of
+        frames written (short if the buffer is full).
+        """
+        data = data.reshape(len(data), self.channels)
+        n = min(len(data), self.writable)
+        start = self._write % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = data[:first]
+        self._buf[:n - first] = data[first:n]
+        self._write += n
+        return n
+
+    def write_silence(self, frames):
+        """Producer side: append `frames` zero frames (e.g. to prefill latency)."""
+        n = min(frames, self.writable)
+        start = self._write % self.capacity
+        first = min(n, self.capacity - start)
+        self._buf[start:start + first] = 0
+        self._buf[:n - first] = 0
+        self._write += n
+        return n
+
+    def read_into(self, out):
+        """
+        Consumer side: fill `out` (frames[, channels]) with up to len(out)
+        frames. Returns the number of frames read (short on underrun; the
+        rest of `out` is left untouched).
+        """
+        out = out.reshape(len(out), self.channels)
+        n = min(len(out), self.readable)
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self._buf[start:start + first]
+        out[first:n] = self._buf[:n - first]
+        self._read += n
+        return n
+
+    def clear(self):
+        """Consumer side: drop everything currently buffered."""
+        self._read = self._write
@@ -0,0 +1,577 @@
+"""
+Many audio sources -> a bounded pool of realtime STT connections.
+
+Each source (a WAV file or a local TCP client streaming raw PCM16 mono at
+16 kHz) becomes a session with its own bounded chunk queue. Sessions
+borrow a realtime connection from the pool for their lifetime and return
+it afterwards, so the next session skips the connect handshake. Events
+belong to the lease they arrive under: a session keeps its connection
+until it has been quiet for SETTLE_S after the final transcript, and
+anything arriving after the lease ends is dropped before the connection
+is reused, so it never reaches the next session. When a
+connection drops, the session backs off, takes a new connection and
+resumes: the audio sent since its last committed transcript is kept and
+re-sent, so a segment is not lost. Per-session and total metrics are
+printed at the end (and periodically in --listen mode).
+
+Backends: the ElevenLabs SDK (default, needs ELEVENLABS_API_KEY and the
+realtime_stt_stream.py dependencies) or mock_realtime_server.py via --mock
+for offline load tests.
+
+Usage:
+  python mock_realtime_server.py &
+  python stt_gateway.py --mock ws://127.0.0.1:8765 --wav test.wav --repeat 50 --speed 4 --quiet
+  python stt_gateway.py --wav "recordings/*.wav" --connections 8 --metrics-json gw.json
+  python stt_gateway.py --listen 9000          # clients send PCM16, get JSON lines back
+"""
+
+import argparse
+import asyncio
+import binascii
+import glob
+import json
+import os
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+# =======================
+# CONFIG
+# =======================
+SAMPLE_RATE = 16000
+CHUNK_MS = 200              # audio per send
+POOL_SIZE = 4               # concurrent realtime connections
+SESSION_QUEUE_CHUNKS = 25   # per-session buffer between source and sender (5 s)
+RESUME_MAX_MS = 30000       # audio kept for resend after a reconnect
+RESUME_OVERLAP_MS = 500     # kept even after a commit (server-side commits may not cover in-flight chunks)
+MAX_RECONNECTS = 5          # reconnects without a committed transcript before a session fails
+BACKOFF_S = 0.25            # first reconnect delay, doubled per attempt
+BACKOFF_MAX_S = 5.0
+FINAL_TIMEOUT_S = 10.0      # wait for the last committed transcript
+SETTLE_S = 0.5              # quiet time before a returned connection is reused (late events are dropped)
+REPORT_S = 5.0              # progress line interval (--listen)
+EVENTS = ("partial_transcript", "committed_transcript", "error", "close")
+SESSION_STATS = ("audio_s", "chunks", "replayed", "reconnects", "partials", "commits", "errors")
+
+
+# =======================
+# BACKENDS
+# =======================
+def elevenlabs_connector():
+    from elevenlabs import ElevenLabs, RealtimeEvents
+    from realtime_stt_stream import realtime_config
+
+    client = ElevenLabs()  # reads ELEVENLABS_API_KEY from env (SDK behavior)
+
+    async def connect(handlers):
+        connection = await client.speech_to_text.realtime.connect(realtime_config())
+        for kind, fn in handlers.items():
+            event = getattr(RealtimeEvents, kind.upper(), None)
+            if event is not None:
+                connection.on(event, fn)
+        return connection
+
+    return connect
+
+
+def mock_connector(url):
+    from mock_realtime_server import MockConnection
+
+    async def connect(handlers):
+        connection = await MockConnection.connect(url)
+        for kind, fn in handlers.items():
+            connection.on(kind, fn)
+        return connection
+
+    return connect
+
+
+def event_text(data):
+    # some SDK versions pass dict-like payloads
+    return getattr(data, "text", None) or (data.get("text") if isinstance(data, dict) else "") or ""
+
+
+# =======================
+# CONNECTION POOL
+# =======================
+class Upstream:
+    """
+    One realtime connection, leased to one session at a time. Events go to
+    the session holding the current lease; between leases they are stale
+    (counted and dropped).
+    """
+
+    def __init__(self, connector):
+        self.connector = connector
+        self.connection = None
+        self.owner = None
+        self.lease = 0
+        self.alive = False
+        self.closed = asyncio.Event()
+        self.last_event_at = time.monotonic()
+        self.stale = 0
+
+    async def open(self):
+        handlers = {kind: (lambda *args, kind=kind: self._event(kind, *args)) for kind in EVENTS}
+        self.connection = await self.connector(handlers)
+        self.alive = True
+
+    def _event(self, kind, *args):
+        self.last_event_at = time.monotonic()
+        if kind == "close":
+            self.alive = False
+            self.closed.set()
+        if self.owner is not None:
+            self.owner.on_event(kind, args[0] if args else None)
+        elif kind != "close":
+            self.stale += 1
+
+    def lend(self, owner):
+        self.owner = owner
+        self.lease += 1
+
+    def take_back(self):
+        self.owner = None
+
+    async def quiet(self, seconds):
+        """Wait until no event has arrived for `seconds` (or the connection closed)."""
+        while self.alive:
+            left = seconds - (time.monotonic() - self.last_event_at)
+            if left <= 0.0:
+                return
+            await asyncio.sleep(left)
+
+    async def send(self, b64):
+        try:
+            await self.connection.send({"audio_base_64": b64, "sample_rate": SAMPLE_RATE})
+        except Exception:
+            self.alive = False
+            raise
+
+    async def commit(self):
+        try:
+            await self.connection.commit()
+        except Exception:
+            self.alive = False
+            raise
+
+    async def close(self):
+        self.alive = False
+        close = getattr(self.connection, "close", None)
+        try:
+            result = close() if close else None
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """At most `size` connections in use; idle healthy ones are reused."""
+
+    def __init__(self, connector, size=POOL_SIZE, settle_s=SETTLE_S):
+        self.connector = connector
+        self.size = size
+        self.settle_s = settle_s
+        self.slots = asyncio.Semaphore(size)
+        self.idle = []
+        self.settling = set()
+        self.opened = 0
+        self.reused = 0
+        self.stale_events = 0
+
+    async def acquire(self, owner):
+        await self.slots.acquire()
+        try:
+            while self.idle:
+                upstream = self.idle.pop()
+                if upstream.alive:
+                    self.reused += 1
+                    break
+                await upstream.close()
+            else:
+                upstream = Upstream(self.connector)
+                await upstream.open()
+                self.opened += 1
+        except BaseException:
+            self.slots.release()
+            raise
+        upstream.lend(owner)
+        return upstream
+
+    async def release(self, upstream, reuse=True):
+        upstream.take_back()
+        if reuse and upstream.alive:
+            # keeps its slot until settled, so the pool never exceeds `size` connections
+            task = asyncio.ensure_future(self._settle(upstream))
+            self.settling.add(task)
+            task.add_done_callback(self.settling.discard)
+            return
+        await upstream.close()
+        self.slots.release()
+
+    async def _settle(self, upstream):
+        """Idle `upstream` once no event has arrived for settle_s (e.g. a VAD commit racing the final one)."""
+        try:
+            await upstream.quiet(self.settle_s)
+            self.stale_events += upstream.stale
+            upstream.stale = 0
+            if upstream.alive:
+                self.idle.append(upstream)
+            else:
+                await upstream.close()
+        finally:
+            self.slots.release()
+
+    async def close(self):
+        await asyncio.gather(*self.settling, return_exceptions=True)
+        while self.idle:
+            upstream = self.idle.pop()
+            self.stale_events += upstream.stale
+            await upstream.close()
+
+
+# =======================
+# SOURCES
+# =======================
+def _wav_pcm16(path, frames):
+    """PCM16 mono SAMPLE_RATE bytes from any PCM16 WAV, `frames` per chunk."""
+    with wave.open(str(path), "rb") as wf:
+        native = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) == (SAMPLE_RATE, 1, 2)
+        if native:
+            while True:
+                raw = wf.readframes(frames)
+                if not raw:
+                    return
+                yield raw
+
+    import live_voice_enhancer as lve
+
+    pending = bytearray()
+    resampler = None
+    for chunk, rate in lve.read_wav_chunks(path, frames * 4):
+        if rate != SAMPLE_RATE:
+            resampler = resampler or lve.Resampler(rate, SAMPLE_RATE)
+            chunk = resampler.process(chunk)
+        pending += (np.clip(chunk, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+        while len(pending) >= 2 * frames:
+            yield bytes(pending[:2 * frames])
+            del pending[:2 * frames]
+    if resampler is not None:
+        pending += (np.clip(resampler.flush(), -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+    for start in range(0, len(pending), 2 * frames):
+        yield bytes(pending[start:start + 2 * frames])
+
+
+async def wav_source(path, chunk_ms=CHUNK_MS, speed=1.0):
+    """A WAV file paced at `speed` x real time (0 = as fast as the sender takes it)."""
+    start = time.monotonic()
+    sent_s = 0.0
+    for chunk in _wav_pcm16(path, int(SAMPLE_RATE * chunk_ms / 1000.0)):
+        yield chunk
+        sent_s += len(chunk) / 2.0 / SAMPLE_RATE
+        wait = start + sent_s / speed - time.monotonic() if speed > 0 else 0.0
+        await asyncio.sleep(max(wait, 0.0))
+
+
+async def socket_source(reader, chunk_ms=CHUNK_MS):
+    """Raw PCM16 mono SAMPLE_RATE from a stream reader until EOF."""
+    size = 2 * int(SAMPLE_RATE * chunk_ms / 1000.0)
+    while True:
+        try:
+            yield await reader.readexactly(size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                yield e.partial[:len(e.partial) // 2 * 2]
+            return
+
+
+# =======================
+# SESSIONS
+# =======================
+class Session:
+    def __init__(self, name, source, on_transcript=None):
+        self.name = name
+        self.source = source
+        self.on_transcript = on_transcript
+        self.queue = asyncio.Queue(maxsize=SESSION_QUEUE_CHUNKS)
+        self.replay = deque()           # (b64, ms) sent since the last commit
+        self.replay_ms = 0.0
+        self.final = asyncio.Event()
+        self.commit_sent_at = None
+        self.started_at = None
+        self.transcripts = []
+        self.error = None
+        self.failures = 0               # reconnects since the last committed transcript
+        self.first_partial_s = None
+        self.commit_latency_s = []
+        self.stats = dict.fromkeys(SESSION_STATS, 0)
+
+    def remember(self, b64, ms):
+        self.replay.append((b64, ms))
+        self.replay_ms += ms
+        while self.replay_ms > RESUME_MAX_MS and len(self.replay) > 1:
+            self.replay_ms -= self.replay.popleft()[1]
+
+    def _forget_committed(self):
+        while self.replay and self.replay_ms - self.replay[0][1] >= RESUME_OVERLAP_MS:
+            self.replay_ms -= self.replay.popleft()[1]
+
+    def on_event(self, kind, data):
+        now = time.monotonic()
+        if kind == "partial_transcript":
+            self.stats["partials"] += 1
+            if self.first_partial_s is None and self.started_at is not None:
+                self.first_partial_s = now - self.started_at
+        elif kind == "committed_transcript":
+            self.stats["commits"] += 1
+            self.failures = 0
+            self._forget_committed()
+            if self.commit_sent_at is not None:
+                self.commit_latency_s.append(now - self.commit_sent_at)
+                self.commit_sent_at = None
+                self.final.set()
+            text = event_text(data)
+            if text:
+                self.transcripts.append(text)
+                if self.on_transcript is not None:
+                    self.on_transcript(self, text)
+        elif kind == "error":
+            self.stats["errors"] += 1
+
+
+# =======================
+# GATEWAY
+# =======================
+def _percentiles(values):
+    if not values:
+        return None
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": float(p50), "p95": float(p95), "max": float(np.max(values)), "n": len(values)}
+
+
+class Gateway:
+    def __init__(self, connector, connections=POOL_SIZE):
+        self.pool = ConnectionPool(connector, connections)
+        self.sessions = []
+        self.started = time.monotonic()
+
+    async def _feed(self, session):
+        try:
+            async for chunk in session.source:
+                await session.queue.put(chunk)      # a slow sender slows the source down
+        except Exception as e:
+            session.error = f"source: {e}"
+        finally:
+            await session.queue.put(None)
+
+    async def _reconnect(self, session, upstream):
+        await self.pool.release(upstream, reuse=False)
+        while session.failures < MAX_RECONNECTS:
+            await asyncio.sleep(min(BACKOFF_MAX_S, BACKOFF_S * 2 ** session.failures))
+            session.failures += 1
+            try:
+                upstream = await self.pool.acquire(session)
+            except Exception:
+                continue
+            session.stats["reconnects"] += 1
+            try:
+                # resume: the new connection gets the uncommitted audio again
+                for b64, _ in list(session.replay):
+                    await upstream.send(b64)
+                    session.stats["replayed"] += 1
+                return upstream
+            except Exception:
+                await self.pool.release(upstream, reuse=False)
+        raise ConnectionError(f"gave up after {MAX_RECONNECTS} reconnects without a commit")
+
+    async def _send(self, session, upstream, b64):
+        if upstream.alive:
+            try:
+                await upstream.send(b64)
+                return upstream
+            except Exception:
+                pass
+        return await self._reconnect(session, upstream)     # resends b64 with the rest
+
+    async def _finish(self, session, upstream):
+        while True:     # _reconnect raises once the session is out of retries
+            if upstream.alive:
+                session.final.clear()
+                session.commit_sent_at = time.monotonic()
+                try:
+                    await upstream.commit()
+                    waits = [asyncio.ensure_future(session.final.wait()),
+                             asyncio.ensure_future(upstream.closed.wait())]
+                    _, pending = await asyncio.wait(waits, timeout=FINAL_TIMEOUT_S,
+                                                    return_when=asyncio.FIRST_COMPLETED)
+                    for task in pending:
+                        task.cancel()
+                except Exception:
+                    pass
+                if session.final.is_set():
+                    # a VAD commit can answer first; the rest of this session's events still count for it
+                    await upstream.quiet(self.pool.settle_s)
+                    return upstream
+                if upstream.alive:
+                    raise TimeoutError("no committed transcript after the final commit")
+            upstream = await self._reconnect(session, upstream)
+
+    async def run_session(self, session):
+        self.sessions.append(session)
+        feeder = asyncio.create_task(self._feed(session))
+        upstream = None
+        try:
+            upstream = await self.pool.acquire(session)
+            session.started_at = time.monotonic()
+            while True:
+                chunk = await session.queue.get()
+                if chunk is None:
+                    break
+                ms = 1000.0 * len(chunk) / 2.0 / SAMPLE_RATE
+                session.stats["chunks"] += 1
+                session.stats["audio_s"] += ms / 1000.0
+                b64 = binascii.b2a_base64(chunk, newline=False).decode("ascii")
+                session.remember(b64, ms)
+                upstream = await self._send(session, upstream, b64)
+            upstream = await self._finish(session, upstream)
+        except Exception as e:
+            session.error = session.error or str(e) or type(e).__name__
+        finally:
+            feeder.cancel()
+            if upstream is not None:
+                await self.pool.release(upstream, reuse=session.error is None)
+        return session
+
+    async def listen(self, host, port, chunk_ms=CHUNK_MS, quiet=False):
+        """Serve TCP clients: raw PCM16 in, one JSON line per committed transcript out."""
+        async def handle(reader, writer):
+            peer = writer.get_extra_info("peername")
+
+            def reply(session, text):
+                writer.write((json.dumps({"text": text}, ensure_ascii=False) + "\n").encode("utf-8"))
+                if not quiet:
+                    print(f"[{session.name}] {text}")
+
+            session = Session(f"{peer[0]}:{peer[1]}" if peer else "client",
+                              socket_source(reader, chunk_ms), on_transcript=reply)
+            await self.run_session(session)
+            try:
+                await writer.drain()
+                writer.close()
+            except ConnectionError:
+                pass
+
+        server = await asyncio.start_server(handle, host, port)
+        print(f"Gateway listening on {host}:{port} ({self.pool.size} connections)")
+        async with server:
+            while True:
+                await asyncio.sleep(REPORT_S)
+                print(self.report_line())
+
+    def summary(self):
+        done = [s for s in self.sessions if s.started_at is not None]
+        total = {k: sum(s.stats[k] for s in self.sessions) for k in SESSION_STATS}
+        wall_s = time.monotonic() - self.started
+        return {
+            "sessions": len(self.sessions),
+            "failed": sum(1 for s in self.sessions if s.error),
+            "wall_s": wall_s,
+            "audio_per_wall_s": total["audio_s"] / wall_s if wall_s > 0 else 0.0,
+            "connections_opened": self.pool.opened,
+            "connections_reused": self.pool.reused,
+            "stale_events": self.pool.stale_events,
+            **total,
+            "first_partial_s": _percentiles([s.first_partial_s for s in done if s.first_partial_s is not None]),
+            "commit_latency_s": _percentiles([t for s in done for t in s.commit_latency_s]),
+            "per_session": [{"name": s.name, "error": s.error, "transcript": " ".join(s.transcripts),
+                             "first_partial_s": s.first_partial_s, **s.stats} for s in self.sessions],
+        }
+
+    def report_line(self):
+        m = self.summary()
+        lat = m["commit_latency_s"]
+        return (f"sessions {m['sessions']} (failed {m['failed']}), audio {m['audio_s']:.1f} s "
+                f"({m['audio_per_wall_s']:.1f}x real time), reconnects {m['reconnects']}, "
+                f"commits {m['commits']}" + (f", commit p50 {1000 * lat['p50']:.0f} ms" if lat else ""))
+
+
+def print_summary(m):
+    print(f"\nSessions: {m['sessions']} ({m['failed']} failed), wall {m['wall_s']:.1f} s")
+    print(f"Audio sent: {m['audio_s']:.1f} s in {m['chunks']} chunks "
+          f"({m['audio_per_wall_s']:.1f}x real time), replayed {m['replayed']} chunks")
+    print(f"Connections: opened {m['connections_opened']}, reused {m['connections_reused']}, "
+          f"reconnects {m['reconnects']}, {m['stale_events']} late event(s) dropped between sessions")
+    print(f"Events: {m['partials']} partial, {m['commits']} committed, {m['errors']} errors")
+    for key, label in (("first_partial_s", "first partial"), ("commit_latency_s", "commit -> transcript")):
+        p = m[key]
+        if p:
+            print(f"{label:<22} p50 {1000 * p['p50']:7.1f} ms   p95 {1000 * p['p95']:7.1f} ms   "
+                  f"max {1000 * p['max']:7.1f} ms   (n={p['n']})")
+    for s in m["per_session"]:
+        if s["error"]:
+            print(f"[{s['name']}] FAILED: {s['error']}")
+
+
+# =======================
+# MAIN
+# =======================
+async def run_files(gateway, paths, repeat, chunk_ms, speed, quiet):
+    def show(session, text):
+        if not quiet:
+            print(f"[{session.name}] {text}")
+
+    sessions = [Session(f"{os.path.basename(p)}#{k}" if repeat > 1 else os.path.basename(p),
+                        wav_source(p, chunk_ms, speed), on_transcript=show)
+                for k in range(repeat) for p in paths]
+    try:
+        await asyncio.gather(*(gateway.run_session(s) for s in sessions))
+    finally:
+        await gateway.pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multiplex audio sources over a pool of realtime STT connections.")
+    parser.add_argument("--wav", nargs="+", help="WAV files or globs, one session each")
+    parser.add_argument("--repeat", type=int, default=1, help="sessions per WAV (load testing)")
+    parser.add_argument("--speed", type=float, default=1.0, help="WAV pacing, x real time (0 = unpaced)")
+    parser.add_argument("--listen", type=int, metavar="PORT", help="accept raw PCM16 clients on this TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--connections", type=int, default=POOL_SIZE)
+    parser.add_argument("--chunk-ms", type=int, default=CHUNK_MS)
+    parser.add_argument("--mock", metavar="URL", help="use mock_realtime_server.py at this ws:// URL")
+    parser.add_argument("--metrics-json", help="write the final metrics here")
+    parser.add_argument("--quiet", action="store_true", help="do not print transcripts")
+    args = parser.parse_args()
+
+    if args.mock:
+        connector = mock_connector(args.mock)
+    else:
+        if not os.environ.get("ELEVENLABS_API_KEY"):
+            raise SystemExit("Set ELEVENLABS_API_KEY env var (or use --mock).")
+        connector = elevenlabs_connector()
+    gateway = Gateway(connector, args.connections)
+
+    try:
+        if args.listen:
+            asyncio.run(gateway.listen(args.host, args.listen, args.chunk_ms, args.quiet))
+        else:
+            paths = sorted(p for pattern in (args.wav or []) for p in (glob.glob(pattern) or [pattern]))
+            if not paths:
+                raise SystemExit("Nothing to do: give --wav files or --listen PORT.")
+            asyncio.run(run_files(gateway, paths, args.repeat, args.chunk_ms, args.speed, args.quiet))
+    except KeyboardInterrupt:
+        pass
+
+    metrics = gateway.summary()
+    print_summary(metrics)
+    if args.metrics_json:
+        with open(args.metrics_json, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2, ensure_ascii=False)
+        print(f"Wrote {args.metrics_json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,29 @@
 import queue
-import sys
 import threading
-import time
 
 import numpy as np
 import sounddevice as sd
 import whisper
 import pyttsx3
 
+from vad import SpeechGate
+from whisper_server import WhisperClient
+
 # ============= CONFIG =============
 SAMPLE_RATE = 16000
 CHANNELS = 1
-RECORD_SECONDS = 4.0      # length of each utterance
+RECORD_SECONDS = 4.0      # length of each utterance (when USE_VAD is off)
+USE_VAD = False           # True: record until you stop talking, send only the speech to Whisper
+MAX_RECORD_SECONDS = 15.0 # upper bound on one utterance with USE_VAD
+NO_SPEECH_SECONDS = 5.0   # give up if nothing is said for this long
+VAD_CHUNK_MS = 100        # mic read size while listening
 MODEL_NAME = "base"       # "tiny", "base", "small", etc.
 LANGUAGE = "en"           # or None for auto-detect
+WHISPER_SERVER = "http://127.0.0.1:8770"  # whisper_server.py, if running; else the model loads here (None = always)
+STREAMING = False         # True: hands-free, transcribe while you talk, speak replies in the background
+STREAM_STEP_S = 0.5       # new speech between two partial transcriptions
+STREAM_MIN_S = 0.5        # speech needed before the first partial
+LISTEN_WHILE_SPEAKING = False # mic ignored while the TTS talks (no echo loop); True only with headphones
 # ==================================
 
 
@@ -34,11 +44,194 @@ def record_audio(duration=RECORD_SECONDS, samplerate=SAMPLE_RATE, channels=CHANN
     return audio
 
 
-def main():
+def record_utterance(max_seconds=MAX_RECORD_SECONDS, samplerate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Listen until one utterance has been spoken and ended (VAD hangover),
+    and return only its speech as float32 (empty if nothing was said).
+    """
+    print("\nListening... Speak now.")
+    gate = SpeechGate(samplerate)
+    chunk = int(samplerate * VAD_CHUNK_MS / 1000)
+    parts = []
+    with sd.InputStream(samplerate=samplerate, channels=channels, dtype="float32", blocksize=chunk) as stream:
+        while gate.samples_in < max_seconds * samplerate:
+            audio, _ = stream.read(chunk)
+            parts.append(gate.process(audio[:, 0]))
+            if gate.ended:
+                break
+            if not gate.samples_out and gate.samples_in >= NO_SPEECH_SECONDS * samplerate:
+                break
+    speech = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+    print(f"Recording finished ({len(speech) / samplerate:.1f} s of speech).")
+    return speech
+
+
+def load_transcriber():
+    """
+    Return transcribe(audio) -> text. Uses the shared whisper_server.py
+    model when one is running MODEL_NAME (no load time, no extra RAM),
+    otherwise loads MODEL_NAME in this process.
+    """
+    server = WhisperClient(WHISPER_SERVER) if WHISPER_SERVER else None
+    served = server.model_name() if server is not None else None
+    if served == MODEL_NAME:
+        print(f"Using Whisper server at {WHISPER_SERVER} ({served})")
+        return lambda audio: server.transcribe(audio, language=LANGUAGE)["text"]
+    if served is not None:
+        print(f"Whisper server at {WHISPER_SERVER} runs {served}, not {MODEL_NAME}; loading it here.")
+
     print("Loading Whisper model (this may take a bit the first time)...")
     model = whisper.load_model(MODEL_NAME)
     print(f"Loaded model: {MODEL_NAME}")
 
+    def transcribe(audio):
+        # Whisper expects 16 kHz float32 numpy array
+        # If you want, you can use options like 'language=LANGUAGE' or 'task="translate"'
+        result = model.transcribe(
+            audio,
+            fp16=False,  # set True if you have GPU with half-precision support
+            language=LANGUAGE,
+        )
+        return result.get("text", "")
+
+    return transcribe
+
+
+def _word_key(word):
+    return word.strip(".,!?;:\"'-\u2026").lower()
+
+
+class LocalAgreement:
+    """
+    LocalAgreement-2 over successive transcripts of a growing utterance:
+    a word is confirmed once two consecutive hypotheses agree on it and on
+    everything before it. Confirmed words are never taken back.
+    """
+
+    def __init__(self):
+        self.confirmed = []
+        self._previous = []
+
+    def update(self, text):
+        """Feed a new hypothesis; returns the newly confirmed words."""
+        words = text.split()
+        n = len(self.confirmed)
+        new = []
+        for a, b in zip(self._previous[n:], words[n:]):
+            if _word_key(a) != _word_key(b):
+                break
+            new.append(b)
+        self.confirmed += new
+        self._previous = words
+        return new
+
+    def finish(self, text):
+        """Final hypothesis at end of speech: accept the rest. Returns (rest, full text) and resets."""
+        rest = text.split()[len(self.confirmed):]
+        full = " ".join(self.confirmed + rest)
+        self.confirmed, self._previous = [], []
+        return rest, full
+
+
+class Speaker(threading.Thread):
+    """pyttsx3 on its own thread (the engine must run where it was created); say() never blocks."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.texts = queue.Queue()
+        self.speaking = threading.Event()   # set from say() until the last queued reply has played
+        self._pending = 0                   # replies queued or playing
+        self._lock = threading.Lock()
+        self.start()
+
+    def say(self, text):
+        with self._lock:
+            self._pending += 1
+            self.speaking.set()
+        self.texts.put(text)
+
+    def run(self):
+        tts_engine = pyttsx3.init()
+        while True:
+            text = self.texts.get()
+            try:
+                tts_engine.say(text)
+                tts_engine.runAndWait()
+            finally:
+                # counted under the lock, so a say() racing this reply keeps the mic muted
+                with self._lock:
+                    self._pending -= 1
+                    if not self._pending:
+                        self.speaking.clear()
+
+
+def stream_loop(transcribe, samplerate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Hands-free loop. The mic is captured continuously in a callback. The
+    speech so far is re-transcribed every STREAM_STEP_S, and words print as
+    soon as two passes agree on them. At end of speech (VAD hangover) the
+    last pass completes the utterance and goes to the Speaker thread, while
+    listening for the next one carries on (mic blocks are dropped while it
+    speaks, unless LISTEN_WHILE_SPEAKING).
+    """
+    speaker = Speaker()
+    blocks = queue.Queue()
+
+    def callback(indata, frames, time_info, status):
+        if LISTEN_WHILE_SPEAKING or not speaker.speaking.is_set():
+            blocks.put(indata[:, 0].copy())
+
+    gate = SpeechGate(samplerate)
+    agreement = LocalAgreement()
+    utterance = []
+    n = transcribed = 0
+
+    shown = False
+
+    def show(words, end=""):
+        nonlocal shown
+        if words:
+            print(("" if shown else "> ") + " ".join(words), end=" ", flush=True)
+            shown = True
+        if end and shown:
+            print(end=end, flush=True)
+            shown = False
+
+    print("\nStreaming STT → TTS. Just speak; Ctrl+C to quit.\n")
+    chunk = int(samplerate * VAD_CHUNK_MS / 1000)
+    with sd.InputStream(samplerate=samplerate, channels=channels, dtype="float32", blocksize=chunk,
+                        callback=callback):
+        while True:
+            # everything captured while the last pass ran, up to an end of speech
+            parts = [gate.process(blocks.get())]
+            while not gate.ended:
+                try:
+                    parts.append(gate.process(blocks.get_nowait()))
+                except queue.Empty:
+                    break
+            ended = gate.ended
+            utterance += [p for p in parts if len(p)]
+            n += sum(len(p) for p in parts)
+            if not n:
+                continue
+
+            if ended or n >= MAX_RECORD_SECONDS * samplerate:
+                rest, text = agreement.finish(transcribe(np.concatenate(utterance)).strip())
+                show(rest, end="\n")
+                if text:
+                    speaker.say(text)
+                utterance, n, transcribed = [], 0, 0
+            elif n >= STREAM_MIN_S * samplerate and n - transcribed >= STREAM_STEP_S * samplerate:
+                transcribed = n
+                show(agreement.update(transcribe(np.concatenate(utterance))))
+
+
+def main():
+    transcribe = load_transcriber()
+    if STREAMING:
+        stream_loop(transcribe)
+        return
+
     # Init TTS
     tts_engine = pyttsx3.init()
     # You can tweak voice/rate here:
@@ -56,19 +249,14 @@ def main():
             break
 
         # 1) Record
-        audio = record_audio()
+        audio = record_utterance() if USE_VAD else record_audio()
+        if not len(audio):
+            print("Didn't catch anything.")
+            continue
 
         # 2) Run Whisper STT
         print("Transcribing...")
-        # Whisper expects 16 kHz float32 numpy array
-        # If you want, you can use options like 'language=LANGUAGE' or 'task="translate"'
-        result = model.transcribe(
-            audio,
-            fp16=False,  # set True if you have GPU with half-precision support
-            language=LANGUAGE,
-        )
-
-        text = result.get("text", "").strip()
+        text = transcribe(audio).strip()
         if not text:
             print("Didn't catch anything.")
             continue
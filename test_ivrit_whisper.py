@@ -1,42 +1,265 @@
-from faster_whisper import WhisperModel
+"""
+Hebrew transcription with faster-whisper (ivrit-ai large-v3), from one
+file up to backlogs of thousands.
+
+One WhisperModel is shared by a pool of transcription threads
+(num_workers), each with --cpu-threads. Decoding and resampling run ahead
+of the model in separate threads, with at most --prefetch files held in
+memory. Segments are written to a JSONL file as soon as they are
+decoded, one line per segment plus a closing line per file. --resume
+appends instead of overwriting and skips files that already finished
+without an error; lines of unfinished or failed files are dropped first,
+so a retried file is not listed twice.
+
+When whisper_server.py is running --model, its already-loaded model is
+used and nothing is loaded here (--local forces the in-process model).
+Files are still decoded and prefetched here and sent as samples.
+
+Usage:
+  python test_ivrit_whisper.py                       # test.wav, segments printed
+  python test_ivrit_whisper.py recordings/ "archive/**/*.wav" -o out.jsonl --workers 4
+  python test_ivrit_whisper.py backlog/ -o out.jsonl --resume
+"""
+
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+from faster_whisper import WhisperModel, decode_audio
+
+from whisper_server import WhisperClient
 
 # You can use "cpu" or "cuda" depending on your machine.
 # For CPU-only, int8 is much faster and uses less RAM.
 DEVICE = "cpu"      # or "cuda"
 COMPUTE_TYPE = "int8"  # "float16" if you have GPU, or "float32" if needed
+MODEL_NAME = "ivrit-ai/whisper-large-v3-ct2"
+WHISPER_SERVER = "http://127.0.0.1:8770"  # reuse whisper_server.py's loaded model when it is running
+DEFAULT_INPUT = "test.wav"
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".opus", ".m4a")
+SAMPLE_RATE = 16000
+CPU_COUNT = os.cpu_count() or 1
+TRANSCRIBE_OPTIONS = dict(
+    language="he",        # force Hebrew
+    beam_size=5,
+    vad_filter=True,      # use built-in VAD
+    vad_parameters=dict(min_silence_duration_ms=500),
+)
+
+
+def find_audio(inputs):
+    """Files, directories (searched recursively) and globs -> sorted unique audio paths."""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                found.update(os.path.join(root, n) for n in names if n.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            found.update(p for p in (glob.glob(item, recursive=True) or [item]) if os.path.isfile(p))
+    return sorted(found)
+
+
+def finished_files(path):
+    """
+    Files with a successful closing line in an existing JSONL output. The
+    output is rewritten without the lines of every other file (segments of
+    files that failed or were cut off), since those files are redone.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue    # half-written last line of an interrupted run
+            records.append((record, line if line.endswith("\n") else line + "\n"))
+            if record.get("done") and "error" not in record:    # failed files are retried
+                done.add(record["file"])
+    kept = [line for record, line in records if record.get("file") in done]
+    if len(kept) < len(records):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(tmp, path)
+    return done
+
+
+class JsonlWriter:
+    """Thread-safe JSONL appender; every record is flushed (a crash loses at most one line)."""
+
+    def __init__(self, path, append):
+        self.f = open(path, "a" if append else "w", encoding="utf-8") if path else None
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        if self.f is None:
+            return
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.f.write(line)
+            self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+
+
+def run_batch(files, transcribe, decode, workers, decode_workers, prefetch, writer, verbose):
+    """
+    decode threads -> bounded queue -> transcribe threads. `decode(path)`
+    returns what `transcribe` takes; `transcribe(audio)` returns
+    (language, duration_s, iterable of (start, end, text)).
+    """
+    paths = queue.Queue()
+    for path in files:
+        paths.put(path)
+    decoded = queue.Queue(maxsize=prefetch)
+    print_lock = threading.Lock()
+    stats = {"files": 0, "errors": 0, "audio_s": 0.0}
+
+    def decoder():
+        while True:
+            try:
+                path = paths.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                decoded.put((path, decode(path), None))
+            except Exception as e:
+                decoded.put((path, None, e))
+
+    def transcriber():
+        while True:
+            item = decoded.get()
+            if item is None:
+                return
+            path, audio, error = item
+            t0 = time.monotonic()
+            try:
+                if error is not None:
+                    raise error
+                language, duration, segments = transcribe(audio)
+                texts = []
+                for start, end, text in segments:
+                    writer.write({"file": path, "start": round(start, 2), "end": round(end, 2), "text": text})
+                    texts.append(text)
+                    if verbose:
+                        print(f"[{start:6.2f} - {end:6.2f}] {text}")
+                elapsed = time.monotonic() - t0
+                writer.write({"file": path, "done": True, "language": language, "duration_s": duration,
+                              "elapsed_s": round(elapsed, 2), "text": "".join(texts).strip()})
+                with print_lock:
+                    stats["files"] += 1
+                    stats["audio_s"] += duration
+                    if verbose:
+                        print("\nFull text:")
+                        print("".join(texts))
+                    else:
+                        print(f"[{stats['files'] + stats['errors']}/{len(files)}] {path}: {duration:.1f} s audio "
+                              f"in {elapsed:.1f} s")
+            except Exception as e:
+                message = str(e) or type(e).__name__
+                writer.write({"file": path, "done": True, "error": message})
+                with print_lock:
+                    stats["errors"] += 1
+                    print(f"[{stats['files'] + stats['errors']}/{len(files)}] {path}: ERROR {message}")
+
+    decoders = [threading.Thread(target=decoder, daemon=True) for _ in range(decode_workers)]
+    transcribers = [threading.Thread(target=transcriber, daemon=True) for _ in range(workers)]
+    for t in decoders + transcribers:
+        t.start()
+    for t in decoders:
+        t.join()
+    for _ in transcribers:
+        decoded.put(None)
+    for t in transcribers:
+        t.join()
+    return stats
+
 
 def main():
-    # This will download from Hugging Face the first time you run it
-    model = WhisperModel(
-        "ivrit-ai/whisper-large-v3-ct2",
-        device=DEVICE,
-        compute_type=COMPUTE_TYPE,
-    )
+    parser = argparse.ArgumentParser(description="Batch Hebrew transcription with faster-whisper.")
+    parser.add_argument("inputs", nargs="*", default=[DEFAULT_INPUT], help="files, directories or globs")
+    parser.add_argument("-o", "--output", help="write segments here as JSONL (overwritten unless --resume)")
+    parser.add_argument("--resume", action="store_true",
+                        help="append to --output, skipping files already finished there")
+    parser.add_argument("--workers", type=int, default=max(1, CPU_COUNT // 4),
+                        help="files transcribed in parallel (shared model)")
+    parser.add_argument("--cpu-threads", type=int, default=0,
+                        help="threads per worker (default: cores / workers)")
+    parser.add_argument("--decode-workers", type=int, default=2, help="decode / resample threads")
+    parser.add_argument("--prefetch", type=int, default=0, help="decoded files waiting (default: 2 x workers)")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--local", action="store_true", help="load the model here even if whisper_server.py runs")
+    args = parser.parse_args()
 
-    # Test audio file (Hebrew speech, mono, ~16kHz recommended but not required)
-    audio_path = "test.wav"
+    files = find_audio(args.inputs)
+    if args.resume and args.output:
+        done = finished_files(args.output)
+        skipped = len(files)
+        files = [f for f in files if f not in done]
+        print(f"Resuming: {skipped - len(files)} file(s) already done.")
+    if not files:
+        raise SystemExit("No audio files to transcribe.")
+    workers = min(args.workers, len(files))
+    verbose = len(files) == 1
 
-    # Transcribe
-    segments, info = model.transcribe(
-        audio_path,
-        language="he",        # force Hebrew
-        beam_size=5,
-        vad_filter=True,      # use built-in VAD
-        vad_parameters=dict(min_silence_duration_ms=500),
-    )
+    server = None if args.local or not WHISPER_SERVER else WhisperClient(WHISPER_SERVER)
+    served = server.model_name() if server is not None else None
+    if served is not None and served != args.model:
+        print(f"Whisper server at {WHISPER_SERVER} runs {served}, not {args.model}; loading it here.")
+    if served == args.model:
+        print(f"Using Whisper server at {WHISPER_SERVER} ({served})")
 
-    print(f"Detected language: {info.language}, prob={info.language_probability:.2f}")
-    print("Transcript:")
+        def transcribe(audio):
+            r = server.transcribe(audio, language=TRANSCRIBE_OPTIONS["language"],
+                                  beam_size=TRANSCRIBE_OPTIONS["beam_size"], vad_filter=True)
+            return r["language"], r["duration_s"], [(s["start"], s["end"], s["text"]) for s in r["segments"]]
+    else:
+        cpu_threads = args.cpu_threads or max(1, CPU_COUNT // workers)
+        # This will download from Hugging Face the first time you run it
+        t0 = time.monotonic()
+        model = WhisperModel(
+            args.model,
+            device=DEVICE,
+            compute_type=COMPUTE_TYPE,
+            cpu_threads=cpu_threads,
+            num_workers=workers,
+        )
+        print(f"Loaded {args.model} in {time.monotonic() - t0:.1f} s "
+              f"({workers} worker(s) x {cpu_threads} thread(s))")
 
-    full_text = []
-    for seg in segments:
-        print(f"[{seg.start:6.2f} - {seg.end:6.2f}] {seg.text}")
-        full_text.append(seg.text)
+        def transcribe(audio):
+            segments, info = model.transcribe(audio, **TRANSCRIBE_OPTIONS)
+            if verbose:
+                print(f"Detected language: {info.language}, prob={info.language_probability:.2f}")
+                print("Transcript:")
+            return info.language, info.duration, ((s.start, s.end, s.text) for s in segments)
 
-    print("\nFull text:")
-    print("".join(full_text))
+    def decode(path):
+        return decode_audio(path, sampling_rate=SAMPLE_RATE)
+
+    writer = JsonlWriter(args.output, append=args.resume)
+    t0 = time.monotonic()
+    try:
+        stats = run_batch(files, transcribe, decode, workers, args.decode_workers,
+                          args.prefetch or 2 * workers, writer, verbose)
+    finally:
+        writer.close()
+    elapsed = time.monotonic() - t0
+    if not verbose:
+        print(f"\n{stats['files']} file(s), {stats['errors']} error(s), {stats['audio_s'] / 60:.1f} min audio "
+              f"in {elapsed / 60:.1f} min (RTF {elapsed / max(stats['audio_s'], 1e-9):.3f})")
+    if args.output:
+        print(f"Wrote {args.output}")
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+import live_voice_enhancer as lve
+
+
+def reference_iir1(x, a, y0):
+    a = np.broadcast_to(np.asarray(a, dtype=np.float64).reshape(np.shape(a) + (1,) * (x.ndim - np.ndim(a))),
+                        x.shape)
+    y = np.empty_like(x)
+    state = y0
+    for n in range(len(x)):
+        state = y[n] = a[n] * state + (1.0 - a[n]) * x[n]
+    return y
+
+
+def test_iir1_matches_loop_for_any_coefficient():
+    rng = np.random.default_rng(0)
+    x = rng.random((3000, 2))
+    y0 = np.array([0.5, 0.1])
+    for a in (0.0, 1e-6, 0.3, 0.999, rng.random(3000), np.where(rng.random((3000, 2)) < 0.5, 0.0, 0.995)):
+        np.testing.assert_allclose(lve.iir1(x, a, y0, work={}), reference_iir1(x, a, y0), rtol=1e-9, atol=1e-12)
+
+
+def test_instant_attack_stays_on_the_closed_form_scan():
+    # the doubling scan's ping-pong buffers only show up in `work` when it runs
+    x = np.random.default_rng(0).random((4096, 1))
+    work = {}
+    lve.iir1(x, lve.ms_to_coef(0.0), 0.0, work=work)
+    assert "scan_a2" in work
+
+    for changes in ({}, {"gate_open_ms": 0.0, "comp_attack_ms": 0.0, "level_window_ms": 0.0}):
+        params = lve.EnhancerParams.from_config()._replace(**changes)
+        enhancer = lve.VoiceEnhancer(seed=0, params=params)
+        work = {}
+        enhancer._dynamic_gain(0.01 * x, work)
+        assert "scan_a" in work and "scan_a2" not in work
+
+
+def voice(seconds, seed=0):
+    """Noise plus a gated 220 Hz tone: speech-like bursts and pauses."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(lve.SAMPLE_RATE * seconds)) / lve.SAMPLE_RATE
+    bursts = np.sin(2 * np.pi * 1.5 * t) > 0
+    return (0.02 * rng.standard_normal(len(t)) + 0.5 * np.sin(2 * np.pi * 220 * t) * bursts).astype(np.float32)
+
+
+def test_process_batch_matches_block_by_block():
+    stream, batch = lve.VoiceEnhancer(seed=0), lve.VoiceEnhancer(seed=0)
+    frames = voice(3)[:93 * stream.block_size].reshape(93, stream.block_size)
+    out = np.empty_like(frames)
+    for k in range(len(frames)):
+        stream.process(frames[k], out[k])
+    assert np.sqrt(np.mean(out * out)) > 0.01
+    np.testing.assert_allclose(batch.process_batch(frames[:40]), out[:40], atol=1e-5)
+    np.testing.assert_allclose(batch.process_batch(frames[40:]), out[40:], atol=1e-5)
+
+
+
+def test_limiter_holds_the_ceiling_for_any_block_split():
+    rng = np.random.default_rng(0)
+    y = 0.3 * rng.standard_normal((2, 20000))
+    y[:, ::997] = 3.0
+    whole = y.copy()
+    lve.LookaheadLimiter(2, 32).process(whole, 0.5, 100.0)
+    assert np.abs(whole).max() <= 0.5 + 1e-9
+
+    split = y.copy()
+    limiter, start = lve.LookaheadLimiter(2, 32), 0
+    for n in (1, 7, 512, 3000, 16480):
+        limiter.process(split[:, start:start + n], 0.5, 100.0)
+        start += n
+    np.testing.assert_allclose(split, whole, atol=1e-9)
+
+
+
+def test_stft_overlap_add_reconstructs_the_input():
+    # every nonlinear stage at unity: gate and compressor, NR, EQ, vocoder, limiter
+    params = lve.EnhancerParams.from_config()._replace(
+        gate_attenuation=1.0, max_gain_db=0.0, nr_gain_floor=1.0, hpf_cutoff_hz=0.0,
+        presence_gain_db=0.0, hf_shelf_gain_db=0.0, vocoder_mix=0.0, limiter_threshold=10.0)
+    rng = np.random.default_rng(0)
+    for fft_size, hop in ((512, 128), (512, 256), (256, 64)):
+        enhancer = lve.StftVoiceEnhancer(fft_size=fft_size, hop=hop, params=params, lookahead_ms=0.0)
+        assert enhancer.latency_samples == fft_size - hop
+        x = (0.3 * rng.standard_normal(40 * hop)).astype(np.float32)
+        y = np.empty_like(x)
+        for k in range(40):
+            enhancer.process(x[k * hop:(k + 1) * hop], y[k * hop:(k + 1) * hop])
+        delay = fft_size - hop
+        np.testing.assert_allclose(y[delay:], x[:-delay], atol=1e-6)
+
+
+def test_noise_tracker_adapts_during_speech():
+    rng = np.random.default_rng(0)
+    rate = lve.SAMPLE_RATE / lve.BLOCK_SIZE
+    frames, onset = int(30 * rate), int(5 * rate)
+    k = np.arange(frames)
+
+    # bin 0: noise at 1, then talk ~100x louder (~300 ms syllables, ~200 ms gaps)
+    # bin 1: no speech, noise steps from 1 to 4 five seconds into the talk
+    level = np.ones((frames, 2))
+    level[onset + int(5 * rate):, 1] = 4.0
+    power = level * rng.exponential(size=(frames, 2))
+    talk = (k >= onset) & ((k - onset) % 16 < 10)
+    power[talk, 0] += 100.0 * rng.exponential(size=talk.sum())
+
+    tracker = lve.NoiseTracker((1, 2), rate)
+    params = lve.EnhancerParams.from_config()
+    noise = np.array([tracker.update(power[i][None], params)[0].copy() for i in range(frames)])
+
+    assert noise[onset:, 0].max() < 10.0                  # speech is not taken for noise
+    before = noise[onset:onset + int(5 * rate), 1].mean()
+    after = noise[-int(5 * rate):, 1].mean()
+    assert after > 2.5 * before                           # the other bin kept following its noise
+
+
+def test_corrupt_table_cache_file_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(lve, "TABLE_CACHE_DIR", str(tmp_path))
+    lve._cached_tables.cache_clear()
+    try:
+        built = lve.get_tables(256)
+        (path,) = tmp_path.glob("*.npz")
+        path.write_bytes(path.read_bytes()[:300])     # truncated by a crash
+        lve._cached_tables.cache_clear()
+        np.testing.assert_array_equal(lve.get_tables(256).eq_curve, built.eq_curve)
+        assert [p.name for p in tmp_path.iterdir()] == [path.name]
+        with np.load(path) as data:
+            np.testing.assert_array_equal(data["eq_curve"], built.eq_curve)
+    finally:
+        lve._cached_tables.cache_clear()
+
+
+def test_set_params_rejects_values_the_callback_cannot_run():
+    enhancer = lve.VoiceEnhancer(seed=0)
+    before = enhancer.params
+    for changes in ({"gate_range_db": 0}, {"vocoder_mix": "nan"}, {"vocoder_mix": float("inf")},
+                    {"nr_gain_floor": 1.5}, {"limiter_threshold": 0}, {"comp_attack_ms": -1},
+                    {"presence_band": "1800,9000"}, {"band_min_freq": 7000}):
+        with pytest.raises(ValueError):
+            enhancer.set_params(**changes)
+    assert enhancer.params is before
+    assert enhancer.set_params(vocoder_mix=0.6, gate_range_db="5").gate_range_db == 5.0
@@ -0,0 +1,43 @@
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+
+def test_write_and_read_counts_and_wraparound():
+    ring = RingBuffer(8, channels=2)
+    data = np.arange(40, dtype=np.float32).reshape(20, 2)
+    out = np.full((20, 2), -1.0, dtype=np.float32)
+
+    assert ring.write(data[:6]) == 6
+    assert ring.read_into(out[:4]) == 4
+    assert ring.write(data[6:12]) == 6              # wraps past the end of storage
+    assert ring.write(data[12:20]) == 0             # full: nothing taken
+    assert (ring.readable, ring.writable) == (8, 0)
+    assert ring.read_into(out[4:20]) == 8           # short read, wraps back
+    np.testing.assert_array_equal(out[:12], data[:12])
+    assert (out[12:] == -1.0).all()                 # the rest of `out` is left untouched
+    assert (ring.readable, ring.writable) == (0, 8)
+
+
+def test_many_wraps_keep_the_stream_intact():
+    ring = RingBuffer(7)
+    x = np.arange(1000, dtype=np.float32)
+    got = []
+    written = 0
+    rng = np.random.default_rng(0)
+    while written < len(x) or ring.readable:
+        written += ring.write(x[written:written + rng.integers(1, 6)])
+        out = np.empty(rng.integers(1, 6), dtype=np.float32)
+        got.append(out[:ring.read_into(out)].copy())
+    np.testing.assert_array_equal(np.concatenate(got), x)
+
+
+def test_silence_and_clear():
+    ring = RingBuffer(4)
+    assert ring.write_silence(6) == 4
+    ring.clear()
+    assert ring.readable == 0
+    assert ring.write(np.ones(3, dtype=np.float32)) == 3
+    assert ring.write(np.empty(0, dtype=np.float32)) == 0
+    out = np.empty(3, dtype=np.float32)
+    assert ring.read_into(out) == 3 and (out == 1.0).all()
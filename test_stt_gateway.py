@@ -0,0 +1,81 @@
+import asyncio
+import binascii
+
+import stt_gateway as gw
+
+
+class FakeConnection:
+    """
+    Answers each commit with a committed transcript naming the audio it
+    last received, then sends a second, late one (like a server VAD
+    commit racing the explicit commit) `late_s` afterwards.
+    """
+
+    def __init__(self, handlers, late_s):
+        self.handlers = handlers
+        self.late_s = late_s
+        self.text = ""
+
+    async def send(self, message):
+        self.text = str(binascii.a2b_base64(message["audio_base_64"])[0])
+
+    async def commit(self):
+        loop = asyncio.get_running_loop()
+        text = self.text
+        loop.call_later(0.01, self.handlers["committed_transcript"], {"text": text})
+        loop.call_later(self.late_s, self.handlers["committed_transcript"], {"text": text})
+
+    async def close(self):
+        pass
+
+
+def fake_connector(late_s):
+    async def connect(handlers):
+        return FakeConnection(handlers, late_s)
+    return connect
+
+
+async def one_chunk(value):
+    yield bytes([value]) * 6400
+
+
+def test_late_events_stay_with_their_session():
+    async def run():
+        gateway = gw.Gateway(fake_connector(late_s=0.05), connections=1)
+        gateway.pool.settle_s = 0.1
+        sessions = [await gateway.run_session(gw.Session(f"s{i}", one_chunk(i))) for i in range(4)]
+        await gateway.pool.close()
+        return gateway, sessions
+
+    gateway, sessions = asyncio.run(run())
+    assert (gateway.pool.opened, gateway.pool.reused) == (1, 3)
+    for i, session in enumerate(sessions):
+        assert session.error is None
+        assert session.transcripts == [str(i), str(i)]     # its own late event, and no one else's
+
+
+def test_events_after_release_are_dropped_before_reuse():
+    class Owner:
+        def __init__(self):
+            self.events = []
+
+        def on_event(self, kind, data):
+            self.events.append((kind, data))
+
+    async def run():
+        pool = gw.ConnectionPool(fake_connector(late_s=1.0), size=1, settle_s=0.05)
+        a, b = Owner(), Owner()
+        upstream = await pool.acquire(a)
+        upstream.connection.handlers["partial_transcript"]({"text": "mine"})
+        await pool.release(upstream)
+        upstream.connection.handlers["committed_transcript"]({"text": "late"})
+        again = await pool.acquire(b)      # waits for the connection to settle
+        await pool.release(again)
+        await pool.close()
+        return pool, upstream, again, a, b
+
+    pool, upstream, again, a, b = asyncio.run(run())
+    assert again is upstream
+    assert a.events == [("partial_transcript", {"text": "mine"})]
+    assert b.events == []
+    assert pool.stale_events == 1
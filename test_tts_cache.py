@@ -0,0 +1,58 @@
+import time
+
+from tts_cache import TtsCache
+
+VOICE, MODEL, FORMAT = "voice", "eleven_v3", "mp3_44100_128"
+
+
+def put(cache, text, data):
+    cache.put(text, VOICE, MODEL, FORMAT, data)
+    time.sleep(0.01)    # distinct last-use times
+
+
+def get(cache, text):
+    return cache.get(text, VOICE, MODEL, FORMAT)
+
+
+def test_memory_lru_evicts_the_least_recently_used():
+    cache = TtsCache(None, memory_max_bytes=10)
+    put(cache, "a", b"aaaa")
+    put(cache, "b", b"bbbb")
+    assert get(cache, "a") == b"aaaa"       # a is now newer than b
+    put(cache, "c", b"cccc")
+    assert get(cache, "b") is None
+    assert (get(cache, "a"), get(cache, "c")) == (b"aaaa", b"cccc")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_lru_and_persistence(tmp_path):
+    # the memory tier holds one entry, so lookups of older ones go to disk
+    cache = TtsCache(tmp_path, memory_max_bytes=4, disk_max_bytes=10)
+    put(cache, "a", b"aaaa")
+    put(cache, "b", b"bbbb")
+    assert get(cache, "a") == b"aaaa" and cache.disk_hits == 1
+    time.sleep(0.01)
+    put(cache, "c", b"cccc")                # over 10 bytes on disk: b was used least recently
+    assert cache.stats()["disk_entries"] == 2
+    assert len(list(tmp_path.glob("*/*"))) == 2
+
+    reopened = TtsCache(tmp_path)
+    assert reopened.stats()["disk_bytes"] == 8
+    assert get(reopened, "b") is None
+    assert get(reopened, "  a ") == b"aaaa"     # same phrase, other whitespace
+    assert get(reopened, "c") == b"cccc"
+    assert reopened.disk_hits == 2 and reopened.misses == 1
+
+
+def test_fetch_generates_once_and_skips_long_texts():
+    cache = TtsCache(None, max_text_chars=10)
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return b"audio"
+
+    assert cache.fetch("hello", VOICE, MODEL, FORMAT, generate) == b"audio"
+    assert cache.fetch("hello", VOICE, MODEL, FORMAT, generate) == b"audio"
+    assert cache.fetch("a much longer sentence", VOICE, MODEL, FORMAT, generate) == b"audio"
+    assert len(calls) == 2 and cache.bypassed == 1
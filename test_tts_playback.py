@@ -0,0 +1,83 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import tts_playback
+from tts_playback import FakeTTS, PcmPlayer
+
+
+class StubOutput:
+    """sounddevice.OutputStream stand-in: calls the callback from a thread at `speed` x real time."""
+
+    speed = 10.0
+
+    def __init__(self, samplerate, channels, dtype, blocksize, device, callback):
+        self.block = blocksize
+        self.period = blocksize / samplerate / self.speed
+        self.callback = callback
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        out = np.empty((self.block, 1), dtype=np.float32)
+        while self._running:
+            self.callback(out, self.block, None, None)
+            time.sleep(self.period)
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+    def close(self):
+        pass
+
+
+def test_chunked_playback_buffers_rebuffers_and_keeps_every_sample(monkeypatch):
+    monkeypatch.setattr(tts_playback, "sd", SimpleNamespace(OutputStream=StubOutput))
+    tts = FakeTTS(first_chunk_ms=0, speed=40.0)
+    text = "one two three four five six"
+    player = PcmPlayer()
+
+    # what the device side actually took out of the ring, and how much was buffered then
+    reads = []
+    read_into = player.ring.read_into
+
+    def recording_read_into(out):
+        readable = player.ring.readable
+        n = read_into(out)
+        reads.append((readable, n, out[:n, 0].copy()))
+        return n
+
+    player.ring.read_into = recording_read_into
+
+    def stalled(chunks):
+        for i, chunk in enumerate(chunks):
+            if i == 6:
+                # the network stalls until the device has drained everything
+                while player.ring.readable:
+                    time.sleep(0.001)
+                time.sleep(0.02)
+            yield chunk
+
+    try:
+        stats = player.play(stalled(tts.stream(text)))
+    finally:
+        player.close()
+
+    # playback starts only once JITTER_MS is buffered
+    assert reads[0][0] >= player.jitter
+    # the stall is an underrun, and playback resumes only after re-buffering
+    assert stats["underruns"] >= 1
+    short = next(i for i, (_, n, _) in enumerate(reads) if n < player.block)
+    resumed = next(i for i in range(short + 1, len(reads)) if reads[i][1])
+    assert reads[resumed][0] >= player.jitter
+    # every sample came out once, in order, odd chunk sizes included
+    pcm = np.frombuffer(tts.pcm(text), dtype="<i2")
+    expected = np.multiply(pcm, 1.0 / 32768.0, dtype=np.float32)
+    np.testing.assert_array_equal(np.concatenate([samples for _, _, samples in reads]), expected)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from vad import SAMPLE_RATE, SpeechGate, Vad
+
+
+def speech_in_noise(seed=0):
+    rng = np.random.default_rng(seed)
+    x = 0.001 * rng.standard_normal(4 * SAMPLE_RATE)
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    x[SAMPLE_RATE:2 * SAMPLE_RATE] += 0.3 * np.sin(2 * np.pi * 200 * t) * np.sin(2 * np.pi * 3 * t) ** 2
+    x[int(2.6 * SAMPLE_RATE):int(3.2 * SAMPLE_RATE)] += 0.3 * np.sin(2 * np.pi * 220 * t[:int(0.6 * SAMPLE_RATE)])
+    return x.astype(np.float32)
+
+
+def chunks(x, seed=1):
+    sizes = np.random.default_rng(seed).integers(1, 2000, size=len(x))
+    bounds = np.cumsum(sizes)
+    return np.split(x, bounds[bounds < len(x)])
+
+
+def test_vad_decisions_do_not_depend_on_chunking():
+    x = speech_in_noise()
+    whole = Vad().process(x)
+    assert 0 < whole.sum() < len(whole)
+    vad = Vad()
+    np.testing.assert_array_equal(np.concatenate([vad.process(c) for c in chunks(x)]), whole)
+
+
+def test_speech_gate_output_does_not_depend_on_chunking():
+    x = speech_in_noise()
+    whole = SpeechGate().process(x)
+    assert 0 < len(whole) < len(x)
+    gate = SpeechGate()
+    np.testing.assert_array_equal(np.concatenate([gate.process(c) for c in chunks(x)]), whole)
+
+
+def test_speech_gate_runs_point_at_the_input():
+    x = speech_in_noise()
+    gate = SpeechGate()
+    for c in chunks(x):
+        out = gate.process(c)
+        offset = 0
+        for start, n in gate.runs:
+            np.testing.assert_array_equal(out[offset:offset + n], x[start:start + n])
+            offset += n
+        assert offset == len(out)
@@ -0,0 +1,308 @@
+"""
+Content-addressed cache of TTS audio, so repeated phrases ("תודה",
+"בבקשה", "עצור", ...) play at once and cost no API quota.
+
+Key: sha256 of (text, voice_id, model_id, output_format). The text is
+NFC-normalized with whitespace collapsed, so equal phrases hit however
+they were typed. Two tiers:
+
+- memory   LRU of the audio bytes, bounded by MEMORY_MAX_BYTES
+- disk     CACHE_DIR/<2 hex>/<key>.<format>, bounded by DISK_MAX_BYTES.
+           The least recently used files are deleted first; mtime is the
+           last use, so the bound survives restarts.
+
+Texts longer than MAX_TEXT_CHARS are not cached (one-off sentences would
+only push the common phrases out). prewarm() fills the cache from a
+phrase list, e.g. BOOST_WORDS of corection_layer/HebrewCorrector.py.
+
+Usage:
+  cache = TtsCache()
+  audio = cache.fetch(text, voice_id, "eleven_v3", "mp3_44100_128", generate)   # generate() -> bytes
+  for chunk in cache.stream(text, voice_id, model_id, fmt, generate_stream): ...
+  print(cache.report())
+
+  python tts_cache.py --prewarm boost            # BOOST_WORDS (ELEVENLABS_API_KEY, ELEVENLABS_VOICE_ID)
+  python tts_cache.py --prewarm phrases.txt --format mp3_44100_128
+  python tts_cache.py --stats
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# =======================
+# CONFIG
+# =======================
+CACHE_DIR = Path(__file__).resolve().parent / "tts_cache"
+MEMORY_MAX_BYTES = 32 * 2 ** 20
+DISK_MAX_BYTES = 512 * 2 ** 20
+MAX_TEXT_CHARS = 200
+PREWARM_WORKERS = 2         # concurrent TTS requests while prewarming
+TTS_MODEL_ID = "eleven_v3"
+TTS_FORMAT = "pcm_22050"    # what gui_stt_tts.py requests in pipelined PCM mode
+BOOST_WORDS_FILE = Path(__file__).resolve().parent / "corection_layer" / "HebrewCorrector.py"
+
+
+def normalize_text(text):
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+
+def cache_key(text, voice_id, model_id, output_format):
+    blob = json.dumps([normalize_text(text), voice_id, model_id, output_format], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class TtsCache:
+    """Thread-safe two-tier (memory LRU + disk) audio cache; `directory=None` keeps it in memory only."""
+
+    def __init__(self, directory=CACHE_DIR, memory_max_bytes=MEMORY_MAX_BYTES, disk_max_bytes=DISK_MAX_BYTES,
+                 max_text_chars=MAX_TEXT_CHARS):
+        self.dir = Path(directory) if directory else None
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.max_text_chars = max_text_chars
+        self._memory = OrderedDict()    # key -> bytes, oldest first
+        self._memory_bytes = 0
+        self._disk = {}                 # key -> [path, size, last_used]
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        # stats
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0               # too long to cache
+        self.evictions = 0
+
+        if self.dir is not None:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            for path in self.dir.glob("*/*"):
+                if path.suffix == ".tmp":
+                    continue
+                st = path.stat()
+                self._disk[path.name.split(".")[0]] = [path, st.st_size, st.st_mtime]
+                self._disk_bytes += st.st_size
+            with self._lock:
+                self._evict_disk()
+
+    def cacheable(self, text):
+        return 0 < len(normalize_text(text)) <= self.max_text_chars
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    # ----- lookups -----
+    def get(self, text, voice_id, model_id, output_format):
+        """Cached audio bytes, or None (counted as a miss)."""
+        if not self.cacheable(text):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        key = cache_key(text, voice_id, model_id, output_format)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+            entry = self._disk.get(key)
+        if entry is not None:
+            try:
+                data = entry[0].read_bytes()
+                os.utime(entry[0])
+            except OSError:
+                data = None
+            with self._lock:
+                if data:
+                    entry[2] = time.time()
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                    return data
+                self._forget_disk(key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, voice_id, model_id, output_format, data):
+        if not data or not self.cacheable(text):
+            return
+        data = bytes(data)
+        key = cache_key(text, voice_id, model_id, output_format)
+        with self._lock:
+            self._remember(key, data)
+            if self.dir is None or key in self._disk:
+                return
+        path = self.dir / key[:2] / f"{key}.{output_format.split('_')[0]}"
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as ex:
+            print(f"TTS cache: could not write {path}: {ex}")
+            return
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = [path, len(data), time.time()]
+                self._disk_bytes += len(data)
+                self._evict_disk()
+
+    def fetch(self, text, voice_id, model_id, output_format, generate):
+        """Cached audio, or generate() -> bytes, which is then stored."""
+        data = self.get(text, voice_id, model_id, output_format)
+        if data is None:
+            data = generate()
+            self.put(text, voice_id, model_id, output_format, data)
+        return data
+
+    def stream(self, text, voice_id, model_id, output_format, generate_stream):
+        """
+        Audio chunks: all of the cached audio at once on a hit; otherwise
+        generate_stream()'s chunks as they arrive, stored once the stream
+        has completed (an abandoned stream is not cached).
+        """
+        data = self.get(text, voice_id, model_id, output_format)
+        if data is not None:
+            yield data
+            return
+        chunks = []
+        for chunk in generate_stream():
+            chunks.append(chunk)
+            yield chunk
+        self.put(text, voice_id, model_id, output_format, b"".join(chunks))
+
+    def prewarm(self, phrases, voice_id, model_id, output_format, generate, workers=PREWARM_WORKERS):
+        """
+        Generate and store every phrase not cached yet; `generate(text)`
+        returns bytes or an iterable of chunks. Returns the number generated.
+        """
+        todo = []
+        for text in dict.fromkeys(normalize_text(p) for p in phrases):
+            if self.cacheable(text) and cache_key(text, voice_id, model_id, output_format) not in self:
+                todo.append(text)
+
+        def one(text):
+            audio = generate(text)
+            if not isinstance(audio, (bytes, bytearray)):
+                audio = b"".join(audio)
+            self.put(text, voice_id, model_id, output_format, audio)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for future in [pool.submit(one, text) for text in todo]:
+                future.result()
+        return len(todo)
+
+    # ----- internals (lock held) -----
+    def _remember(self, key, data):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_bytes -= len(dropped)
+            self.evictions += 1
+
+    def _forget_disk(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+            try:
+                entry[0].unlink()
+            except OSError:
+                pass
+
+    def _evict_disk(self):
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+        for key, _ in sorted(self._disk.items(), key=lambda item: item[1][2]):
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            self._forget_disk(key)
+            self.evictions += 1
+
+    # ----- stats -----
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def report(self):
+        s = self.stats()
+        return (f"TTS cache: {s['hits']} hit(s) ({s['memory_hits']} memory, {s['disk_hits']} disk), "
+                f"{s['misses']} miss(es), hit rate {100.0 * s['hit_rate']:.0f}%, "
+                f"memory {s['memory_bytes'] / 2 ** 20:.1f} MB in {s['memory_entries']}, "
+                f"disk {s['disk_bytes'] / 2 ** 20:.1f} MB in {s['disk_entries']}, {s['evictions']} eviction(s)")
+
+
+def load_phrases(source):
+    """"boost" -> BOOST_WORDS of HebrewCorrector.py; otherwise a text file with one phrase per line."""
+    if source == "boost":
+        # read the literal, so the corrector's own dependencies (rapidfuzz) are not needed
+        tree = ast.parse(BOOST_WORDS_FILE.read_text(encoding="utf-8"))
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "BOOST_WORDS" for t in node.targets):
+                return sorted(ast.literal_eval(node.value))
+        raise ValueError(f"BOOST_WORDS not found in {BOOST_WORDS_FILE}")
+    with open(source, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed TTS audio cache.")
+    parser.add_argument("--prewarm", metavar="SOURCE", help='"boost" (HebrewCorrector BOOST_WORDS) or a phrase file')
+    parser.add_argument("--voice", default=os.getenv("ELEVENLABS_VOICE_ID", ""))
+    parser.add_argument("--model", default=TTS_MODEL_ID)
+    parser.add_argument("--format", default=TTS_FORMAT, help="ElevenLabs output_format (must match the player)")
+    parser.add_argument("--dir", default=str(CACHE_DIR))
+    parser.add_argument("--stats", action="store_true")
+    args = parser.parse_args()
+
+    cache = TtsCache(args.dir)
+    if args.prewarm:
+        from dotenv import load_dotenv
+        from elevenlabs.client import ElevenLabs
+        load_dotenv()
+        voice = args.voice or os.getenv("ELEVENLABS_VOICE_ID", "")
+        if not os.getenv("ELEVENLABS_API_KEY") or not voice:
+            raise SystemExit("Set ELEVENLABS_API_KEY and ELEVENLABS_VOICE_ID (or --voice).")
+        client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+        phrases = load_phrases(args.prewarm)
+
+        def generate(text):
+            return client.text_to_speech.convert(voice_id=voice, text=text, model_id=args.model,
+                                                 output_format=args.format)
+
+        t0 = time.monotonic()
+        n = cache.prewarm(phrases, voice, args.model, args.format, generate)
+        print(f"Prewarmed {n} of {len(phrases)} phrase(s) in {time.monotonic() - t0:.1f} s "
+              f"({len(phrases) - n} already cached).")
+    if args.stats or not args.prewarm:
+        print(cache.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Streaming TTS playback in process: PCM chunks -> jitter buffer -> one
+long-lived sounddevice OutputStream.
+
+TTS is requested as raw PCM (output_format "pcm_22050": 16-bit mono
+little-endian), so every chunk is playable the moment it arrives. No
+decoder, no player process, no waiting for the whole download.
+
+- PcmPlayer   owns the output stream. play(chunks) copies each chunk
+              into an SPSC RingBuffer, and the PortAudio callback only
+              copies out of it. An utterance starts once JITTER_MS is
+              buffered (or the stream ended). After an underrun it
+              re-buffers instead of crackling.
+- FakeTTS     local stand-in for a streaming TTS endpoint (tones, first-
+              byte delay, odd-sized chunks), for tests without an API key.
+
+Usage:
+  python tts_playback.py "שלום" "תודה רבה"            # ElevenLabs (ELEVENLABS_API_KEY, ELEVENLABS_VOICE_ID)
+  python tts_playback.py --fake "one two three" "four five"
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+try:
+    import sounddevice as sd
+except ImportError:
+    sd = None  # PcmPlayer needs it; FakeTTS does not
+
+# =======================
+# CONFIG
+# =======================
+PCM_RATE = 22050        # ElevenLabs PCM formats: 16000, 22050, 24000, 44100
+JITTER_MS = 120         # audio buffered before an utterance starts (and after an underrun)
+RING_S = 30.0           # audio queued ahead of the device; play() waits when it is full
+BLOCK_MS = 20           # device callback size
+TTS_MODEL_ID = "eleven_v3"
+
+
+class PcmPlayer:
+    """
+    Plays PCM16 utterances through one OutputStream that stays open. One
+    producer at a time (play() is serialized); the callback is the only
+    consumer of the ring.
+    """
+
+    def __init__(self, sample_rate=PCM_RATE, jitter_ms=JITTER_MS, ring_s=RING_S, block_ms=BLOCK_MS, device=None):
+        self.sample_rate = sample_rate
+        self.jitter = int(sample_rate * jitter_ms / 1000)
+        self.block = int(sample_rate * block_ms / 1000)
+        self.ring = RingBuffer(int(ring_s * sample_rate))
+        self.device = device
+        self._stream = None
+        self._producer = threading.Lock()
+
+        # flags shared with the callback (each written by one side only)
+        self._ended = True          # producer: the current utterance is fully queued
+        self._clear = False         # producer asks the callback to drop what is queued
+        self._playing = False       # callback: past the jitter wait
+        self.first_audio_at = None  # callback: first sample of the current utterance played
+
+        # counters
+        self.utterances = 0
+        self.underruns = 0          # ran dry in the middle of an utterance
+        self.status_flags = 0
+
+    @property
+    def available(self):
+        return sd is not None
+
+    def prepare(self):
+        """Open and start the output stream (done once; play() calls it too)."""
+        if self._stream is not None:
+            return
+        if sd is None:
+            raise RuntimeError("PcmPlayer needs the sounddevice package (pip install sounddevice).")
+        self._stream = sd.OutputStream(samplerate=self.sample_rate, channels=1, dtype="float32",
+                                       blocksize=self.block, device=self.device, callback=self._callback)
+        self._stream.start()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    # ----- sounddevice entry point: copy only -----
+    def _callback(self, outdata, frames, time_info, status):
+        if status:
+            self.status_flags += 1
+        if self._clear:
+            self.ring.clear()
+            self._clear = False
+            self._playing = False
+        if not self._playing:
+            if self.ring.readable >= self.jitter or (self._ended and self.ring.readable):
+                self._playing = True
+            else:
+                outdata.fill(0.0)
+                return
+        n = self.ring.read_into(outdata)
+        if n and self.first_audio_at is None:
+            self.first_audio_at = time.monotonic()
+        if n < frames:
+            outdata[n:] = 0.0
+            self._playing = False
+            if not self._ended:
+                self.underruns += 1
+
+    # ----- producer -----
+    def _write(self, x):
+        while len(x):
+            x = x[self.ring.write(x):]
+            if len(x):
+                time.sleep(self.block / self.sample_rate)    # ring full: wait for the device
+
+    def play(self, chunks, on_first_chunk=None, wait=True):
+        """
+        Stream one utterance of PCM16 mono bytes (any split, odd lengths
+        included) as the chunks arrive. With `wait`, returns once it has
+        played. Returns {"first_audio_ms", "audio_s", "underruns"}.
+        """
+        self.prepare()
+        with self._producer:
+            t0 = time.monotonic()
+            underruns = self.underruns
+            self.first_audio_at = None
+            self._ended = False
+            rest = b""
+            frames = 0
+            try:
+                for chunk in chunks:
+                    if rest:
+                        chunk = rest + chunk
+                    usable = len(chunk) - len(chunk) % 2
+                    rest = chunk[usable:]
+                    pcm = np.frombuffer(chunk, dtype="<i2", count=usable // 2)
+                    self._write(np.multiply(pcm, 1.0 / 32768.0, dtype=np.float32))
+                    frames += len(pcm)
+                    if on_first_chunk is not None and frames:
+                        on_first_chunk()
+                        on_first_chunk = None
+            finally:
+                self._ended = True
+            self.utterances += 1
+            if wait:
+                self.wait()
+            first = self.first_audio_at
+            return {"first_audio_ms": None if first is None else 1000.0 * (first - t0),
+                    "audio_s": frames / self.sample_rate,
+                    "underruns": self.underruns - underruns}
+
+    def wait(self):
+        """Block until everything queued has been handed to the device."""
+        while self.ring.readable:
+            time.sleep(self.block / self.sample_rate)
+
+    def stop(self):
+        """Drop whatever is still queued (the next callback goes silent)."""
+        self._clear = True
+
+
+# =======================
+# SOURCES
+# =======================
+def elevenlabs_pcm(client, voice_id, model_id=TTS_MODEL_ID, sample_rate=PCM_RATE):
+    """text -> PCM16 chunks from the ElevenLabs streaming endpoint."""
+    def stream(text):
+        return client.text_to_speech.stream(voice_id=voice_id, text=text, model_id=model_id,
+                                            output_format=f"pcm_{sample_rate}")
+    return stream
+
+
+class FakeTTS:
+    """
+    Streaming TTS stand-in: a short tone per word as PCM16, delivered
+    after `first_chunk_ms` in odd-sized chunks at `speed` x real time.
+    """
+
+    def __init__(self, sample_rate=PCM_RATE, first_chunk_ms=200, chunk_bytes=4097, speed=4.0, ms_per_word=280):
+        self.sample_rate = sample_rate
+        self.first_chunk_ms = first_chunk_ms
+        self.chunk_bytes = chunk_bytes
+        self.speed = speed
+        self.ms_per_word = ms_per_word
+
+    def pcm(self, text):
+        sr = self.sample_rate
+        n = int(sr * self.ms_per_word / 1000)
+        t = np.arange(n) / sr
+        gap = np.zeros(n // 4)
+        parts = []
+        for word in text.split():
+            tone = 0.3 * np.sin(2 * np.pi * (180.0 + 25.0 * (len(word) % 8)) * t) * np.hanning(n)
+            parts += [tone, gap]
+        audio = np.concatenate(parts) if parts else gap
+        return (audio * 32767.0).astype("<i2").tobytes()
+
+    def stream(self, text):
+        data = self.pcm(text)
+        time.sleep(self.first_chunk_ms / 1000.0)
+        for i in range(0, len(data), self.chunk_bytes):
+            chunk = data[i:i + self.chunk_bytes]
+            yield chunk
+            time.sleep(len(chunk) / 2 / self.sample_rate / self.speed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream TTS into one long-lived output stream.")
+    parser.add_argument("texts", nargs="+")
+    parser.add_argument("--fake", action="store_true", help="local tone generator instead of ElevenLabs")
+    parser.add_argument("--rate", type=int, default=PCM_RATE)
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS)
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args()
+
+    if args.fake:
+        source = FakeTTS(args.rate).stream
+    else:
+        from dotenv import load_dotenv
+        from elevenlabs.client import ElevenLabs
+        load_dotenv()
+        if not os.getenv("ELEVENLABS_API_KEY") or not os.getenv("ELEVENLABS_VOICE_ID"):
+            raise SystemExit("Set ELEVENLABS_API_KEY and ELEVENLABS_VOICE_ID (or use --fake).")
+        source = elevenlabs_pcm(ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY")),
+                                os.getenv("ELEVENLABS_VOICE_ID"), sample_rate=args.rate)
+
+    player = PcmPlayer(args.rate, args.jitter_ms, device=args.device)
+    player.prepare()
+    try:
+        for text in args.texts:
+            stats = player.play(source(text))
+            first = stats["first_audio_ms"]
+            print(f"{text!r}: first audio {first:.0f} ms, {stats['audio_s']:.1f} s audio, "
+                  f"{stats['underruns']} underrun(s)" if first is not None else f"{text!r}: no audio")
+    finally:
+        player.close()
+
+
+if __name__ == "__main__":
+    main()
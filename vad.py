@@ -0,0 +1,195 @@
+"""
+Lightweight voice activity detector: energy + spectral flatness + hangover.
+
+Audio is cut into FRAME_MS frames and every frame of a chunk is judged in
+one vectorized pass (one batched rfft, no per-frame Python loop). A frame
+is speech when it is well above an adaptive noise floor, above an absolute
+level, and not spectrally flat (voiced speech has harmonics, fans and hiss
+do not). The hangover keeps short pauses inside an utterance.
+
+- Vad          streaming per-frame decisions
+- SpeechGate   streaming silence remover with pre-roll, reports utterance
+               start / end (e.g. to commit an STT segment)
+- speech_mask / trim_silence   whole-signal helpers
+
+Used by live_voice_enhancer.py, realtime_stt_stream.py, stt_tts_loop.py and
+gui_stt_tts.py so silence never reaches an STT upload or Whisper.
+"""
+
+import numpy as np
+
+# =======================
+# CONFIG
+# =======================
+SAMPLE_RATE = 16000
+FRAME_MS = 20.0                 # analysis frame
+SPEECH_BAND = (150.0, 4000.0)   # Hz; flatness is measured here
+ENERGY_MARGIN_DB = 9.0          # speech must be this far above the noise floor
+MIN_ENERGY_DB = -55.0           # dBFS; quieter frames are never speech
+FLATNESS_MAX = 0.45             # spectral flatness (0 = tonal, ~0.56 = white noise)
+FLOOR_RISE_DB_S = 3.0           # how fast the noise floor may creep up
+HANGOVER_MS = 300.0             # stay "speech" this long after the last speech frame
+PRE_ROLL_MS = 200.0             # audio kept before each detected onset
+
+
+# =======================
+# DETECTOR
+# =======================
+class Vad:
+    """
+    Streaming detector for mono audio. process() takes chunks of any
+    length and returns one decision per completed frame; a partial frame
+    waits for the next chunk. State: noise floor, hangover, partial frame.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS, hangover_ms=HANGOVER_MS):
+        self.sample_rate = sample_rate
+        self.frame_len = int(round(sample_rate * frame_ms / 1000.0))
+        self.hangover = int(round(hangover_ms / frame_ms))
+        self.rise = FLOOR_RISE_DB_S * frame_ms / 1000.0     # dB per frame
+        self.window = np.hanning(self.frame_len)
+        freqs = np.fft.rfftfreq(self.frame_len, d=1.0 / sample_rate)
+        self.band = (freqs >= SPEECH_BAND[0]) & (freqs <= SPEECH_BAND[1])
+        self.reset()
+
+    def reset(self):
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._floor = np.inf
+        self._since = self.hangover + 1     # frames since the last speech frame
+
+    def features(self, frames):
+        """(F, frame_len) -> level in dBFS and in-band spectral flatness, each (F,)."""
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+        spec = np.abs(np.fft.rfft(frames * self.window, axis=1)[:, self.band]) ** 2 + 1e-12
+        flatness = np.exp(np.mean(np.log(spec), axis=1)) / np.mean(spec, axis=1)
+        return energy_db, flatness
+
+    def process(self, x):
+        """
+        Decisions (bool array) for every frame completed by mono chunk `x`
+        (float in [-1, 1] or integer PCM).
+        """
+        x = np.asarray(x).ravel()
+        if x.dtype.kind == "i":
+            x = x / np.float32(np.iinfo(x.dtype).max + 1)
+        x = np.concatenate([self._pending, x.astype(np.float32, copy=False)])
+        fl = self.frame_len
+        n = len(x) // fl
+        self._pending = x[n * fl:]
+        if n == 0:
+            return np.zeros(0, dtype=bool)
+        energy_db, flatness = self.features(x[:n * fl].reshape(n, fl).astype(np.float64))
+
+        # noise floor follows dips at once and rises at FLOOR_RISE_DB_S:
+        # floor[k] = min(e[k], floor[k-1] + rise) is a running minimum of
+        # e[k] - k * rise
+        ramp = self.rise * np.arange(1, n + 1)
+        floor = energy_db - ramp
+        floor[0] = min(floor[0], self._floor)
+        np.minimum.accumulate(floor, out=floor)
+        floor += ramp
+        self._floor = floor[-1]
+
+        raw = ((energy_db > floor + ENERGY_MARGIN_DB)
+               & (energy_db > MIN_ENERGY_DB)
+               & (flatness < FLATNESS_MAX))
+
+        # hangover: distance to the latest raw speech frame
+        idx = np.arange(n)
+        last = np.maximum.accumulate(np.where(raw, idx, -1 - self._since))
+        self._since = n - 1 - last[-1]
+        return idx - last <= self.hangover
+
+
+def _widen_back(decisions, frames):
+    """Also mark the `frames` frames before every marked frame (pre-roll)."""
+    if frames <= 0 or not len(decisions):
+        return decisions
+    ahead = np.convolve(decisions.astype(np.int32), np.ones(frames + 1, dtype=np.int32))
+    return ahead[frames:frames + len(decisions)] > 0
+
+
+# =======================
+# SILENCE REMOVAL
+# =======================
+class SpeechGate:
+    """
+    Streaming silence remover for mono audio: process() returns only the
+    speech in a chunk (plus PRE_ROLL_MS before each onset and the hangover
+    after it), delayed by at most one frame, in the input's dtype (float
+    or int16 PCM). After each call `started` / `ended` tell whether an
+    utterance began / finished in that chunk, and `runs` lists the
+    returned audio as contiguous (input sample index, length) pieces, so
+    pre-roll released late can still be traced to when it was captured.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, pre_roll_ms=PRE_ROLL_MS, vad=None):
+        self.vad = vad or Vad(sample_rate)
+        self.pre_roll = int(round(pre_roll_ms * sample_rate / 1000.0 / self.vad.frame_len))
+        self.reset()
+
+    def reset(self):
+        self.vad.reset()
+        fl = self.vad.frame_len
+        self._audio = np.zeros(0, dtype=np.float32)    # samples the VAD has not judged yet
+        self._tail = np.zeros((0, fl), dtype=np.float32)   # recent silent frames (pre-roll)
+        self.active = False
+        self.started = False
+        self.ended = False
+        self.runs = []
+        self.samples_in = 0
+        self.samples_out = 0
+        self._frames = 0    # frames judged so far
+
+    def process(self, x):
+        x = np.asarray(x).ravel()
+        if self._audio.dtype != x.dtype:
+            self._audio = self._audio.astype(x.dtype)
+            self._tail = self._tail.astype(x.dtype)
+        fl = self.vad.frame_len
+        decisions = self.vad.process(x)
+        self._audio = np.concatenate([self._audio, x])
+        n = len(decisions)
+        frames = self._audio[:n * fl].reshape(n, fl)
+        self._audio = self._audio[n * fl:]
+        self.samples_in += len(x)
+
+        prev = np.concatenate([[self.active], decisions[:-1]]) if n else decisions
+        self.started = bool(np.any(decisions & ~prev))
+        self.ended = bool(np.any(prev & ~decisions))
+        if n:
+            self.active = bool(decisions[-1])
+
+        # held-back silent frames can become pre-roll of an onset in this chunk
+        ext = np.concatenate([self._tail, frames])
+        keep = _widen_back(np.concatenate([np.zeros(len(self._tail), dtype=bool), decisions]),
+                           self.pre_roll)
+        kept = np.flatnonzero(keep)
+        start = kept[-1] + 1 if len(kept) else 0
+        first = self._frames - len(self._tail)     # input frame index of ext[0]
+        self._tail = ext[max(start, len(ext) - self.pre_roll):]
+        self._frames += n
+
+        breaks = np.flatnonzero(np.diff(kept) != 1) + 1
+        self.runs = [(int(first + run[0]) * fl, len(run) * fl) for run in np.split(kept, breaks) if len(run)]
+
+        out = ext[keep].ravel()
+        self.samples_out += len(out)
+        return out
+
+
+def speech_mask(x, sample_rate=SAMPLE_RATE, pad_ms=PRE_ROLL_MS):
+    """Per-sample speech mask of a whole mono signal, padded by `pad_ms` before onsets."""
+    x = np.asarray(x, dtype=np.float32).ravel()
+    vad = Vad(sample_rate)
+    decisions = vad.process(x)
+    decisions = _widen_back(decisions, int(round(pad_ms * sample_rate / 1000.0 / vad.frame_len)))
+    mask = np.zeros(len(x), dtype=bool)
+    mask[:len(decisions) * vad.frame_len] = np.repeat(decisions, vad.frame_len)
+    return mask
+
+
+def trim_silence(x, sample_rate=SAMPLE_RATE, pad_ms=PRE_ROLL_MS):
+    """The speech parts of a whole mono signal, joined; empty if there is none."""
+    x = np.asarray(x, dtype=np.float32).ravel()
+    return x[speech_mask(x, sample_rate, pad_ms)]
@@ -0,0 +1,331 @@
+"""
+Long-lived local Whisper service: load the model once, share it with every
+client over HTTP on localhost.
+
+Loading large-v3 takes tens of seconds and gigabytes of RAM, and every
+stt_tts_loop.py / test_ivrit_whisper.py run used to pay that again. The
+server loads a warm pool at startup (primed with one dummy transcription)
+and each request borrows a model from it.
+
+Endpoints:
+  POST /transcribe   body: float32 mono 16 kHz samples (application/octet-stream),
+                     a WAV file (audio/wav), or JSON {"path": "/abs/file.wav"}
+                     options as query string or JSON: language, beam_size,
+                     vad_filter, task
+  GET  /health       model, backend, pool size, busy slots, requests served
+
+Response: {"text", "segments": [{"start", "end", "text"}], "language",
+"duration_s", "queue_ms", "transcribe_ms"}. WhisperClient below is the
+matching client. At most WORKERS requests run and MAX_PENDING wait; past
+that the server answers 503 and WhisperClient retries with backoff.
+
+Usage:
+  python whisper_server.py                                    # faster-whisper, ivrit-ai large-v3
+  python whisper_server.py --backend openai --model base --workers 2
+"""
+
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# =======================
+# CONFIG
+# =======================
+HOST = "127.0.0.1"
+PORT = 8770
+URL = f"http://{HOST}:{PORT}"
+SAMPLE_RATE = 16000
+BACKEND = "faster"                          # "faster" (faster-whisper) or "openai" (openai-whisper)
+MODEL_NAME = "ivrit-ai/whisper-large-v3-ct2"
+DEVICE = "cpu"                              # or "cuda"
+COMPUTE_TYPE = "int8"                       # faster-whisper only
+WORKERS = 1                                 # concurrent transcriptions
+CPU_THREADS = 0                             # faster-whisper threads per worker (0 = library default)
+MAX_PENDING = 16                            # requests waiting for a worker before 503
+CLIENT_RETRIES = 5                          # WhisperClient: retries of a 503 (server busy)
+CLIENT_BACKOFF_S = 0.25                     # first retry delay, doubled per retry
+DEFAULT_OPTIONS = {"language": "he", "beam_size": 5, "vad_filter": True, "task": "transcribe"}
+
+
+# =======================
+# MODEL POOL
+# =======================
+class ModelPool:
+    """
+    `workers` warm transcribers. faster-whisper shares one set of weights
+    between workers (num_workers); openai-whisper models are not
+    thread-safe, so that backend loads one model per worker.
+    """
+
+    def __init__(self, backend=BACKEND, model_name=MODEL_NAME, workers=WORKERS,
+                 device=DEVICE, compute_type=COMPUTE_TYPE, cpu_threads=CPU_THREADS):
+        self.backend = backend
+        self.model_name = model_name
+        self.device = device
+        self.workers = workers
+        self.slots = queue.Queue()
+        self.waiting = 0
+        self.served = 0
+        self._lock = threading.Lock()
+
+        # backends are imported here, so clients (WhisperClient) never pull in torch / ctranslate2
+        t0 = time.monotonic()
+        if backend == "faster":
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError:
+                raise RuntimeError("faster-whisper is not installed (pip install faster-whisper)") from None
+            model = WhisperModel(model_name, device=device, compute_type=compute_type,
+                                 cpu_threads=cpu_threads, num_workers=workers)
+            models = [model] * workers
+        elif backend == "openai":
+            try:
+                import whisper
+            except ImportError:
+                raise RuntimeError("openai-whisper is not installed (pip install openai-whisper)") from None
+            models = [whisper.load_model(model_name, device=device) for _ in range(workers)]
+        else:
+            raise ValueError(f"unknown backend {backend!r}")
+        for model in models:
+            self.slots.put(model)
+        self.load_s = time.monotonic() - t0
+
+        # prime every worker (first-call allocations, kernel caches)
+        silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+        for _ in range(workers):
+            self.transcribe(silence, {"language": DEFAULT_OPTIONS["language"], "beam_size": 1})
+        self.served = 0
+
+    @property
+    def busy(self):
+        return self.workers - self.slots.qsize()
+
+    def transcribe(self, audio, options):
+        """`audio`: float32 mono 16 kHz array or a file path. Blocks until a worker is free."""
+        opts = dict(DEFAULT_OPTIONS, **options)
+        opts["language"] = opts["language"] or None     # "" / null = auto-detect
+        with self._lock:
+            if self.waiting >= MAX_PENDING:
+                raise OverflowError("too many pending requests")
+            self.waiting += 1
+        t0 = time.monotonic()
+        try:
+            model = self.slots.get()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        t1 = time.monotonic()
+        try:
+            result = self._run(model, audio, opts)
+        finally:
+            self.slots.put(model)
+        with self._lock:
+            self.served += 1
+        result["queue_ms"] = 1000.0 * (t1 - t0)
+        result["transcribe_ms"] = 1000.0 * (time.monotonic() - t1)
+        return result
+
+    def _run(self, model, audio, opts):
+        if self.backend == "faster":
+            segments, info = model.transcribe(
+                audio,
+                language=opts["language"],
+                beam_size=int(opts["beam_size"]),
+                task=opts["task"],
+                vad_filter=bool(opts["vad_filter"]),
+                vad_parameters=dict(min_silence_duration_ms=500),
+            )
+            segs = [{"start": s.start, "end": s.end, "text": s.text} for s in segments]
+            return {"text": "".join(s["text"] for s in segs).strip(), "segments": segs,
+                    "language": info.language, "language_probability": info.language_probability,
+                    "duration_s": info.duration}
+
+        result = model.transcribe(audio, language=opts["language"], beam_size=int(opts["beam_size"]),
+                                  task=opts["task"], fp16=self.device == "cuda")
+        segs = [{"start": s["start"], "end": s["end"], "text": s["text"]} for s in result.get("segments", [])]
+        return {"text": result.get("text", "").strip(), "segments": segs,
+                "language": result.get("language"), "duration_s": segs[-1]["end"] if segs else 0.0}
+
+
+# =======================
+# HTTP
+# =======================
+def wav_to_float32(data):
+    """PCM16 WAV bytes -> float32 mono at SAMPLE_RATE."""
+    with wave.open(io.BytesIO(data), "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError("only 16-bit PCM WAV is supported")
+        rate = wf.getframerate()
+        pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2").reshape(-1, wf.getnchannels())
+    audio = pcm.mean(axis=1, dtype=np.float32) / 32768.0
+    if rate != SAMPLE_RATE:
+        from live_voice_enhancer import Resampler
+        resampler = Resampler(rate, SAMPLE_RATE)
+        audio = np.concatenate([resampler.process(audio), resampler.flush()])
+    return audio
+
+
+def _option(value):
+    # query-string values arrive as text
+    if isinstance(value, str):
+        if value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        if value.isdigit():
+            return int(value)
+    return value
+
+
+def make_handler(pool):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urllib.parse.urlparse(self.path).path != "/health":
+                self._reply(404, {"error": "not found"})
+                return
+            self._reply(200, {"backend": pool.backend, "model": pool.model_name, "workers": pool.workers,
+                              "busy": pool.busy, "waiting": pool.waiting, "served": pool.served,
+                              "load_s": pool.load_s})
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != "/transcribe":
+                self._reply(404, {"error": "not found"})
+                return
+            # keep "language=" (auto-detect) instead of dropping it for the default
+            query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+            options = {k: _option(v[-1]) for k, v in query.items() if k in DEFAULT_OPTIONS}
+            try:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                kind = self.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
+                if kind == "application/json":
+                    request = json.loads(body)
+                    options.update({k: v for k, v in request.items() if k in DEFAULT_OPTIONS})
+                    audio = request["path"]
+                elif kind in ("audio/wav", "audio/x-wav", "audio/wave"):
+                    audio = wav_to_float32(body)
+                else:
+                    audio = np.frombuffer(body, dtype="<f4")
+                result = pool.transcribe(audio, options)
+            except OverflowError as e:
+                self._reply(503, {"error": str(e)})
+            except (ValueError, KeyError, wave.Error, FileNotFoundError) as e:
+                self._reply(400, {"error": f"bad request: {e}"})
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+            else:
+                self._reply(200, result)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def serve(pool, host=HOST, port=PORT):
+    server = ThreadingHTTPServer((host, port), make_handler(pool))
+    server.daemon_threads = True
+    print(f"Whisper server: {pool.backend} {pool.model_name}, {pool.workers} worker(s), "
+          f"loaded in {pool.load_s:.1f} s, listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# =======================
+# CLIENT
+# =======================
+class WhisperClient:
+    """Talks to a running whisper_server.py; all calls are blocking."""
+
+    def __init__(self, url=URL, timeout=600.0, retries=CLIENT_RETRIES, backoff_s=CLIENT_BACKOFF_S):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_s = backoff_s
+
+    def health(self, timeout=1.0):
+        with urllib.request.urlopen(self.url + "/health", timeout=timeout) as r:
+            return json.loads(r.read())
+
+    def available(self):
+        try:
+            self.health()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def model_name(self):
+        """Name of the model the server has loaded, or None when it is not running."""
+        try:
+            return self.health()["model"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def transcribe(self, audio=None, path=None, **options):
+        """
+        Transcribe a float32 mono 16 kHz array (`audio`) or a file the
+        server can read (`path`). Options: language (None = auto-detect),
+        beam_size, vad_filter, task. A busy server (503) is retried
+        `retries` times with exponential backoff.
+        """
+        options = {k: ("" if v is None else v) for k, v in options.items()}
+        if path is not None:
+            body = json.dumps(dict(options, path=str(path))).encode("utf-8")
+            kind, query = "application/json", ""
+        else:
+            body = np.ascontiguousarray(audio, dtype="<f4").tobytes()
+            kind, query = "application/octet-stream", "?" + urllib.parse.urlencode(options)
+        request = urllib.request.Request(self.url + "/transcribe" + query, data=body,
+                                         headers={"Content-Type": kind}, method="POST")
+        for attempt in range(self.retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                    return json.loads(r.read())
+            except urllib.error.HTTPError as e:
+                message = e.read().decode("utf-8", "replace")
+                if e.code != 503 or attempt == self.retries:
+                    raise RuntimeError(f"whisper server: {e.code} {message}") from None
+            time.sleep(self.backoff_s * 2 ** attempt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared local Whisper transcription server.")
+    parser.add_argument("--backend", choices=["faster", "openai"], default=BACKEND)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--device", default=DEVICE)
+    parser.add_argument("--compute-type", default=COMPUTE_TYPE)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help=f"concurrent transcriptions; up to {MAX_PENDING} more requests wait, "
+                             f"then the server answers 503 (WhisperClient retries with backoff)")
+    parser.add_argument("--cpu-threads", type=int, default=CPU_THREADS)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    print(f"Loading {args.model} ({args.backend})...")
+    pool = ModelPool(args.backend, args.model, args.workers, args.device, args.compute_type, args.cpu_threads)
+    serve(pool, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()